@@ -0,0 +1,12 @@
+'''
+Benchmarks of the audio and inference hot paths, runnable on a CPU-only box
+without an SDR or a Redis server (synthetic audio, in-memory transport):
+
+    python -m benchmarks.run                  # all, results to bench_results.json
+    python -m benchmarks.run --only mel classify --quick
+    python -m benchmarks.run --save-baseline  # store results as benchmarks/baseline.json
+
+Results are compared against the stored baseline (create it in the project
+environment, none is checked in yet); a metric worse by more than
+--tolerance is reported as a regression and the run exits non-zero.
+'''
@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+import soundfile as sf
+import torch
+from utils.constants import CHUNK_DURATION_S, HOP_SIZE, N_MELS, SAMPLE_RATE, WINDOW_SIZE, BATCH_MS
+from .common import BenchConfig, Metrics, benchmark, latency_ms, measure, synthetic_audio
+
+
+@benchmark("mel")
+def bench_mel(config: BenchConfig) -> Metrics:
+    """waveform_to_mel_spectrogram over 10 s windows, and the streaming mel per 100 ms batch."""
+    from utils.audio_utils import waveform_to_mel_spectrogram
+    from utils.streaming_mel import StreamingMelSpectrogram
+
+    waveform = torch.from_numpy(synthetic_audio(CHUNK_DURATION_S, SAMPLE_RATE)).unsqueeze(0)
+    times = measure(lambda: waveform_to_mel_spectrogram(waveform, SAMPLE_RATE, N_MELS, WINDOW_SIZE, HOP_SIZE),
+                    config.repeat)
+    metrics = latency_ms(times, "window_")
+    metrics["windows_per_s"] = len(times) / sum(times)
+    metrics["x_realtime"] = CHUNK_DURATION_S * metrics["windows_per_s"]
+
+    chunk_samples = int(SAMPLE_RATE * CHUNK_DURATION_S)
+    stream = StreamingMelSpectrogram(SAMPLE_RATE, N_MELS, WINDOW_SIZE, HOP_SIZE, chunk_samples, torch.device("cpu"))
+    batch = int(SAMPLE_RATE * BATCH_MS / 1000)
+    audio = synthetic_audio(CHUNK_DURATION_S * 2, SAMPLE_RATE)
+    batches = [audio[i:i + batch] for i in range(0, audio.size - batch + 1, batch)]
+    for b in batches[:len(batches) // 2]:
+        stream.push(b)
+    times = measure(lambda: [stream.push(b) for b in batches[len(batches) // 2:]], max(1, config.repeat // 4), 0)
+    pushed = len(batches) - len(batches) // 2
+    metrics["streaming_batch_ms"] = 1000 * sum(times) / (len(times) * pushed)
+    return metrics
+
+
+def write_chunks(data_dir: Path, per_class: int) -> None:
+    """per_class synthetic 10 s chunk wavs in data_dir/<label>/, the layout data_parser writes."""
+    for label, seed in (("song", 0), ("ad", 1)):
+        (data_dir / label).mkdir(parents=True, exist_ok=True)
+        for i in range(per_class):
+            audio = synthetic_audio(CHUNK_DURATION_S, SAMPLE_RATE, seed=100 * seed + i)
+            sf.write(data_dir / label / f"bench_{i:04d}.wav", audio, SAMPLE_RATE)
+
+
+@benchmark("dataset")
+def bench_dataset(config: BenchConfig) -> Metrics:
+    """AudioDataset items per second, decoding wavs and from a SpectrogramCache."""
+    from classifier.cnn_model import AudioDataset
+    from classifier.spectrogram_cache import SpectrogramCache
+
+    per_class = 4 if config.quick else 16
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = Path(tmp) / "chunks"
+        write_chunks(data_dir, per_class)
+
+        def read_all(dataset) -> None:
+            for i in range(len(dataset)):
+                dataset[i]
+
+        dataset = AudioDataset(data_dir)
+        times = measure(lambda: read_all(dataset), 2, 1)
+        metrics = {"wav_samples_per_s": len(dataset) / min(times)}
+
+        start = time.perf_counter()
+        cached = AudioDataset(data_dir, cache=SpectrogramCache(Path(tmp) / "cache"))
+        metrics["cache_build_samples_per_s"] = len(cached) / (time.perf_counter() - start)
+        times = measure(lambda: read_all(cached), 3, 1)
+        metrics["cached_samples_per_s"] = len(cached) / min(times)
+    return metrics
+
+
+@benchmark("parser")
+def bench_parser(config: BenchConfig) -> Metrics:
+    """data_parser.process_file on a synthetic 48 kHz recording, into a packed part."""
+    from classifier.data_parser import process_file
+
+    minutes = 1 if config.quick else 5
+    with tempfile.TemporaryDirectory() as tmp:
+        wav = Path(tmp) / "bench.wav"
+        sf.write(wav, synthetic_audio(60 * minutes, 48000), 48000, subtype="PCM_16")
+        labels = Path(tmp) / "bench.csv"
+        half = f"{minutes * 60 // 2 // 60:02d}:{minutes * 60 // 2 % 60:02d}"
+        labels.write_text(f"start,end,type\n00:00,{half},song\n{half},{minutes:02d}:00,ad\n")
+        packed = Path(tmp) / "packed"
+        packed.mkdir()
+        times = measure(lambda: process_file(wav, labels, packed_dir=packed), 2 if config.quick else 3, 1)
+        size_mb = wav.stat().st_size / 1e6
+    return {"file_mb_s": size_mb / min(times), "x_realtime": 60 * minutes / min(times)}
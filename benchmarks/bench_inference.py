@@ -0,0 +1,30 @@
+from __future__ import annotations
+
+import numpy as np
+from utils.constants import CHUNK_DURATION_S, SAMPLE_RATE
+from .common import BenchConfig, Metrics, benchmark, latency_ms, measure, synthetic_audio
+
+BATCH_SIZES = (1, 2, 4, 8, 16, 32, 64)
+
+
+@benchmark("classify")
+def bench_classify(config: BenchConfig) -> Metrics:
+    """Classifier.classify on a 10 s window, and predict_batch per batch size (CLASSIFIER_MODEL variant)."""
+    from classifier.cnn_classifier import Classifier
+    from utils.transport import MemoryTransport
+
+    classifier = Classifier(transport=MemoryTransport())
+    classifier.warm_up()
+    waveform = synthetic_audio(CHUNK_DURATION_S, SAMPLE_RATE)
+    metrics = latency_ms(measure(lambda: classifier.classify(waveform), config.repeat), "classify_")
+
+    mel = classifier.waveform_to_mel(waveform)
+    sizes = BATCH_SIZES[:4] if config.quick else BATCH_SIZES
+    for size in sizes:
+        batch = mel.unsqueeze(0).expand(size, -1, -1, -1).contiguous()
+        times = measure(lambda: classifier.predict_batch(batch), max(5, config.repeat // int(np.sqrt(size))))
+        metrics[f"batch{size}_p50_ms"] = latency_ms(times)["p50_ms"]
+        # Best run for throughput, it is the least disturbed by other load on the machine
+        metrics[f"batch{size}_windows_per_s"] = size / min(times)
+    classifier.executor.shutdown(wait=False)
+    return metrics
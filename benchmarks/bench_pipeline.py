@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import List
+from utils.constants import BATCH_MS, CHANNEL_CLASSIFIER, RAW_SAMPLE_RATE, station_id, stream_channel
+from utils.latency import latency
+from .common import BenchConfig, Metrics, benchmark, synthetic_audio
+
+# Two stations, as in wideband mode
+STATIONS = (101.1e6, 103.5e6)
+# Windows are due often enough to keep the model busy at 10x
+STRIDE_S = 0.5
+RATES = (1, 10)
+
+
+async def run_pipeline(speed: int, seconds: float) -> Metrics:
+    """
+    Feed `seconds` of synthetic 48 kHz audio per station through
+    WidebandStreamer.frames -> MemoryTransport -> BatchClassifier at `speed`
+    times real time, after one unpaced window to fill the classifier's buffers.
+    """
+    from classifier.batch_classifier import BatchClassifier
+    from receiver.wideband_streamer import WidebandStreamer
+    from utils.transport import MemoryTransport
+
+    transport = MemoryTransport()
+    streamer = WidebandStreamer(list(STATIONS), gain=0.0, transport=transport, resample_stage="streamer")
+    classifier = BatchClassifier([station_id(f) for f in STATIONS], transport=transport, stride_s=STRIDE_S)
+    results = await transport.subscribe(*(stream_channel(CHANNEL_CLASSIFIER, station_id(f)) for f in STATIONS))
+    classifier_task = asyncio.create_task(classifier.run())
+    while classifier.subscription is None:
+        await asyncio.sleep(0.01)
+
+    block = int(RAW_SAMPLE_RATE * BATCH_MS / 1000)
+    audio = {f: synthetic_audio(seconds + 10, RAW_SAMPLE_RATE, seed=i) for i, f in enumerate(STATIONS)}
+    channels = {f: streamer.station_channels[f] for f in STATIONS}
+
+    def feed(i: int) -> None:
+        capture_ns = time.time_ns()
+        for f in STATIONS:
+            batch = audio[f][i * block:(i + 1) * block]
+            for channel, frame in streamer.frames(channels[f], streamer.resample(channels[f], batch), capture_ns):
+                streamer.publisher.submit(channel, frame)
+
+    received: List[float] = []
+
+    async def count_results() -> None:
+        async for _ in results:
+            received.append(time.perf_counter())
+
+    counter = asyncio.create_task(count_results())
+    warm_blocks = int(10 * 1000 / BATCH_MS)
+    for i in range(warm_blocks):
+        feed(i)
+        await asyncio.sleep(0)
+    await asyncio.sleep(0.5)
+    with latency.lock:
+        latency.histograms.clear()
+
+    interval = BATCH_MS / 1000 / speed
+    blocks = int(seconds * 1000 / BATCH_MS)
+    start = time.perf_counter()
+    for i in range(blocks):
+        feed(warm_blocks + i)
+        # Paced against the start, so a slow iteration is caught up instead of stretching the run
+        delay = start + (i + 1) * interval - time.perf_counter()
+        await asyncio.sleep(max(0.0, delay))
+    fed_s = time.perf_counter() - start
+    await asyncio.sleep(max(0.5, 2 * classifier.max_wait_s))
+    classifier_task.cancel()
+    counter.cancel()
+    await asyncio.gather(classifier_task, counter, return_exceptions=True)
+    await streamer.publisher.close()
+    await transport.close()
+
+    done = [t for t in received if t >= start]
+    expected = len(STATIONS) * seconds / STRIDE_S
+    inference = latency.histograms.get("inference")
+    return {
+        "achieved_x_realtime": seconds / fed_s,
+        "windows_per_s": len(done) / fed_s,
+        "window_share": min(1.0, len(done) / expected),
+        "lost_frames": float(classifier.tracker.lost),
+        "inference_p50_ms": 1000 * inference.quantile(0.5) if inference else 0.0,
+        "inference_p95_ms": 1000 * inference.quantile(0.95) if inference else 0.0,
+    }
+
+
+@benchmark("pipeline")
+def bench_pipeline(config: BenchConfig) -> Metrics:
+    """Streamer -> classifier batching loop over the memory transport at 1x and 10x real time."""
+    seconds = 3.0 if config.quick else 10.0
+    metrics: Metrics = {}
+    for speed in RATES:
+        # 10x gets ten times the audio in the same wall time
+        result = asyncio.run(run_pipeline(speed, seconds * (speed if speed > 1 else 1)))
+        metrics.update({f"{speed}x_{k}": v for k, v in result.items()})
+    return metrics
@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List
+import numpy as np
+
+# Metric names say which way is better, see direction()
+Metrics = Dict[str, float]
+BENCHMARKS: Dict[str, Callable[["BenchConfig"], Metrics]] = {}
+
+
+@dataclass
+class BenchConfig:
+    """
+    Args:
+        quick: Fewer repetitions and shorter runs (smoke test, noisier numbers)
+        repeat: Timed calls per measurement
+    """
+    quick: bool = False
+    repeat: int = 20
+
+
+def benchmark(name: str) -> Callable:
+    """Register a benchmark function under name."""
+    def register(fn: Callable[[BenchConfig], Metrics]) -> Callable[[BenchConfig], Metrics]:
+        BENCHMARKS[name] = fn
+        return fn
+    return register
+
+
+def measure(fn: Callable[[], object], repeat: int, warmup: int = 2) -> List[float]:
+    """Seconds taken by each of `repeat` calls of fn, after `warmup` untimed calls."""
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def latency_ms(times: List[float], prefix: str = "") -> Metrics:
+    """p50/p95 of call times in ms."""
+    ms = 1000 * np.asarray(times)
+    return {f"{prefix}p50_ms": float(np.percentile(ms, 50)), f"{prefix}p95_ms": float(np.percentile(ms, 95))}
+
+
+def synthetic_audio(seconds: float, sample_rate: int, seed: int = 0) -> np.ndarray:
+    """float32 mix of a few tones and noise, loud enough to look like broadcast audio."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    tones = sum(0.2 * np.sin(2 * np.pi * f * t) for f in rng.uniform(100, 4000, size=4))
+    return (tones + 0.05 * rng.standard_normal(t.size)).astype(np.float32)
+
+
+def direction(metric: str) -> int:
+    """
+    +1 if higher is better, -1 if lower is better, 0 for informational metrics.
+    Tail latencies (p95) are reported but not compared, they swing too much between runs.
+    """
+    if "p95" in metric:
+        return 0
+    if metric.endswith(("_per_s", "_mb_s", "x_realtime")):
+        return 1
+    if metric.endswith("_ms"):
+        return -1
+    return 0
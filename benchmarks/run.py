@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+from . import bench_audio, bench_inference, bench_pipeline  # noqa: F401  register the benchmarks
+from .common import BENCHMARKS, BenchConfig, Metrics, direction
+
+BASELINE_PATH = Path(__file__).resolve().parent / "baseline.json"
+
+
+def machine() -> Dict[str, object]:
+    """What the numbers were measured on; results from different machines are not comparable."""
+    import numpy as np
+    import torch
+    from utils.config import CLASSIFIER_MODEL
+    return {
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpus": os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "torch": torch.__version__,
+        "torch_threads": torch.get_num_threads(),
+        "model": CLASSIFIER_MODEL,
+    }
+
+
+def run(names: Sequence[str], config: BenchConfig) -> Dict[str, object]:
+    """Run the named benchmarks; one that fails is recorded with its error and the rest still run."""
+    results: Dict[str, Metrics] = {}
+    errors: Dict[str, str] = {}
+    for name in names:
+        print(f"[Bench] {name}...")
+        start = time.perf_counter()
+        try:
+            results[name] = BENCHMARKS[name](config)
+        except Exception as e:
+            errors[name] = f"{type(e).__name__}: {str(e).splitlines()[0] if str(e) else ''}"
+            print(f"[Bench] {name} failed: {errors[name]}")
+            continue
+        print(f"[Bench] {name} done in {time.perf_counter() - start:.1f} s")
+    return {"machine": machine(), "quick": config.quick, "results": results, "errors": errors}
+
+
+def compare(current: Dict[str, Metrics], baseline: Dict[str, Metrics], tolerance: float) -> List[str]:
+    """
+    Metrics worse than the baseline by more than tolerance (a fraction), and
+    baseline metrics of the benchmarks that ran which this run did not produce.
+    Returns:
+        One line per regression or missing metric, every compared metric is printed
+    """
+    regressions = []
+    for name, metrics in current.items():
+        for metric, value in metrics.items():
+            base: Optional[float] = baseline.get(name, {}).get(metric)
+            sign = direction(metric)
+            if base is None or sign == 0 or base <= 0:
+                continue
+            change = (value - base) / base
+            regressed = -sign * change > tolerance
+            print(f"  {name}.{metric}: {value:.3f} (baseline {base:.3f}, {change:+.1%}){'  REGRESSION' if regressed else ''}")
+            if regressed:
+                regressions.append(f"{name}.{metric} {value:.3f} vs {base:.3f} ({change:+.1%})")
+    for name, metrics in current.items():
+        for metric in baseline.get(name, {}):
+            if metric not in metrics:
+                print(f"  {name}.{metric}: missing (baseline {baseline[name][metric]:.3f})  MISSING")
+                regressions.append(f"{name}.{metric} missing from this run")
+    return regressions
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the audio and inference hot paths")
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), default=list(BENCHMARKS),
+                        help="Benchmarks to run (default: all)")
+    parser.add_argument("--quick", action="store_true", help="Short runs, for a smoke test rather than numbers")
+    parser.add_argument("--repeat", type=int, default=20, help="Timed calls per latency measurement")
+    parser.add_argument("--output", type=Path, default=Path("bench_results.json"), help="Results JSON")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH, help="Baseline JSON to compare with")
+    parser.add_argument("--save-baseline", action="store_true", help="Write the results to --baseline instead")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Relative slowdown of a metric counted as a regression")
+    args = parser.parse_args(argv)
+
+    report = run(args.only, BenchConfig(quick=args.quick, repeat=args.repeat))
+    args.output.write_text(json.dumps(report, indent=2) + "\n")
+    print(f"[Bench] Results written to {args.output}")
+
+    # A benchmark that crashes fails the run, whatever the comparison says
+    failed = 1 if report["errors"] else 0
+    if failed:
+        print(f"[Bench] {len(report['errors'])} benchmark(s) failed:")
+        for name, error in report["errors"].items():
+            print(f"  {name}: {error}")
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(report, indent=2) + "\n")
+        print(f"[Bench] Baseline written to {args.baseline}")
+        return failed
+    if not args.baseline.exists():
+        print(f"[Bench] No baseline at {args.baseline}, run with --save-baseline to create one")
+        return failed
+
+    baseline = json.loads(args.baseline.read_text())
+    if baseline.get("machine") != report["machine"]:
+        print("[Bench] Baseline was measured on a different machine or setup, expect differences:")
+        for key, value in report["machine"].items():
+            if baseline.get("machine", {}).get(key) != value:
+                print(f"  {key}: {baseline.get('machine', {}).get(key)} -> {value}")
+    if baseline.get("quick") != report["quick"]:
+        print("[Bench] Baseline and this run differ in --quick, numbers are not comparable")
+    print(f"[Bench] Compared with {args.baseline} (tolerance {args.tolerance:.0%}):")
+    regressions = compare(report["results"], baseline.get("results", {}), args.tolerance)
+    if regressions:
+        print(f"[Bench] {len(regressions)} regression(s):")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    if failed:
+        print("[Bench] No regressions in the benchmarks that ran, but some failed")
+        return 1
+    print("[Bench] No regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
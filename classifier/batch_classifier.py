@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+import torch
+from utils.constants import INVERSE_LABELS, stream_channel
+from utils.config import CLASSIFIER_MAX_BATCH, CLASSIFIER_MAX_WAIT_MS
+from utils.audio_frame import decode_frame
+from utils.latency import latency
+from .cnn_classifier import Classifier, Window, WindowAccumulator
+
+class BatchClassifier(Classifier):
+    """
+    Classifies several audio streams with one model.
+
+    Stream `id` is read from `<audio_channel>:<id>` and its results are published
+    to `<classifier_channel>:<id>`. Windows that become due are collected until
+    max_batch are pending or the oldest has waited max_wait_s, then classified in
+    one forward pass. A stream that produces a newer window before its previous
+    one was classified replaces it, so a batch holds at most one window per stream.
+    The forward pass runs on the inherited inference thread. With the streams
+    transport, instances sharing a consumer group must be given disjoint streams.
+
+    Args:
+        stream_ids: Streams to subscribe to
+        max_batch: Largest forward pass
+        max_wait_s: Longest a due window waits for others to join its batch
+        **kwargs: Passed to Classifier
+    """
+    def __init__(
+        self,
+        stream_ids: Sequence[str],
+        max_batch: int = CLASSIFIER_MAX_BATCH,
+        max_wait_s: float = CLASSIFIER_MAX_WAIT_MS / 1000,
+        **kwargs,
+    ) -> None:
+        super().__init__(**kwargs)
+        self.stream_ids = list(stream_ids)
+        self.max_batch = max(1, max_batch)
+        self.max_wait_s = max_wait_s
+        self.channels: Dict[str, str] = {stream_channel(self.audio_channel, sid): sid for sid in self.stream_ids}
+        self.accumulators: Dict[str, WindowAccumulator] = {
+            sid: WindowAccumulator(self.mel, self.stride_s, self.streaming_mel) for sid in self.stream_ids
+        }
+        self.pending: Dict[str, Window] = {}
+        self.pending_since: Optional[float] = None
+        self.wakeup = asyncio.Event()
+
+    async def connect(self) -> None:
+        """Subscribe to every stream's audio channel."""
+        self.subscription = await self.transport.subscribe(*self.channels, group=self.group, consumer=self.consumer)
+        print(f"[BatchClassifier] Subscribed to {len(self.channels)} audio channels ({self.transport.name})")
+
+    async def run(self) -> None:
+        """Route batches to their stream's window and classify due windows in batch_loop."""
+        await self.prepare()
+        await self.connect()
+        await self.run_loops(self.receive_loop(), self.batch_loop())
+
+    async def receive_loop(self) -> None:
+        """Route batches to their stream's window and queue due windows for batch_loop."""
+        assert self.subscription is not None
+        loop = asyncio.get_running_loop()
+        async for message in self.subscription:
+            sid = self.channels.get(message.channel)
+            if sid is None:
+                continue
+
+            frame = decode_frame(message.data)
+            self.check_gap(message.channel, frame)
+            latency.record_since("receive", frame.capture_ns)
+            window = self.accumulators[sid].push(frame.float32(), frame.sample_rate, frame.capture_ns, frame.station)
+            if window is not None:
+                if not self.pending:
+                    self.pending_since = loop.time()
+                self.pending[sid] = window
+                self.wakeup.set()
+
+    async def batch_loop(self) -> None:
+        """Flush pending windows when the batch is full or the oldest one's deadline passes."""
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            if not self.pending:
+                continue
+            while len(self.pending) < self.max_batch:
+                assert self.pending_since is not None
+                remaining = self.pending_since + self.max_wait_s - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                self.wakeup.clear()
+
+            items = list(self.pending.items())[:self.max_batch]
+            for sid, _ in items:
+                del self.pending[sid]
+            # Leftovers go straight into the next batch
+            self.pending_since = loop.time() if self.pending else None
+            if self.pending:
+                self.wakeup.set()
+            # The forward pass runs on the inference thread, the loop keeps routing audio
+            start = time.perf_counter()
+            probs = await loop.run_in_executor(self.executor, self.classify_windows, items)
+            self.record_inference(time.perf_counter() - start)
+            await self.publish_results(items, probs)
+
+    def warm_up_sizes(self) -> Tuple[int, ...]:
+        # Single stragglers and a batch of every stream are the shapes seen in practice
+        return tuple(sorted({1, min(len(self.stream_ids), self.max_batch)}))
+
+    def classify_windows(self, items: List[Tuple[str, Window]]) -> np.ndarray:
+        """One forward pass over [B, 1, n_mels, frames], returns [B, n_classes] probabilities."""
+        mels = torch.stack([window.spectrogram(self.mel) for _, window in items])
+        for _, window in items:
+            latency.record_since("mel", window.capture_ns)
+        probs = self.predict_batch(mels)
+        for _, window in items:
+            latency.record_since("inference", window.capture_ns)
+        return probs
+
+    async def publish_results(self, items: List[Tuple[str, Window]], probs: np.ndarray) -> None:
+        """Publish each stream's result on its own channel, coalesced into one round trip."""
+        for (sid, window), p in zip(items, probs):
+            label = INVERSE_LABELS[int(np.argmax(p))]
+            payload = json.dumps({"stream": sid, "label": label, "probs": p.tolist(), "capture_ns": window.capture_ns})
+            self.publisher.submit(stream_channel(self.classifier_channel, sid), payload)
+        print(f"[BatchClassifier] Classified {len(items)} streams in one batch")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Micro-batched classifier for several audio streams")
+    parser.add_argument("--streams", type=str, required=True, help="Comma separated stream ids")
+    parser.add_argument("--max-batch", type=int, default=CLASSIFIER_MAX_BATCH)
+    parser.add_argument("--max-wait-ms", type=float, default=CLASSIFIER_MAX_WAIT_MS)
+    args = parser.parse_args()
+
+    classifier = BatchClassifier(
+        [s.strip() for s in args.streams.split(",") if s.strip()],
+        max_batch=args.max_batch,
+        max_wait_s=args.max_wait_ms / 1000,
+    )
+    asyncio.run(classifier.run())
+
+
+if __name__ == "__main__":
+    main()
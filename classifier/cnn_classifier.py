@@ -2,34 +2,169 @@ from __future__ import annotations
 
 import asyncio
 import json
-from typing import Optional, Tuple
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Coroutine, Optional, Tuple
 import numpy as np
-import redis.asyncio as aioredis
 import torch
 from utils.constants import (
     CHUNK_DURATION_S,
     HOP_SIZE,
     INVERSE_LABELS,
     N_MELS,
+    N_FRAMES,
     SAMPLE_RATE,
     WINDOW_SIZE,
     CHANNEL_AUDIO,
     CHANNEL_CLASSIFIER,
-    MODEL_PATH
 )
-from utils.config import REDIS_URL
+from utils.config import (
+    REDIS_URL,
+    CLASSIFIER_GROUP,
+    CLASSIFY_STRIDE_S,
+    CLASSIFIER_STREAMING_MEL,
+    CLASSIFIER_QUEUE_SIZE,
+    CLASSIFIER_TORCH_THREADS,
+    CLASSIFIER_MODEL,
+)
 from utils.audio_utils import (
+    MelExtractor,
     ensure_tensor,
     mono,
+    get_mel_extractor,
     normalize_duration,
-    waveform_to_mel_spectrogram,
 )
-from .cnn_model import AudioCNN
+from utils.audio_frame import AudioFrame, SequenceTracker, decode_frame
+from utils.resampler import PolyphaseResampler
+from utils.latency import latency
+from utils.queues import DropOldestQueue
+from utils.ring_buffer import RingBuffer
+from utils.streaming_mel import StreamingMelSpectrogram
+from utils.transport import Publisher, Subscription, Transport, make_transport
+from .cnn_model import CPU_VARIANTS, load_model
+
+@dataclass
+class Window:
+    """
+    A 10s window that is due for classification.
+    Holds the finished spectrogram (streaming mel) or a copy of the samples,
+    whose spectrogram is then computed off the event loop by spectrogram().
+    """
+    mel: Optional[torch.Tensor] = None
+    waveform: Optional[np.ndarray] = None
+    # Capture time of the newest audio in the window (unix ns, 0 if unknown)
+    capture_ns: int = 0
+    # Station the audio came from (Hz, 0 if unknown)
+    station: float = 0.0
+
+    def spectrogram(self, mel: MelExtractor) -> torch.Tensor:
+        """[1, n_mels, frames] on the extractor's device."""
+        if self.mel is not None:
+            return self.mel
+        return waveform_to_mel(mel, self.waveform)
+
+
+class WindowAccumulator:
+    """
+    Sliding 10s window over one audio stream.
+    Resamples incoming batches to SAMPLE_RATE, buffers them and hands back the
+    window's mel spectrogram once per stride. The window starts over when the
+    frames' station changes, so no window mixes audio from before a retune.
+
+    Args:
+        mel: Shared mel front end (also decides the device)
+        stride_s: Seconds of new audio between windows
+        streaming_mel: Update the spectrogram incrementally instead of from a ring buffer
+    """
+    def __init__(self, mel: MelExtractor, stride_s: float = CLASSIFY_STRIDE_S,
+                 streaming_mel: bool = CLASSIFIER_STREAMING_MEL) -> None:
+        self.mel = mel
+        self.chunk_samples = int(SAMPLE_RATE * CHUNK_DURATION_S)
+        self.stride_samples = max(1, int(SAMPLE_RATE * stride_s))
+        self.samples_since_classify = 0
+        # Station of the buffered audio, 0 until a frame names one
+        self.station = 0.0
+        # Created on demand if the streamer publishes at another rate (RESAMPLE_STAGE=classifier)
+        self.resampler: Optional[PolyphaseResampler] = None
+        # Preallocated sliding window: batches are written in place and the
+        # window is copied out oldest-first only when it is time to classify.
+        self.buffer = RingBuffer(self.chunk_samples)
+        self.window = np.zeros(self.chunk_samples, dtype=np.float32)
+        # Incremental spectrogram of the same window, only new frames are computed per batch
+        self.stream_mel: Optional[StreamingMelSpectrogram] = None
+        if streaming_mel:
+            self.stream_mel = StreamingMelSpectrogram(
+                SAMPLE_RATE, N_MELS, WINDOW_SIZE, HOP_SIZE, self.chunk_samples, mel.device
+            )
+
+    def resample(self, batch: np.ndarray, sample_rate: int) -> np.ndarray:
+        """Bring a batch to SAMPLE_RATE, keeping filter state across batches."""
+        if sample_rate == SAMPLE_RATE:
+            return batch
+        if self.resampler is None or self.resampler.orig_sr != sample_rate:
+            self.resampler = PolyphaseResampler(sample_rate, SAMPLE_RATE)
+            print(f"[Classifier] Resampling audio {sample_rate} Hz -> {SAMPLE_RATE} Hz")
+        return self.resampler.process(batch)
+
+    def reset(self) -> None:
+        """Drop the buffered audio, the next window needs a full 10 s again."""
+        self.samples_since_classify = 0
+        self.buffer.clear()
+        if self.stream_mel is not None:
+            self.stream_mel.reset()
+        if self.resampler is not None:
+            self.resampler.reset()
+
+    def push(
+        self, batch: np.ndarray, sample_rate: int = SAMPLE_RATE, capture_ns: int = 0, station: float = 0.0,
+    ) -> Optional[Window]:
+        """
+        Add a batch (captured at capture_ns from station) to the sliding window.
+        Returns the latest 10 s once a full window is available and a stride
+        has passed since the last one, else None. Cheap enough for the event loop.
+        """
+        if station and self.station and abs(station - self.station) > 1.0:
+            print(f"[Classifier] Station changed to {station/1e6:.3f} MHz, starting a new window")
+            self.reset()
+        self.station = station or self.station
+        batch = self.resample(batch, sample_rate)
+        self.samples_since_classify += batch.size
+        if self.stream_mel is not None:
+            self.stream_mel.push(batch)
+            ready = self.stream_mel.ready
+        else:
+            self.buffer.write(batch)
+            ready = self.buffer.full
+        if not ready or self.samples_since_classify < self.stride_samples:
+            return None
+
+        self.samples_since_classify = 0
+        if self.stream_mel is not None:
+            return Window(mel=self.stream_mel.spectrogram, capture_ns=capture_ns, station=self.station)
+        return Window(waveform=self.buffer.read_into(self.window).copy(), capture_ns=capture_ns, station=self.station)
+
+
+def waveform_to_mel(mel: MelExtractor, waveform) -> torch.Tensor:
+    """1D numpy waveform -> [1, n_mels, frames] on the extractor's device."""
+    waveform = ensure_tensor(waveform)
+    waveform = mono(waveform)
+    waveform = normalize_duration(waveform, SAMPLE_RATE, CHUNK_DURATION_S)
+    return mel(waveform)
+
 
 class Classifier:
     """
-    Pulls small waveform batches from an redis broadcast, runs classification
-    over 10s windows, and publishes classifiation.
+    Pulls small waveform batches from the transport (redis broadcast by default), runs
+    classification over a sliding 10s window every `stride_s` seconds, and publishes classifiation.
+
+    Receiving and buffering stay on the event loop. Due windows go through a
+    bounded drop-oldest queue to a single inference thread, so a slow model
+    pass never delays other tasks on the loop (streamer, FSM) and a backlog
+    only ever costs stale windows.
+
+    A forward pass on a silent window runs before subscribing, so the first
+    real window does not pay for first-call allocation and kernel selection.
     """
     def __init__(
         self,
@@ -37,76 +172,189 @@ class Classifier:
         audio_channel: str = CHANNEL_AUDIO,
         classifier_channel: str = CHANNEL_CLASSIFIER,
         device: Optional[torch.device] = None,
+        stride_s: float = CLASSIFY_STRIDE_S,
+        streaming_mel: bool = CLASSIFIER_STREAMING_MEL,
+        queue_size: int = CLASSIFIER_QUEUE_SIZE,
+        transport: Optional[Transport] = None,
+        group: str = CLASSIFIER_GROUP,
+        consumer: Optional[str] = None,
+        model_variant: str = CLASSIFIER_MODEL,
     ) -> None:
+        started = time.perf_counter()
         self.redis_url = redis_url
         self.audio_channel = audio_channel
         self.classifier_channel = classifier_channel
-        self.redis: Optional[aioredis.Redis] = None
-        self.pubsub: Optional[aioredis.client.PubSub] = None
-        self.buffer = np.zeros(0, dtype=np.float32)
-        self.chunk_samples = int(SAMPLE_RATE * CHUNK_DURATION_S)
+        # A transport passed in is shared with other components and closed by its owner
+        self.owns_transport = transport is None
+        self.transport: Transport = transport or make_transport(redis_url=redis_url)
+        self.publisher = Publisher(self.transport, type(self).__name__)
+        self.group = group
+        # Stable name within the group, so a restarted worker rereads what it had not acknowledged
+        self.consumer = consumer
+        self.subscription: Optional[Subscription] = None
+        self.stride_s = stride_s
+        self.streaming_mel = streaming_mel
         self.device = device or torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        self.model = AudioCNN()
-        if MODEL_PATH.exists():
-            self.model.load_state_dict(torch.load(MODEL_PATH, map_location=self.device))
-            print(f"[Classifier] Loaded model weights from {MODEL_PATH}")
-        else:
-            print(f"[Classifier] WARNING: No model file found at {MODEL_PATH}, using random weights")
-        self.model.to(self.device)
-        self.model.eval()
+        if model_variant in CPU_VARIANTS:
+            self.device = torch.device("cpu")
+        self.mel = get_mel_extractor(SAMPLE_RATE, N_MELS, WINDOW_SIZE, HOP_SIZE, self.device)
+        self.accumulator = WindowAccumulator(self.mel, stride_s, streaming_mel)
+        self.queue: DropOldestQueue = DropOldestQueue(queue_size)
+        self.tracker = SequenceTracker()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+        if CLASSIFIER_TORCH_THREADS > 0:
+            torch.set_num_threads(CLASSIFIER_TORCH_THREADS)
+        self.model_variant = model_variant
+        self.model = load_model(model_variant, self.device)
+        self.load_s = time.perf_counter() - started
+        self.first_inference_s: Optional[float] = None
         print("[Classifier] Model ready…")
 
+    async def prepare(self) -> None:
+        """Warm the model up on the inference thread and report startup time."""
+        warm_s = await asyncio.get_running_loop().run_in_executor(self.executor, self.warm_up)
+        print(f"[{type(self).__name__}] Ready in {self.load_s + warm_s:.2f} s "
+              f"(setup {self.load_s:.2f} s, warm-up {1000 * warm_s:.0f} ms, {self.model_variant} on {self.device})")
+
+    def warm_up(self) -> float:
+        """
+        Mel + forward pass over a silent window for every batch size warm_up_sizes() returns.
+        Returns:
+            Seconds taken
+        """
+        start = time.perf_counter()
+        mel = self.waveform_to_mel(np.zeros(int(SAMPLE_RATE * CHUNK_DURATION_S), dtype=np.float32))
+        assert mel.shape[-2:] == (N_MELS, N_FRAMES), f"Unexpected spectrogram shape {tuple(mel.shape)}"
+        for batch in self.warm_up_sizes():
+            self.predict_batch(mel.unsqueeze(0).expand(batch, -1, -1, -1))
+        return time.perf_counter() - start
+
+    def warm_up_sizes(self) -> Tuple[int, ...]:
+        return (1,)
+
+    def record_inference(self, seconds: float) -> None:
+        """Report how long the first real inference took."""
+        if self.first_inference_s is None:
+            self.first_inference_s = seconds
+            print(f"[{type(self).__name__}] First inference took {1000 * seconds:.1f} ms")
+
     async def connect(self) -> None:
-        """Connect to Redis and subscribe to the audio channel."""
-        self.redis = aioredis.from_url(self.redis_url)
-        self.pubsub = self.redis.pubsub()
-        await self.pubsub.subscribe(self.audio_channel)
-        print(f"[Classifier] Subscribed to channel '{self.audio_channel}'")
+        """Subscribe to the audio channel."""
+        self.subscription = await self.transport.subscribe(self.audio_channel, group=self.group, consumer=self.consumer)
+        print(f"[Classifier] Subscribed to channel '{self.audio_channel}' ({self.transport.name})")
 
     async def run(self) -> None:
-        """Consume float32 batches and classify on full 10 s buffers."""
+        """Consume float32 batches and classify the latest 10 s once per stride."""
+        await self.prepare()
         await self.connect()
-        assert self.pubsub is not None
+        await self.run_loops(self.receive_loop(), self.inference_loop())
+
+    async def run_loops(self, *loops: Coroutine) -> None:
+        """
+        Run the receive and inference loops until the subscription ends or one
+        of them fails, then stop the other and disconnect. A failure is re-raised,
+        so a dead inference loop ends the process instead of silently dropping windows.
+        """
+        tasks = [asyncio.create_task(c) for c in loops]
         try:
-            async for message in self.pubsub.listen():
-                if message["type"] != "message":
-                    continue
-
-                batch = np.frombuffer(message["data"], dtype=np.float32)
-                self.buffer = np.concatenate((self.buffer, batch))
-
-                # Keep only the most recent 10 s
-                if self.buffer.size > self.chunk_samples:
-                    self.buffer = self.buffer[-self.chunk_samples :]
-
-                if self.buffer.size == self.chunk_samples:
-                    pred, probs = self.classify(self.buffer)
-                    label = INVERSE_LABELS[pred]
-                    print(f"[Classifier] {label} (p={probs})")
-                    payload = json.dumps({"label": label, "probs": probs.tolist()})
-                    assert self.redis is not None
-                    await self.redis.publish(self.classifier_channel, payload)
-                    self.buffer = np.zeros(0, dtype=np.float32)
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    print(f"[{type(self).__name__}] {task.get_coro().__name__} failed: {task.exception()!r}")
+                    raise task.exception()
         except asyncio.CancelledError:
-            print("[Classifier] Stopping classifier…")
+            print(f"[{type(self).__name__}] Stopping classifier…")
         finally:
-            if self.pubsub is not None:
-                await self.pubsub.unsubscribe(self.audio_channel)
-            if self.redis is not None:
-                await self.redis.close()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.executor.shutdown(wait=False)
+            await self.disconnect()
+
+    async def receive_loop(self) -> None:
+        """Push received audio into the sliding window and queue due windows for inference."""
+        assert self.subscription is not None
+        async for message in self.subscription:
+            frame = decode_frame(message.data)
+            self.check_gap(self.audio_channel, frame)
+            latency.record_since("receive", frame.capture_ns)
+            window = self.accumulator.push(frame.float32(), frame.sample_rate, frame.capture_ns, frame.station)
+            if window is not None and self.queue.put_drop_oldest(window):
+                print(f"[Classifier] Inference behind, dropped stale window ({self.queue.dropped} total)")
+
+    async def disconnect(self) -> None:
+        await self.publisher.close()
+        print(f"[Classifier] {self.publisher.summary()}")
+        if self.subscription is not None:
+            await self.subscription.close()
+        if self.owns_transport:
+            await self.transport.close()
+
+
+    def check_gap(self, channel: str, frame: AudioFrame) -> None:
+        """Report frames lost (e.g. pub/sub overflow) before this one."""
+        lost = self.tracker.update(channel, frame)
+        if lost:
+            print(f"[Classifier] Lost {lost} audio frames on '{channel}' "
+                  f"({self.tracker.lost} total, {self.tracker.loss_rate:.1%})")
+
+    async def inference_loop(self) -> None:
+        """Classify queued windows on the inference thread and publish the results."""
+        loop = asyncio.get_running_loop()
+        while True:
+            window = await self.queue.get()
+            start = time.perf_counter()
+            pred, probs = await loop.run_in_executor(self.executor, self.infer, window)
+            self.record_inference(time.perf_counter() - start)
+            label = INVERSE_LABELS[pred]
+            print(f"[Classifier] {label} (p={probs})")
+            # The capture time travels on so the FSM and streamer can time their stages,
+            # the station lets the FSM skip labels of audio from before a retune
+            payload = json.dumps({
+                "label": label, "probs": probs.tolist(), "capture_ns": window.capture_ns, "station": window.station,
+            })
+            self.publisher.submit(self.classifier_channel, payload)
 
+    def infer(self, window: Window):
+        """Spectrogram (if still needed) + model pass, runs on the inference thread."""
+        mel = window.spectrogram(self.mel)
+        latency.record_since("mel", window.capture_ns)
+        result = self.predict(mel)
+        latency.record_since("inference", window.capture_ns)
+        return result
+
+    def accumulate(self, batch: np.ndarray) -> Optional[torch.Tensor]:
+        """
+        Add a SAMPLE_RATE batch to the sliding window, see WindowAccumulator.push.
+        Returns the due window's [1, n_mels, frames] spectrogram, else None.
+        """
+        window = self.accumulator.push(batch)
+        return window.spectrogram(self.mel) if window is not None else None
+
+    def waveform_to_mel(self, waveform) -> torch.Tensor:
+        """1D numpy waveform -> [1, n_mels, frames] on self.device."""
+        return waveform_to_mel(self.mel, waveform)
 
     def classify(self, waveform):
         """
         Run model inference on a 1D numpy waveform.
         """
-        waveform = ensure_tensor(waveform)
-        waveform = mono(waveform)
-        waveform = normalize_duration(waveform, SAMPLE_RATE, CHUNK_DURATION_S)
-        mel_spectrogram = waveform_to_mel_spectrogram(waveform, SAMPLE_RATE, N_MELS, WINDOW_SIZE, HOP_SIZE)
-        mel_spectrogram = mel_spectrogram.unsqueeze(0).to(self.device)
-        with torch.no_grad():
-            logits = self.model(mel_spectrogram)
-            probs = torch.softmax(logits, dim=1).squeeze().cpu().numpy()
-            pred = int(np.argmax(probs))
+        return self.predict(self.waveform_to_mel(waveform))
+
+    def predict(self, mel_spectrogram: torch.Tensor):
+        """
+        Run model inference on a [1, n_mels, frames] spectrogram.
+        """
+        probs = self.predict_batch(mel_spectrogram.unsqueeze(0))[0]
+        pred = int(np.argmax(probs))
         return pred, probs
+
+    def predict_batch(self, mel_spectrograms: torch.Tensor) -> np.ndarray:
+        """
+        Run one forward pass over a [B, 1, n_mels, frames] batch.
+        Returns:
+            [B, n_classes] class probabilities
+        """
+        with torch.no_grad():
+            logits = self.model(mel_spectrograms.to(self.device))
+            return torch.softmax(logits, dim=1).cpu().numpy()
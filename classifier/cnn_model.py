@@ -1,21 +1,39 @@
 from __future__ import annotations
 
 from pathlib import Path
-from typing import Iterable, Tuple
+from typing import Iterable, Optional, Tuple
 import torch
 import torch.nn as nn
 import torch.optim as optim
 from torch.utils.data import DataLoader, Dataset, WeightedRandomSampler, random_split
-import glob
+import json
 import os
+import random
+import time
+import numpy as np
+from scipy.io import wavfile
 import utils.audio_utils as audio_utils
+from utils.config import (
+    CLASSIFIER_MODEL,
+    TRAIN_NUM_WORKERS,
+    TRAIN_PERSISTENT_WORKERS,
+    TRAIN_PIN_MEMORY,
+    TRAIN_PREFETCH_FACTOR,
+)
+from .labels import HOP_S, label_windows, load_labels
+from .spectrogram_cache import SpectrogramCache, list_chunks
 from utils.constants import (
     CHUNK_DURATION_S,
     DATA_DIR,
     HOP_SIZE,
     LABELS,
     MODEL_PATH,
+    MODEL_TS_PATH,
+    MODEL_INT8_PATH,
+    MODEL_ONNX_PATH,
     N_MELS,
+    RECORDINGS_DIR,
+    RECORDING_LABELS_DIR,
     SAMPLE_RATE,
     WINDOW_SIZE,
     N_CLASSES,
@@ -24,13 +42,18 @@ from utils.constants import (
 )
 
 class AudioDataset(Dataset):
-    ''' Load all the data in data_dir and label it based on its dir.'''
-    def __init__(self, data_dir: Path = DATA_DIR) -> None:
-        self.samples: list[tuple[Path, int]] = []
-        for label_name, label_idx in LABELS.items():
-            files = glob.glob(os.path.join(str(data_dir / label_name), "*.wav"))
-            for f in files:
-                self.samples.append((Path(f), label_idx))
+    '''
+    Load all the data in data_dir and label it based on its dir.
+    With a SpectrogramCache, spectrograms are read from its memory-mapped
+    shards (built/refreshed here) instead of decoding every wav each epoch.
+    '''
+    def __init__(self, data_dir: Path = DATA_DIR, cache: Optional[SpectrogramCache] = None) -> None:
+        self.samples: list[tuple[Path, int]] = list_chunks(data_dir)
+        self.cache = cache
+        self.cache_rows: list[tuple[str, int]] = []
+        if cache is not None:
+            cache.build(data_dir)
+            self.cache_rows = [cache.locate(path) for path, _ in self.samples]
 
 
     def __len__(self) -> int:
@@ -39,15 +62,155 @@ class AudioDataset(Dataset):
 
     def __getitem__(self, idx: int):
         path, label = self.samples[idx]
+        if self.cache is not None:
+            shard, row = self.cache_rows[idx]
+            return self.cache.read(shard, row), label
         mel_spectrogram = audio_utils.load_and_process_wav(path,SAMPLE_RATE,N_MELS,WINDOW_SIZE,HOP_SIZE,CHUNK_DURATION_S)
         return mel_spectrogram, label
 
 
+class PackedAudioDataset(Dataset):
+    '''
+    Chunks from a single packed file written by `data_parser --packed`.
+    The int16 waveforms are memory-mapped, only the rows a batch touches are read.
+    '''
+    def __init__(self, packed_path: Path) -> None:
+        self.packed_path = Path(packed_path)
+        with open(self.packed_path.with_suffix(".json")) as f:
+            meta = json.load(f)
+        self.sample_rate: int = meta["sample_rate"]
+        self.samples: list[tuple[str, int]] = [
+            (name, LABELS[label]) for name, label in zip(meta["names"], meta["labels"])
+        ]
+        self._waveforms = None
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    def __getitem__(self, idx: int):
+        # Opened per worker so the memmap is never pickled
+        if self._waveforms is None:
+            self._waveforms = np.load(self.packed_path, mmap_mode="r")
+        waveform = torch.from_numpy(self._waveforms[idx].astype(np.float32) / 32768.0).unsqueeze(0)
+        waveform = audio_utils.resample(waveform, self.sample_rate, SAMPLE_RATE)
+        waveform = audio_utils.normalize_duration(waveform, SAMPLE_RATE, CHUNK_DURATION_S)
+        mel_spectrogram = audio_utils.waveform_to_mel_spectrogram(waveform, SAMPLE_RATE, N_MELS, WINDOW_SIZE, HOP_SIZE)
+        return mel_spectrogram, self.samples[idx][1]
+
+
+class LongRecordingDataset(Dataset):
+    '''
+    Windows cut lazily from the original labelled recordings (data/wav + data/wav_labels),
+    skipping the chunk-wav round trip. Recordings must already be SAMPLE_RATE wavs,
+    they are memory-mapped and each item reads only its own window.
+
+    Args:
+        wav_dir: Directory of long recordings
+        label_dir: Directory of matching <stem>.csv label files
+        hop_s: Spacing between window starts, any value works without regenerating data
+        random_offset: Jitter each window by up to +/- hop_s/2 (augmentation), labels follow the jitter
+    '''
+    def __init__(
+        self,
+        wav_dir: Path = RECORDINGS_DIR,
+        label_dir: Path = RECORDING_LABELS_DIR,
+        hop_s: float = HOP_S,
+        random_offset: bool = False,
+    ) -> None:
+        self.window_s = CHUNK_DURATION_S
+        self.window_samples = int(SAMPLE_RATE * CHUNK_DURATION_S)
+        self.hop_s = hop_s
+        self.random_offset = random_offset
+        self.recordings: list[tuple[Path, list[tuple[float, float, str]], float]] = []
+        # (recording index, nominal start in seconds) per item
+        self.windows: list[tuple[int, float]] = []
+        # (recording path, label) per item, same shape AudioDataset exposes
+        self.samples: list[tuple[Path, int]] = []
+        self._audio: dict[int, np.ndarray] = {}
+
+        for wav in sorted(Path(wav_dir).glob("*.wav")):
+            csv = Path(label_dir) / (wav.stem + ".csv")
+            if not csv.exists():
+                print(f"No label file for {wav.name}")
+                continue
+            sr, data = wavfile.read(wav, mmap=True)
+            if sr != SAMPLE_RATE:
+                raise ValueError(f"{wav} is {sr} Hz, LongRecordingDataset expects {SAMPLE_RATE} Hz recordings")
+            duration = data.shape[0] / sr
+            labels = load_labels(csv)
+            rec_idx = len(self.recordings)
+            self.recordings.append((wav, labels, duration))
+
+            starts = np.arange(0, duration - self.window_s, hop_s)
+            for start, label in zip(starts, label_windows(starts, self.window_s, labels)):
+                self.windows.append((rec_idx, float(start)))
+                self.samples.append((wav, LABELS[str(label)]))
+
+    def __len__(self) -> int:
+        return len(self.windows)
+
+    def _recording(self, rec_idx: int) -> np.ndarray:
+        # Opened per worker so the memmap is never pickled
+        audio = self._audio.get(rec_idx)
+        if audio is None:
+            _, audio = wavfile.read(self.recordings[rec_idx][0], mmap=True)
+            self._audio[rec_idx] = audio
+        return audio
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state["_audio"] = {}
+        return state
+
+    def __getitem__(self, idx: int):
+        rec_idx, start = self.windows[idx]
+        _, labels, duration = self.recordings[rec_idx]
+        label = self.samples[idx][1]
+        if self.random_offset:
+            jitter = (float(torch.rand(1)) - 0.5) * self.hop_s
+            start = min(max(0.0, start + jitter), duration - self.window_s)
+            label = LABELS[str(label_windows(np.array([start]), self.window_s, labels)[0])]
+
+        audio = self._recording(rec_idx)
+        offset = int(start * SAMPLE_RATE)
+        window = np.asarray(audio[offset:offset + self.window_samples], dtype=np.float32)
+        if audio.dtype == np.int16:
+            window /= 32768.0
+        waveform = audio_utils.mono(torch.from_numpy(window.reshape(window.shape[0], -1).T.copy()))
+        waveform = audio_utils.normalize_duration(waveform, SAMPLE_RATE, CHUNK_DURATION_S)
+        mel_spectrogram = audio_utils.waveform_to_mel_spectrogram(waveform, SAMPLE_RATE, N_MELS, WINDOW_SIZE, HOP_SIZE)
+        return mel_spectrogram, label
+
+
+def seed_worker(worker_id: int) -> None:
+    '''
+    DataLoader worker_init_fn: derive numpy/random seeds from the per-worker torch seed,
+    which the loader's seeded generator makes deterministic.
+    '''
+    worker_seed = torch.initial_seed() % 2**32
+    np.random.seed(worker_seed)
+    random.seed(worker_seed)
+
+
 def make_dataloaders(
-    data_dir: Path = DATA_DIR, batch_size: int = 32, seed: int = 100
+    data_dir: Path = DATA_DIR, batch_size: int = 32, seed: int = 100, use_cache: bool = True,
+    dataset: Optional[Dataset] = None,
+    num_workers: int = TRAIN_NUM_WORKERS,
+    prefetch_factor: int = TRAIN_PREFETCH_FACTOR,
+    persistent_workers: bool = TRAIN_PERSISTENT_WORKERS,
+    pin_memory: Optional[bool] = None,
     ) -> tuple[DataLoader, DataLoader, DataLoader]:
-    
-    dataset = AudioDataset(data_dir)
+    '''
+    Split a dataset 80/10/10 into class-balanced train and plain val/test loaders.
+    dataset defaults to AudioDataset(data_dir), pass e.g. LongRecordingDataset() to train from recordings.
+    Any dataset exposing `samples` as (source, label) pairs works.
+    Loading runs in num_workers processes (0 = main thread), each keeping prefetch_factor
+    batches ready. pin_memory defaults to TRAIN_PIN_MEMORY ("auto" = only with CUDA).
+    '''
+    if pin_memory is None:
+        pin_memory = torch.cuda.is_available() if TRAIN_PIN_MEMORY == "auto" else TRAIN_PIN_MEMORY == "1"
+    if dataset is None:
+        dataset = AudioDataset(data_dir, SpectrogramCache() if use_cache else None)
 
     # Make data splits
     n_total = len(dataset)
@@ -64,14 +227,27 @@ def make_dataloaders(
 
     # build a sample for torch to use those ratios in the dataloader. 
     sample_weights = [class_weights[label] for label in labels]
-    sampler = WeightedRandomSampler(sample_weights, num_samples=len(sample_weights), replacement=True)
-
-    train_loader = DataLoader(train_set, batch_size=batch_size, sampler=sampler)
-    val_loader   = DataLoader(val_set, batch_size, shuffle=False)
-    test_loader  = DataLoader(test_set, batch_size, shuffle=False)
+    sampler = WeightedRandomSampler(sample_weights, num_samples=len(sample_weights), replacement=True,
+                                    generator=torch.Generator().manual_seed(seed))
+
+    loader_kwargs: dict = {
+        "num_workers": num_workers,
+        "pin_memory": pin_memory,
+        "worker_init_fn": seed_worker,
+        "generator": torch.Generator().manual_seed(seed),
+    }
+    if num_workers > 0:
+        loader_kwargs["prefetch_factor"] = prefetch_factor
+        loader_kwargs["persistent_workers"] = persistent_workers
+
+    train_loader = DataLoader(train_set, batch_size=batch_size, sampler=sampler, **loader_kwargs)
+    val_loader   = DataLoader(val_set, batch_size, shuffle=False, **loader_kwargs)
+    test_loader  = DataLoader(test_set, batch_size, shuffle=False, **loader_kwargs)
 
     print(f"Total: {n_total} | Train: {n_train}, Val: {n_val}, Test: {n_test}")
     print(f"Class counts (train): {class_counts}")
+    print(f"Loader: workers={num_workers}, prefetch={prefetch_factor if num_workers else 0}, "
+          f"persistent={persistent_workers and num_workers > 0}, pin_memory={pin_memory}")
     
     return train_loader, val_loader, test_loader
 
@@ -105,6 +281,70 @@ class AudioCNN(nn.Module):
         x = x.view(x.size(0), -1)  # Flatten to [B, 64] (64 filter activations * average value at frequency * average value over time)
         return self.feed_forward(x)  # Returns logits [B, 2], leave as logits untill inferences to avoid vanishing gradient.  
         
+
+MODEL_VARIANTS = {
+    "fp32": MODEL_PATH,
+    "torchscript": MODEL_TS_PATH,
+    "int8": MODEL_INT8_PATH,
+    "onnx": MODEL_ONNX_PATH,
+}
+# Variants that only run on the CPU
+CPU_VARIANTS = ("int8", "onnx")
+
+
+class OnnxModel:
+    """
+    onnxruntime session with the parts of the nn.Module interface the classifier uses.
+    """
+    def __init__(self, path: Path) -> None:
+        import onnxruntime
+        self.session = onnxruntime.InferenceSession(str(path), providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, x: torch.Tensor) -> torch.Tensor:
+        logits = self.session.run(None, {self.input_name: x.detach().cpu().numpy()})[0]
+        return torch.from_numpy(logits)
+
+    def to(self, device: torch.device) -> "OnnxModel":
+        return self
+
+    def eval(self) -> "OnnxModel":
+        return self
+
+
+def load_model(variant: str = CLASSIFIER_MODEL, device: torch.device = torch.device("cpu"), path: Optional[Path] = None):
+    '''
+    Load the model the classifier runs, in eval mode on device.
+    Args:
+        variant: Key of MODEL_VARIANTS, exported ones fall back to fp32 when their file is missing
+        device: Must be the CPU for CPU_VARIANTS
+        path: File to load instead of MODEL_VARIANTS[variant] (e.g. an export not yet checked)
+    Returns:
+        Callable mapping a [B, 1, n_mels, frames] batch to [B, n_classes] logits
+    '''
+    if variant not in MODEL_VARIANTS:
+        raise ValueError(f"Unknown model variant '{variant}', expected one of {', '.join(MODEL_VARIANTS)}")
+    path = path or MODEL_VARIANTS[variant]
+    if variant != "fp32" and not path.exists():
+        print(f"WARNING: No {variant} model at {path} (run python -m classifier.export), using fp32")
+        return load_model("fp32", device)
+
+    if variant == "onnx":
+        model = OnnxModel(path)
+    elif variant in ("torchscript", "int8"):
+        model = torch.jit.load(str(path), map_location=device)
+    else:
+        model = AudioCNN()
+        if path.exists():
+            model.load_state_dict(torch.load(path, map_location=device))
+        else:
+            print(f"WARNING: No model file found at {path}, using random weights")
+    print(f"Loaded {variant} model from {path}")
+    model.to(device)
+    model.eval()
+    return model
+
+
 def train(
     model: nn.Module,
     train_loader: DataLoader,
@@ -124,9 +364,14 @@ def train(
     for epoch in range(1, epochs + 1):
         model.train()
         total_loss, correct, total = 0.0, 0, 0
+        # Time blocked on the loader vs time spent in the training step
+        data_time, compute_time = 0.0, 0.0
+        t0 = time.perf_counter()
 
         for mel, label in train_loader:
-            mel, label = mel.to(device), label.to(device)
+            t1 = time.perf_counter()
+            data_time += t1 - t0
+            mel, label = mel.to(device, non_blocking=True), label.to(device, non_blocking=True)
             optimizer.zero_grad()
             out = model(mel)
             loss = criterion(out, label)
@@ -137,12 +382,17 @@ def train(
             _, pred = out.max(1)
             correct += int((pred == label).sum().item())
             total += int(label.size(0))
+            t0 = time.perf_counter()
+            compute_time += t0 - t1  # .item() above already synchronized the device
 
         train_acc = correct / total if total else 0.0
         val_acc = evaluate(model, val_loader, device)
+        busy = data_time + compute_time
         print(f"Epoch {epoch}: "
               f"Train Loss={total_loss/len(train_loader):.4f}, "
-              f"Train Acc={train_acc:.3f}, Val Acc={val_acc:.3f}")
+              f"Train Acc={train_acc:.3f}, Val Acc={val_acc:.3f}, "
+              f"Data={data_time:.1f}s Compute={compute_time:.1f}s "
+              f"({100 * data_time / busy if busy else 0.0:.0f}% waiting on data)")
 
     return model
 
@@ -151,7 +401,7 @@ def evaluate(model: nn.Module, loader: DataLoader, device: torch.device) -> floa
     correct, total = 0, 0
     with torch.no_grad():
         for mel, label in loader:
-            mel, label = mel.to(device), label.to(device)
+            mel, label = mel.to(device, non_blocking=True), label.to(device, non_blocking=True)
             out = model(mel)
             _, pred = out.max(1)
             correct += (pred == label).sum().item()
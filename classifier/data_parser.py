@@ -1,91 +1,131 @@
 from __future__ import annotations
 
+import argparse
+import json
 import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Iterable, List, Tuple
+from typing import Iterable, List, Optional, Tuple
 
 import librosa
 import numpy as np
-import pandas as pd
 import soundfile as sf
 
+from .labels import CLASSES, HOP_S, label_windows, load_labels
+
 WAV_DIR = Path("data/wav")
 LABEL_DIR = Path("data/wav_labels")
 OUT_DIR = Path("data/chunks")
 WINDOW_S = 10.0
-HOP_S = 5.0 #overlap 5s
 SAMPLE_RATE = 16_000 #Downsample from 48kHz to 16kHz
 
-(OUT_DIR / "song").mkdir(parents=True, exist_ok=True)
-(OUT_DIR / "ad").mkdir(parents=True, exist_ok=True)
-
-def _parse_time(ts: str) -> float:
-    #only supports mm:ss or hh:mm:ss
-    parts = list(map(float, ts.split(":")))
-    if len(parts) == 2:
-        m, s = parts
-        return 60 * m + s
-    h, m, s = parts
-    return 3600 * h + 60 * m + s
-
-def load_labels(csv_path: Path) -> list[tuple[float, float, str]]:
-    """
-    Parse label CSV: start,end,type
-    Returns list of (start_sec, end_sec, type)
-    """
-    df = pd.read_csv(csv_path)
-    labels: list[tuple[float, float, str]] = []
-    for _, row in df.iterrows():
-        start = _parse_time(str(row["start"]))
-        end = _parse_time(str(row["end"]))
-        labels.append((float(start), float(end), str(row["type"])) )
-    return labels
-
 
 def label_for_window(start: float, end: float, labels: list[tuple[float, float, str]]) -> str:
     """
     This takes in a WINDOW_S sized segement of audio and a list of labels associated with it.
     It then assigns the label that has the most overlap with the segment.
     """
-    overlaps = {"song": 0.0, "ad": 0.0}
-    for seg_start, seg_end, seg_type in labels:
-        # compute overlap
-        overlap = max(0, min(end, seg_end) - max(start, seg_start))
-        overlaps[seg_type] += overlap
-    return max(overlaps, key=overlaps.get)
-
-def process_file(wav_path: Path, label_path: Path) -> None:
-    '''Segment a single WAV file into chunks with labels.'''
-    base = wav_path.stem
-    print(f"Processing {base}")
+    return str(label_windows(np.array([start]), end - start, labels)[0])
+
+
+def window_starts(total_duration: float) -> np.ndarray:
+    '''Start times (s) of every full WINDOW_S window, HOP_S apart.'''
+    return np.arange(0, total_duration - WINDOW_S, HOP_S)
 
 
+def process_file(wav_path: Path, label_path: Path, packed_dir: Optional[Path] = None) -> Tuple[str, List[str]]:
+    '''
+    Segment a single WAV file into chunks with labels.
+    Chunks go to OUT_DIR/<label>/ as wavs, or, with packed_dir, into one
+    int16 [n_chunks, samples] .npy part that pack_parts() merges later.
+    Returns:
+        (recording name, chunk labels in order)
+    '''
+    base = wav_path.stem
+
     # Load audio waveform into y as numpy array
     y, sr = librosa.load(wav_path, sr=SAMPLE_RATE, mono=True)
     labels = load_labels(label_path)
     total_duration = librosa.get_duration(y=y, sr=sr)
-    i = 0
-    for start in np.arange(0, total_duration - WINDOW_S, HOP_S):
-        end = start + WINDOW_S
-        chunk = y[int(start*sr):int(end*sr)]
+    starts = window_starts(total_duration)
+    chunk_labels = label_windows(starts, WINDOW_S, labels).tolist()
+    n = int(WINDOW_S * sr)
+
+    if packed_dir is not None:
+        part = np.lib.format.open_memmap(packed_dir / f"{base}.npy", mode="w+", dtype=np.int16, shape=(len(starts), n))
+        for i, start in enumerate(starts):
+            chunk = y[int(start*sr):int(start*sr) + n]
+            part[i, :chunk.size] = np.clip(chunk * 32767.0, -32768, 32767)
+        part.flush()
+    else:
+        for cls in CLASSES:
+            (OUT_DIR / cls).mkdir(parents=True, exist_ok=True)
+        for i, (start, label) in enumerate(zip(starts, chunk_labels)):
+            end = start + WINDOW_S
+            chunk = y[int(start*sr):int(end*sr)]
+            sf.write(os.path.join(OUT_DIR, label, f"{base}_{i:04d}.wav"), chunk, sr)
 
-        label = label_for_window(start, end, labels)
-        out_path = os.path.join(OUT_DIR, label, f"{base}_{i:04d}.wav")
+    print(f"Processed {base}: {len(chunk_labels)} chunks "
+          f"({chunk_labels.count('song')} song, {chunk_labels.count('ad')} ad)")
+    return base, chunk_labels
+
+
+def pack_parts(packed_path: Path, parts_dir: Path, results: Iterable[Tuple[str, List[str]]]) -> None:
+    '''
+    Merge per-recording parts into packed_path (.npy, int16 [N, samples])
+    plus packed_path.json with labels, chunk names and sample rate.
+    '''
+    results = list(results)
+    total = sum(len(labels) for _, labels in results)
+    n = int(WINDOW_S * SAMPLE_RATE)
+    out = np.lib.format.open_memmap(packed_path, mode="w+", dtype=np.int16, shape=(total, n))
+    names: list[str] = []
+    chunk_labels: list[str] = []
+    row = 0
+    for base, labels in results:
+        part = np.load(parts_dir / f"{base}.npy", mmap_mode="r")
+        out[row:row + len(labels)] = part
+        names += [f"{base}_{i:04d}" for i in range(len(labels))]
+        chunk_labels += labels
+        row += len(labels)
+        del part
+    out.flush()
+    with open(packed_path.with_suffix(".json"), "w") as f:
+        json.dump({"sample_rate": SAMPLE_RATE, "names": names, "labels": chunk_labels}, f)
+    shutil.rmtree(parts_dir)
+    print(f"Packed {total} chunks into {packed_path}")
 
-        sf.write(out_path, chunk, sr)
-        print(f"Writing Chunk: {out_path} ({label})")
-        i += 1
 
 def main() -> None:
     '''
     Process all WAV files in WAV_DIR with corresponding labels in LABEL_DIR.
     '''
-    for wav in WAV_DIR.glob("*.wav"):
+    parser = argparse.ArgumentParser(description="Cut labelled recordings into training chunks")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Recordings processed in parallel")
+    parser.add_argument("--packed", type=Path, default=None,
+                        help="Write all chunks into one .npy (plus .json labels) instead of wav files")
+    args = parser.parse_args()
+
+    jobs = []
+    for wav in sorted(WAV_DIR.glob("*.wav")):
         csv = LABEL_DIR / (wav.stem + ".csv")
         if csv.exists():
-            process_file(wav, csv)
+            jobs.append((wav, csv))
         else:
             print(f"No label file for {wav.name}")
 
+    parts_dir = None
+    if args.packed is not None:
+        parts_dir = args.packed.parent / (args.packed.stem + ".parts")
+        parts_dir.mkdir(parents=True, exist_ok=True)
+
+    with ProcessPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        futures = [pool.submit(process_file, wav, csv, parts_dir) for wav, csv in jobs]
+        results = [f.result() for f in futures]
+
+    if args.packed is not None and parts_dir is not None:
+        pack_parts(args.packed, parts_dir, results)
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
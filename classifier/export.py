@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+import argparse
+import copy
+import time
+from pathlib import Path
+from typing import Dict, Sequence
+import torch
+import torch.nn as nn
+from torch.ao import quantization as tq
+from torch.utils.data import DataLoader
+from utils.constants import MODEL_PATH, N_FRAMES, N_MELS
+from .cnn_model import MODEL_VARIANTS, AudioCNN, load_model, make_dataloaders
+
+'''
+Export the trained AudioCNN (MODEL_PATH) for CPU inference:
+
+    python -m classifier.export [--variants torchscript int8 onnx]
+
+torchscript  traced fp32 graph
+int8         static int8 quantization (conv+relu fused, int8 weights and activations),
+             activation ranges calibrated on training chunks from data/chunks
+onnx         fp32 ONNX graph for onnxruntime (needs the onnx and onnxruntime packages)
+
+Each variant is exported to a temporary file and compared with the fp32 model on the
+test split. Only a variant within --tolerance of the fp32 test accuracy replaces the
+file the classifier loads; one that drops more fails the export (non-zero exit) and
+leaves any previous export in place.
+Pick the variant the classifier runs with CLASSIFIER_MODEL.
+'''
+class QuantizableAudioCNN(nn.Module):
+    """AudioCNN with quant/dequant stubs around it and conv+relu pairs fused."""
+    def __init__(self, model: AudioCNN) -> None:
+        super().__init__()
+        self.quant = tq.QuantStub()
+        self.cnn = tq.fuse_modules(copy.deepcopy(model.cnn), [["0", "1"], ["3", "4"], ["6", "7"]])
+        self.feed_forward = copy.deepcopy(model.feed_forward)
+        self.dequant = tq.DeQuantStub()
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        x = self.cnn(self.quant(x))
+        x = x.reshape(x.size(0), -1)
+        return self.dequant(self.feed_forward(x))
+
+
+def example_input(batch: int = 1) -> torch.Tensor:
+    return torch.randn(batch, 1, N_MELS, N_FRAMES)
+
+
+def export_torchscript(model: AudioCNN, path: Path) -> None:
+    with torch.no_grad():
+        traced = torch.jit.trace(model, example_input())
+    torch.jit.save(torch.jit.freeze(traced), str(path))
+
+
+def export_int8(model: AudioCNN, calibration: DataLoader, batches: int, path: Path) -> None:
+    """
+    Statically quantize model and save it as TorchScript.
+    Args:
+        model: fp32 model on the CPU
+        calibration: Loader of training spectrograms the observers see
+        batches: Number of calibration batches
+        path: Output file
+    """
+    qmodel = QuantizableAudioCNN(model).eval()
+    qmodel.qconfig = tq.get_default_qconfig(torch.backends.quantized.engine)
+    tq.prepare(qmodel, inplace=True)
+    with torch.no_grad():
+        for i, (mel, _) in enumerate(calibration):
+            if i >= batches:
+                break
+            qmodel(mel)
+    tq.convert(qmodel, inplace=True)
+    with torch.no_grad():
+        traced = torch.jit.trace(qmodel, example_input())
+    torch.jit.save(traced, str(path))
+
+
+def export_onnx(model: AudioCNN, path: Path) -> None:
+    import onnx  # noqa: F401  the exporter needs it, fail as a missing dependency
+    torch.onnx.export(
+        model, (example_input(),), str(path),
+        input_names=["mel"], output_names=["logits"],
+        dynamic_axes={"mel": {0: "batch"}, "logits": {0: "batch"}},
+        dynamo=False,
+    )
+
+
+def compare(reference, candidate, loader: DataLoader) -> Dict[str, float]:
+    """
+    Run both models over loader.
+    Returns:
+        accuracy of each, share of identical predictions and the largest probability difference
+    """
+    correct_ref = correct = agree = total = 0
+    max_diff = 0.0
+    with torch.no_grad():
+        for mel, label in loader:
+            p_ref = torch.softmax(reference(mel), dim=1)
+            p = torch.softmax(candidate(mel), dim=1)
+            correct_ref += (p_ref.argmax(1) == label).sum().item()
+            correct += (p.argmax(1) == label).sum().item()
+            agree += (p.argmax(1) == p_ref.argmax(1)).sum().item()
+            max_diff = max(max_diff, (p - p_ref).abs().max().item())
+            total += label.size(0)
+    return {
+        "fp32_acc": correct_ref / total if total else 0.0,
+        "acc": correct / total if total else 0.0,
+        "agreement": agree / total if total else 0.0,
+        "max_prob_diff": max_diff,
+    }
+
+
+def latency_ms(model, runs: int = 50) -> float:
+    """Mean single-window forward time."""
+    x = example_input()
+    with torch.no_grad():
+        for _ in range(5):
+            model(x)
+        start = time.perf_counter()
+        for _ in range(runs):
+            model(x)
+    return 1000 * (time.perf_counter() - start) / runs
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Export AudioCNN inference variants")
+    parser.add_argument("--variants", nargs="+", default=["torchscript", "int8"],
+                        choices=[v for v in MODEL_VARIANTS if v != "fp32"])
+    parser.add_argument("--calibration-batches", type=int, default=16,
+                        help="Training batches (of 32) the int8 observers are calibrated on")
+    parser.add_argument("--tolerance", type=float, default=0.01,
+                        help="Largest test accuracy drop allowed against fp32")
+    args = parser.parse_args(argv)
+
+    cpu = torch.device("cpu")
+    if not MODEL_PATH.exists():
+        print(f"No trained model at {MODEL_PATH}, train one with python -m classifier.cnn_model first")
+        return 1
+    model = load_model("fp32", cpu)
+    train_loader, _, test_loader = make_dataloaders()
+
+    exporters = {
+        "torchscript": lambda path: export_torchscript(model, path),
+        "int8": lambda path: export_int8(model, train_loader, args.calibration_batches, path),
+        "onnx": lambda path: export_onnx(model, path),
+    }
+    print(f"fp32: {latency_ms(model):.2f} ms/window")
+    failed = []
+    for variant in args.variants:
+        path = MODEL_VARIANTS[variant]
+        # Only moved to where the classifier loads it from once it passes the parity check
+        candidate = path.with_suffix(".tmp" + path.suffix)
+        try:
+            try:
+                exporters[variant](candidate)
+                exported = load_model(variant, cpu, candidate)
+            except ImportError as e:
+                print(f"Skipping {variant}, missing dependency: {e}")
+                continue
+            result = compare(model, exported, test_loader)
+            drop = result["fp32_acc"] - result["acc"]
+            ok = drop <= args.tolerance
+            print(f"{variant}: {candidate.stat().st_size / 1024:.0f} KB, {latency_ms(exported):.2f} ms/window, "
+                  f"test acc {result['acc']:.3f} (fp32 {result['fp32_acc']:.3f}), "
+                  f"agreement {result['agreement']:.3f}, max prob diff {result['max_prob_diff']:.4f}"
+                  f"{'' if ok else ' FAILED parity'}")
+            if ok:
+                candidate.replace(path)
+            else:
+                failed.append(variant)
+                print(f"  {variant} not installed, {path} {'keeps the previous export' if path.exists() else 'was not written'}")
+        finally:
+            # A failed or skipped export never reaches the path the classifier loads
+            candidate.unlink(missing_ok=True)
+    if "int8" in args.variants:
+        print(f"Quantized engine: {torch.backends.quantized.engine} (int8 models load on the same engine)")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
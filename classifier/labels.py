@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import csv
+from pathlib import Path
+
+import numpy as np
+
+'''
+Label parsing and window labelling shared by data_parser.py (chunking) and
+LongRecordingDataset (lazy windows). Only numpy, so the live classifier can
+import cnn_model without pulling in the data preparation dependencies.
+'''
+HOP_S = 5.0 #overlap 5s
+CLASSES = ("song", "ad") #ties go to the first class
+
+def _parse_time(ts: str) -> float:
+    #only supports mm:ss or hh:mm:ss
+    parts = list(map(float, ts.split(":")))
+    if len(parts) == 2:
+        m, s = parts
+        return 60 * m + s
+    h, m, s = parts
+    return 3600 * h + 60 * m + s
+
+def load_labels(csv_path: Path) -> list[tuple[float, float, str]]:
+    """
+    Parse label CSV: start,end,type
+    Returns list of (start_sec, end_sec, type)
+    """
+    labels: list[tuple[float, float, str]] = []
+    with open(csv_path, newline="") as f:
+        for row in csv.DictReader(f):
+            start = _parse_time(str(row["start"]))
+            end = _parse_time(str(row["end"]))
+            labels.append((float(start), float(end), str(row["type"])) )
+    return labels
+
+
+def _covered(t: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    '''
+    Total length of the intervals [starts, ends) lying before each time in t.
+    Each interval contributes max(0, t - start) - max(0, t - end), summed with prefix sums.
+    '''
+    starts, ends = np.sort(starts), np.sort(ends)
+    csum_s = np.concatenate(([0.0], np.cumsum(starts)))
+    csum_e = np.concatenate(([0.0], np.cumsum(ends)))
+    n_s = np.searchsorted(starts, t, side="right")
+    n_e = np.searchsorted(ends, t, side="right")
+    return (n_s * t - csum_s[n_s]) - (n_e * t - csum_e[n_e])
+
+
+def label_windows(starts: np.ndarray, window_s: float, labels: list[tuple[float, float, str]]) -> np.ndarray:
+    """
+    Vectorized label_for_window: label every window [start, start + window_s) at once.
+    Overlap with each class is the difference of its cumulative coverage at the window ends.
+    Returns:
+        Array of class names, one per window.
+    """
+    starts = np.asarray(starts, dtype=np.float64)
+    ends = starts + window_s
+    overlaps = np.zeros((len(CLASSES), starts.size))
+    for i, cls in enumerate(CLASSES):
+        segs = np.array([(s, e) for s, e, t in labels if t == cls], dtype=np.float64).reshape(-1, 2)
+        if segs.size:
+            overlaps[i] = _covered(ends, segs[:, 0], segs[:, 1]) - _covered(starts, segs[:, 0], segs[:, 1])
+    # Prefix-sum round-off must not break ties (e.g. an unlabelled window is "song")
+    overlaps = np.round(overlaps, 6)
+    return np.asarray(CLASSES)[np.argmax(overlaps, axis=0)]
@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import struct
+import warnings
+from dataclasses import dataclass
+from typing import Dict, Mapping
+import numpy as np
+from utils.resampler import PolyphaseResampler
+
+try:
+    # IMA ADPCM in C; deprecated in 3.11 and gone in 3.13, "adpcm" is then unavailable
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", DeprecationWarning)
+        import audioop
+except ImportError:
+    audioop = None
+
+'''
+Audio encodings offered to websocket clients, chosen per connection:
+
+    /ws/audio                            bare float32 PCM at 48 kHz (default)
+    /ws/audio?encoding=f32&rate=16000    float32 PCM at 16 kHz
+    /ws/audio?encoding=s16&rate=16000    int16 PCM at 16 kHz
+    /ws/audio?encoding=adpcm&rate=16000  IMA ADPCM, 4 bits per sample
+
+rate is one of RATES and the received audio is always resampled to it. The
+streamer publishes 16 kHz unless RESAMPLE_STAGE=classifier, so higher rates
+are upsampled and carry nothing above 8 kHz (logged once per format). Every
+format except the default prefixes each message with an 8 byte header:
+
+    rate   I  sample rate of the payload in Hz
+    value  h  ADPCM predictor before the first sample (0 otherwise)
+    index  B  ADPCM step index before the first sample (0 otherwise)
+    (pad)  x
+
+so a client can start decoding ADPCM at any message.
+'''
+ENCODINGS = ("f32", "s16") + (("adpcm",) if audioop is not None else ())
+RATES = (48000, 24000, 16000)
+# What the browser UI plays, whatever rate the streamer publishes
+DEFAULT_RATE = 48000
+_HEADER = struct.Struct("<IhBx")
+
+
+@dataclass(frozen=True)
+class AudioFormat:
+    """Encoding and sample rate of one websocket audio stream."""
+    encoding: str = "f32"
+    rate: int = DEFAULT_RATE
+
+    @classmethod
+    def from_query(cls, params: Mapping[str, str]) -> "AudioFormat":
+        """Format from websocket query parameters, ValueError if not offered."""
+        encoding = params.get("encoding", "f32")
+        if encoding not in ENCODINGS:
+            raise ValueError(f"Unsupported encoding '{encoding}', expected one of {', '.join(ENCODINGS)}")
+        rate = int(params.get("rate", DEFAULT_RATE))
+        if rate not in RATES:
+            raise ValueError(f"Unsupported rate {rate}, expected one of {', '.join(map(str, RATES))}")
+        return cls(encoding, rate)
+
+    def __str__(self) -> str:
+        return f"{self.encoding}@{self.rate}"
+
+
+class AudioEncoder:
+    """
+    Encodes the received audio stream into one AudioFormat.
+    Resampler and ADPCM state carry over between frames, so one encoder
+    serves every client of its format.
+    """
+    def __init__(self, fmt: AudioFormat) -> None:
+        self.fmt = fmt
+        self.resamplers: Dict[int, PolyphaseResampler] = {}
+        self.adpcm_state = None
+        # Only the default format goes out bare, every other one says what it carries
+        self.header = fmt != AudioFormat()
+
+    def resample(self, samples: np.ndarray, sample_rate: int) -> tuple[np.ndarray, int]:
+        if self.fmt.rate == sample_rate:
+            return samples, sample_rate
+        resampler = self.resamplers.get(sample_rate)
+        if resampler is None:
+            if self.fmt.rate > sample_rate:
+                print(f"[AudioEncoder] {self.fmt} clients get {sample_rate} Hz audio upsampled, "
+                      f"nothing above {sample_rate // 2} Hz")
+            resampler = self.resamplers[sample_rate] = PolyphaseResampler(sample_rate, self.fmt.rate)
+        return resampler.process(samples), self.fmt.rate
+
+    def encode(self, samples: np.ndarray, sample_rate: int) -> bytes:
+        """
+        Encode one frame.
+        Args:
+            samples: float32 audio in [-1, 1]
+            sample_rate: Rate of samples in Hz
+        Returns:
+            Message for the clients of this format
+        """
+        samples, rate = self.resample(samples, sample_rate)
+        if self.fmt.encoding == "f32":
+            payload = np.asarray(samples, dtype=np.float32).tobytes()
+            return _HEADER.pack(rate, 0, 0) + payload if self.header else payload
+        pcm = np.clip(samples * 32768.0, -32768, 32767).astype(np.int16).tobytes()
+        if self.fmt.encoding == "s16":
+            return _HEADER.pack(rate, 0, 0) + pcm
+        value, index = self.adpcm_state or (0, 0)
+        payload, self.adpcm_state = audioop.lin2adpcm(pcm, 2, self.adpcm_state)
+        return _HEADER.pack(rate, value, index) + payload
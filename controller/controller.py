@@ -1,19 +1,25 @@
 from __future__ import annotations
 
-import asyncio
 import json
-from typing import Any, Set
+import time
+from typing import Any, Dict, Tuple
 
 import numpy as np
-import redis.asyncio as aioredis
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 import logging
 
-from utils.config import REDIS_URL
-from utils.constants import CHANNEL_AUDIO, CHANNEL_CLASSIFIER, CHANNEL_STATE
+from utils.config import TRANSPORT, WS_AUDIO_QUEUE, STATS_INTERVAL_S, METRICS_INTERVAL_S
+from utils.latency import merged, prometheus_text, summarize
+from utils.redis_pool import close_pools
+from utils.transport import Message, make_transport
+from utils.audio_frame import SequenceTracker, decode_frame
+from utils.constants import CHANNEL_AUDIO, CHANNEL_CLASSIFIER, CHANNEL_STATE, CHANNEL_METRICS, stream_channel
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import RedirectResponse
+from fastapi.responses import PlainTextResponse, RedirectResponse
+from controller.fanout import AudioFanOut, FanOut, LATEST
+from controller.audio_encoding import AudioFormat
+from controller.router import ChannelRouter
 
 
 app = FastAPI()
@@ -24,143 +30,112 @@ app.add_middleware(#Stops browser security error
     allow_methods=["*"],
     allow_headers=["*"],
 )
-audio_subscribers: Set[WebSocket] = set()
-classifier_subscribers: Set[WebSocket] = set()
-state_subscribers: Set[WebSocket] = set()
 logging.basicConfig(level=logging.INFO)
 
-async def broadcast_audio(data: bytes) -> None:
-    """Send 100ms audio PCM chunks to all connected audio websocket clients."""
-    if not audio_subscribers:
-        return
-    stale: list[WebSocket] = []
-    for ws in audio_subscribers:
-        try:
-            await ws.send_bytes(data)
-        except WebSocketDisconnect:
-            stale.append(ws)
-    for ws in stale:
-        audio_subscribers.discard(ws)
-
-async def broadcast_state(data: bytes) -> None:
-    """Send current state and tuning to all connected state websocket clients."""
-    if not state_subscribers:
-        return
-    stale: list[WebSocket] = []
-    text = data.decode("utf-8", errors="ignore")
-    for ws in state_subscribers:
-        try:
-            await ws.send_text(text)
-        except WebSocketDisconnect:
-            stale.append(ws)
-    for ws in stale:
-        state_subscribers.discard(ws)
-
-async def broadcast_classifier(payload: dict[str, Any]) -> None:
-    """Send classifier updates as JSON to all connected classifier websocket clients."""
-    if not classifier_subscribers:
-        return
-    msg=json.dumps(payload)
-    print(payload)
-    stale: list[WebSocket] = []
-    for ws in classifier_subscribers:
-        try:
-            await ws.send_text(msg)
-        except WebSocketDisconnect:
-            stale.append(ws)
-    for ws in stale:
-        classifier_subscribers.discard(ws)
-
-
-async def redis_audio_listener() -> None:
-    """Subscribe to the Redis audio channel and forward to WebSocket clients."""
-    redis = aioredis.from_url(REDIS_URL)
-    pubsub = redis.pubsub()
-    await pubsub.subscribe(CHANNEL_AUDIO)
-    print(f"[Controller] Listening on Redis channel: {CHANNEL_AUDIO}")
+# Each websocket gets its own sender task; a slow client only ever delays itself
+audio_fanout = AudioFanOut(WS_AUDIO_QUEUE)
+state_fanout = FanOut("state", WebSocket.send_text, LATEST)
+classifier_fanout = FanOut("classifier", WebSocket.send_text, LATEST)
 
-    try:
-        async for message in pubsub.listen():
-            if message["type"] != "message":
-                continue
-            await broadcast_audio(message["data"])
-    except asyncio.CancelledError:
-        print("[Controller] Audio listener stopped.")
-    finally:
-        await pubsub.unsubscribe(CHANNEL_AUDIO)
-        await redis.close()
+def broadcast_audio(samples: np.ndarray, sample_rate: int) -> None:
+    """Encode 100ms audio chunks once per requested format and queue them for the audio websocket clients."""
+    audio_fanout.publish(samples, sample_rate)
 
-async def redis_state_listener() -> None:
-    """Subscribe to the Redis audio channel and forward to WebSocket clients."""
-    redis = aioredis.from_url(REDIS_URL)
-    pubsub = redis.pubsub()
-    await pubsub.subscribe(CHANNEL_STATE)
-    print(f"[Controller] Listening on Redis channel: {CHANNEL_STATE}")
+def broadcast_state(data: bytes) -> None:
+    """Queue current state and tuning for all connected state websocket clients."""
+    state_fanout.publish(data.decode("utf-8", errors="ignore"))
 
+def broadcast_classifier(payload: dict[str, Any]) -> None:
+    """Queue classifier updates as JSON for all connected classifier websocket clients."""
+    print(payload)
+    # Coalesced per station (wideband results carry "stream"), so a slow client never misses one station
+    classifier_fanout.publish(json.dumps(payload), key=payload.get("stream"))
+
+
+audio_tracker = SequenceTracker()
+
+async def handle_audio(message: Message) -> None:
+    """Forward an audio frame to the audio WebSocket clients."""
+    # The frame header is for backend consumers, clients get the format they asked for
+    frame = decode_frame(message.data)
+    lost = audio_tracker.update(message.channel, frame)
+    if lost:
+        print(f"[Controller] Lost {lost} audio frames ({audio_tracker.lost} total, {audio_tracker.loss_rate:.1%})")
+    broadcast_audio(frame.float32(), frame.sample_rate)
+
+async def handle_state(message: Message) -> None:
+    """Forward an FSM state update to the state WebSocket clients."""
+    broadcast_state(message.data)
+
+async def handle_classifier(message: Message) -> None:
+    """Forward a classifier result to the classifier WebSocket clients."""
+    broadcast_classifier(json.loads(message.data.decode()))
+
+# Latest latency snapshot of every pipeline process: source -> (received at, stages)
+latency_snapshots: Dict[str, Tuple[float, Dict[str, dict]]] = {}
+# Processes silent for this long (stopped or restarted under a new pid) are dropped
+METRICS_STALE_S = 10 * METRICS_INTERVAL_S
+last_latency_log = time.monotonic()
+
+def live_snapshots() -> Dict[str, Dict[str, dict]]:
+    now = time.monotonic()
+    for source in [s for s, (at, _) in latency_snapshots.items() if now - at > METRICS_STALE_S]:
+        del latency_snapshots[source]
+    return {source: stages for source, (_, stages) in latency_snapshots.items()}
+
+async def handle_metrics(message: Message) -> None:
+    """Keep a process's latency snapshot for /metrics, log the merged percentiles now and then."""
+    global last_latency_log
+    snapshot = json.loads(message.data)
+    latency_snapshots[snapshot["source"]] = (time.monotonic(), snapshot["stages"])
+    if time.monotonic() - last_latency_log >= STATS_INTERVAL_S:
+        last_latency_log = time.monotonic()
+        print(f"[Controller] Latency since capture: {summarize(merged(live_snapshots().values()))}")
+
+# Channels each websocket endpoint needs; per-station results (wideband mode) carry a "stream" field
+AUDIO_CHANNELS = (CHANNEL_AUDIO,)
+STATE_CHANNELS = (CHANNEL_STATE,)
+CLASSIFIER_CHANNELS = (CHANNEL_CLASSIFIER, stream_channel(CHANNEL_CLASSIFIER, "*"))
+
+async def serve_ws(ws: WebSocket, fanout: FanOut, channels: Tuple[str, ...]) -> None:
+    """Attach a websocket to a fan-out until the client disconnects, subscribing its channels meanwhile."""
+    await ws.accept()
+    fanout.attach(ws)
+    await app.channels.acquire(*channels)
+    print(f"[WebSocket] {fanout.name} client connected ({len(fanout)} total)")
     try:
-        async for message in pubsub.listen():
-            if message["type"] != "message":
-                continue
-            await broadcast_state(message["data"])
-    except asyncio.CancelledError:
-        print("[Controller] state listener stopped.")
-    finally:
-        await pubsub.unsubscribe(CHANNEL_STATE)
-        await redis.close()
-
-async def redis_classifier_listener() -> None:
-    """Subscribe to the Redis classifier channel and forward to WebSocket clients."""
-    redis = aioredis.from_url(REDIS_URL)
-    pubsub = redis.pubsub()
-    await pubsub.subscribe(CHANNEL_CLASSIFIER)
-    print(f"[Controller] Listening on Redis channel: {CHANNEL_CLASSIFIER}")
-    try:
-        async for message in pubsub.listen():
-            if message["type"] != "message":
-                continue
-            payload = json.loads(message["data"].decode())
-            await broadcast_classifier(payload)
-    except asyncio.CancelledError:
-        print("[Controller] classifier listener stopped.")
+        while True:
+            await ws.receive_text()
+    except (WebSocketDisconnect, RuntimeError):
+        # RuntimeError: the fan-out already closed an evicted client
+        pass
     finally:
-        await pubsub.unsubscribe(CHANNEL_CLASSIFIER)
-        await redis.close()
+        fanout.detach(ws)
+        await app.channels.release(*channels)
+        print(f"[WebSocket] {fanout.name} client disconnected")
 
 @app.websocket("/ws/audio")
 async def audio_ws(ws: WebSocket) -> None:
-    await ws.accept()
-    audio_subscribers.add(ws)
-    print("[WebSocket] Audio client connected")
+    # ?encoding=f32|s16|adpcm&rate=48000|24000|16000, see controller/audio_encoding.py
     try:
-        while True:
-            await ws.receive_text()
-    except WebSocketDisconnect:
-        print("[WebSocket] Audio client disconnected")
-        audio_subscribers.remove(ws)
+        fmt = AudioFormat.from_query(ws.query_params)
+    except ValueError as e:
+        await ws.close(code=1003, reason=str(e))
+        return
+    await serve_ws(ws, audio_fanout.fanout(fmt), AUDIO_CHANNELS)
 
 @app.websocket("/ws/classifier")
 async def classifier_ws(ws: WebSocket) -> None:
-    await ws.accept()
-    classifier_subscribers.add(ws)
-    print("[WebSocket] classifier client connected")
-    try:
-        while True:
-            await ws.receive_text()
-    except WebSocketDisconnect:
-        print("[WebSocket] classifier client disconnected")
-        classifier_subscribers.remove(ws)
+    await serve_ws(ws, classifier_fanout, CLASSIFIER_CHANNELS)
 
 @app.websocket("/ws/state")
 async def state_ws(ws: WebSocket) -> None:
-    await ws.accept()
-    state_subscribers.add(ws)
-    print("[WebSocket] state client connected")
-    try:
-        while True:
-            await ws.receive_text()
-    except WebSocketDisconnect:
-        print("[WebSocket] state client disconnected")
-        state_subscribers.remove(ws)
+    await serve_ws(ws, state_fanout, STATE_CHANNELS)
+
+@app.get("/metrics")
+async def metrics() -> PlainTextResponse:
+    """Capture-to-stage latency histograms of every pipeline process, Prometheus text format."""
+    return PlainTextResponse(prometheus_text(live_snapshots()), media_type="text/plain; version=0.0.4")
 
 app.mount("/app", StaticFiles(directory="ui/dist", html=True), name="static")
 @app.get("/")
@@ -178,16 +153,25 @@ async def catch_exceptions(request, call_next):
 
 @app.on_event("startup")
 async def startup_event():
-    print("[Controller] Starting streamer/classifier listeners...")
-    app.audio_task = asyncio.create_task(redis_audio_listener())
-    app.classifier_task = asyncio.create_task(redis_classifier_listener())
-    app.state_task = asyncio.create_task(redis_state_listener())
+    print("[Controller] Starting, channels are subscribed once a websocket client needs them...")
+    # main.py --role controller passes its --transport, plain uvicorn uses TRANSPORT.
+    # The memory transport lives inside main.py, which mirrors it to Redis pub/sub
+    kind = getattr(app.state, "transport", TRANSPORT)
+    app.transport = make_transport("pubsub" if kind == "memory" else kind)
+    app.channels = ChannelRouter(app.transport, {
+        CHANNEL_AUDIO: handle_audio,
+        CHANNEL_STATE: handle_state,
+        CHANNEL_CLASSIFIER: handle_classifier,
+        stream_channel(CHANNEL_CLASSIFIER, "*"): handle_classifier,
+        CHANNEL_METRICS: handle_metrics,
+    })
+    # A few small messages per process every METRICS_INTERVAL_S, always subscribed
+    await app.channels.acquire(CHANNEL_METRICS)
 
 @app.on_event("shutdown")
 async def shutdown_event():
     print("[Controller] Shutting down...")
-    app.audio_task.cancel()
-    app.classifier_task.cancel()
-    app.state_task.cancel()
-    await asyncio.sleep(0.1)
+    await app.channels.close()
+    await app.transport.close()
+    await close_pools()
     print("[Controller] Shutdown complete...")
@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple
+import numpy as np
+from fastapi import WebSocket
+from utils.config import WS_SEND_TIMEOUT_S, WS_EVICT_AFTER_S
+from controller.audio_encoding import AudioEncoder, AudioFormat
+
+# Per-client delivery policy when a client is behind
+DROP_OLDEST = "drop_oldest"  # skip to the oldest message still buffered (audio)
+LATEST = "latest"            # skip straight to the newest message (state, classifier)
+
+
+class FanOut:
+    """
+    Broadcasts one stream of messages to many websocket clients.
+
+    publish() appends to a ring of the last `size` messages and wakes the
+    senders, so its cost does not depend on the number or speed of clients.
+    Every client has its own sender task and cursor into the ring, which is
+    its bounded send queue: a client that falls more than `size` messages
+    behind loses the oldest ones (DROP_OLDEST). LATEST keeps only the newest
+    message per key instead (e.g. per station), so a client that is behind
+    gets the newest message of every key. Clients that stay behind for
+    evict_after_s, or whose send blocks for send_timeout_s, are disconnected.
+
+    Args:
+        name: Stream name for logs
+        send: Coroutine sending one message to a websocket (e.g. WebSocket.send_bytes)
+        mode: DROP_OLDEST or LATEST
+        size: Messages buffered
+        send_timeout_s: Longest a single send may take
+        evict_after_s: Longest a client may keep losing messages
+    """
+    def __init__(
+        self,
+        name: str,
+        send: Callable[[WebSocket, Any], Awaitable[None]],
+        mode: str = DROP_OLDEST,
+        size: int = 50,
+        send_timeout_s: float = WS_SEND_TIMEOUT_S,
+        evict_after_s: float = WS_EVICT_AFTER_S,
+    ) -> None:
+        self.name = name
+        self.send = send
+        self.mode = mode
+        self.ring: Deque[Any] = deque(maxlen=max(1, size))
+        # LATEST mode: key -> (seq, message) of the newest message with that key
+        self.latest: Dict[Any, Tuple[int, Any]] = {}
+        self.seq = 0  # sequence number of the next published message
+        self.send_timeout_s = send_timeout_s
+        self.evict_after_s = evict_after_s
+        self.clients: Dict[WebSocket, asyncio.Task] = {}
+        self.evicted = 0
+        self._wakeup = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self.clients)
+
+    def publish(self, message: Any, key: Any = None) -> None:
+        """Buffer a message for every client, never waits. In LATEST mode it replaces the last one with key."""
+        if self.mode == LATEST:
+            self.latest[key] = (self.seq, message)
+        else:
+            self.ring.append(message)
+        self.seq += 1
+        # Wake the current waiters, later waits use a fresh event
+        self._wakeup.set()
+        self._wakeup = asyncio.Event()
+
+    def attach(self, ws: WebSocket) -> None:
+        self.clients[ws] = asyncio.create_task(self._sender(ws))
+
+    def detach(self, ws: WebSocket) -> None:
+        task = self.clients.pop(ws, None)
+        if task is not None:
+            task.cancel()
+
+    async def _sender(self, ws: WebSocket) -> None:
+        # LATEST clients get the current value of every key right away, DROP_OLDEST ones start live
+        cursor = self.seq
+        if self.mode == LATEST:
+            cursor = min((seq for seq, _ in self.latest.values()), default=self.seq)
+        behind_since: Optional[float] = None
+        try:
+            while True:
+                if cursor >= self.seq:
+                    behind_since = None
+                    await self._wakeup.wait()
+                    continue
+                if self.mode == LATEST:
+                    # Newest message of every key published since the last send, oldest first
+                    seq, message = min((item for item in self.latest.values() if item[0] >= cursor),
+                                       key=lambda item: item[0])
+                    cursor = seq + 1
+                    await asyncio.wait_for(self.send(ws, message), self.send_timeout_s)
+                    continue
+                oldest = self.seq - len(self.ring)
+                if cursor < oldest:
+                    # Fell off the ring: skip what was lost
+                    cursor = oldest
+                    behind_since = behind_since or time.monotonic()
+                    if time.monotonic() - behind_since > self.evict_after_s:
+                        print(f"[FanOut] Evicting slow {self.name} client")
+                        self.evicted += 1
+                        await ws.close(code=1013)
+                        return
+                message = self.ring[cursor - oldest]
+                cursor += 1
+                await asyncio.wait_for(self.send(ws, message), self.send_timeout_s)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            # Disconnects, send timeouts and closed sockets all end this client only.
+            # Closing the socket also ends serve_ws, which releases the client's channels
+            print(f"[FanOut] Dropping {self.name} client: {type(e).__name__}")
+            try:
+                await asyncio.wait_for(ws.close(code=1011), self.send_timeout_s)
+            except Exception:
+                pass  # already gone
+        finally:
+            self.clients.pop(ws, None)
+
+
+class AudioFanOut:
+    """
+    One FanOut per negotiated AudioFormat. Each frame is encoded once per
+    format that has clients and the same bytes go to all of them.
+
+    Args:
+        size: Frames buffered per client
+    """
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self.formats: Dict[AudioFormat, Tuple[AudioEncoder, FanOut]] = {}
+
+    def __len__(self) -> int:
+        return sum(len(fanout) for _, fanout in self.formats.values())
+
+    def fanout(self, fmt: AudioFormat) -> FanOut:
+        if fmt not in self.formats:
+            self.formats[fmt] = (AudioEncoder(fmt), FanOut(f"audio {fmt}", WebSocket.send_bytes, DROP_OLDEST, self.size))
+        return self.formats[fmt][1]
+
+    def publish(self, samples: np.ndarray, sample_rate: int) -> None:
+        for encoder, fanout in self.formats.values():
+            if fanout:
+                fanout.publish(encoder.encode(samples, sample_rate))
+
@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import asyncio
+import fnmatch
+from typing import Awaitable, Callable, Dict, Optional
+from utils.transport import Message, Subscription, Transport
+
+Handler = Callable[[Message], Awaitable[None]]
+
+
+class ChannelRouter:
+    """
+    One subscription for the whole controller, routing messages by channel.
+
+    Channels are reference counted: the first acquire() subscribes, the
+    last release() unsubscribes, and with nothing acquired the subscription
+    and its reader task are closed, so an idle controller reads nothing.
+
+    Args:
+        transport: Backend to subscribe on
+        handlers: Handler per channel name or glob pattern
+    """
+    def __init__(self, transport: Transport, handlers: Dict[str, Handler]) -> None:
+        self.transport = transport
+        self.handlers = handlers
+        self.refs: Dict[str, int] = {}
+        self.subscription: Optional[Subscription] = None
+        self.task: Optional[asyncio.Task] = None
+        # Serializes (un)subscribing, acquire/release come from concurrent websocket handlers
+        self.lock = asyncio.Lock()
+
+    def handler(self, channel: str) -> Optional[Handler]:
+        if channel in self.handlers:
+            return self.handlers[channel]
+        for pattern, handler in self.handlers.items():
+            if fnmatch.fnmatchcase(channel, pattern):
+                return handler
+        return None
+
+    async def acquire(self, *channels: str) -> None:
+        async with self.lock:
+            new = [c for c in channels if not self.refs.get(c)]
+            for c in channels:
+                self.refs[c] = self.refs.get(c, 0) + 1
+            if not new:
+                return
+            if self.subscription is None:
+                self.subscription = await self.transport.subscribe(*new)
+                self.task = asyncio.create_task(self._read(self.subscription))
+            else:
+                await self.subscription.subscribe(*new)
+            print(f"[Controller] Subscribed to {', '.join(new)} on {self.transport.name}")
+
+    async def release(self, *channels: str) -> None:
+        async with self.lock:
+            gone = []
+            for c in channels:
+                self.refs[c] = self.refs.get(c, 0) - 1
+                if self.refs[c] <= 0:
+                    del self.refs[c]
+                    gone.append(c)
+            if not gone or self.subscription is None:
+                return
+            print(f"[Controller] Unsubscribed from {', '.join(gone)}")
+            if self.refs:
+                await self.subscription.unsubscribe(*gone)
+            else:
+                await self._close()
+
+    async def _read(self, subscription: Subscription) -> None:
+        try:
+            async for message in subscription:
+                handler = self.handler(message.channel)
+                if handler is None:
+                    continue
+                try:
+                    await handler(message)
+                except Exception as e:
+                    # One malformed message must not take the reader down
+                    print(f"[Controller] Dropping message on {message.channel}: {e}")
+        except asyncio.CancelledError:
+            pass
+
+    async def _close(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+        if self.subscription is not None:
+            await self.subscription.close()
+        self.task = None
+        self.subscription = None
+
+    async def close(self) -> None:
+        async with self.lock:
+            self.refs.clear()
+            await self._close()
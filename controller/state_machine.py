@@ -1,12 +1,26 @@
 from __future__ import annotations
 import asyncio
 import json
-import redis.asyncio as aioredis
-from utils.constants import CHANNEL_STATE,CHANNEL_CLASSIFIER
-from utils.config import REDIS_URL, DEFAULT_FREQ, DEFAULT_FREQ2
+from typing import Dict, List, Optional
+from utils.constants import CHANNEL_STATE,CHANNEL_CLASSIFIER, CHUNK_DURATION_S, station_id, stream_channel
+from utils.config import REDIS_URL, DEFAULT_FREQ, DEFAULT_FREQ2, CLASSIFY_STRIDE_S, FSM_LABELS_PER_DECISION
+from utils.latency import latency
+from utils.transport import Publisher, Subscription, Transport, make_transport
 
 class StateMachine:
-    """Finite state machine reacting to classifier output."""
+    """
+    Finite state machine reacting to classifier output.
+
+    With per_station the labels come from each station's own classifier
+    channel (wideband mode): the current station drives the transitions, and
+    a switch to the other station is held back while that station is
+    itself classified as an ad.
+
+    The classifier labels a window every stride, and consecutive windows
+    mostly overlap. A label only counts once labels_per_decision equal ones
+    arrived in a row, so each transition is backed by a full window of new
+    audio. Labels of audio from before the last retune are ignored.
+    """
 
     STATE_PRIMARY = "primary"
     STATE_SECONDARY = "secondary"
@@ -21,43 +35,76 @@ class StateMachine:
         state_channel: str = CHANNEL_STATE,
         classifier_channel: str= CHANNEL_CLASSIFIER,
         station_primary: float = DEFAULT_FREQ,
-        station_secondary: float = DEFAULT_FREQ2
+        station_secondary: float = DEFAULT_FREQ2,
+        per_station: bool = False,
+        transport: Optional[Transport] = None,
+        labels_per_decision: int = FSM_LABELS_PER_DECISION,
     ) -> None:
         self.redis_url = redis_url
         self.state_channel = state_channel
         self.classifier_channel = classifier_channel
-        self.redis: aioredis.Redis | None = None
-        self.pubsub: aioredis.client.PubSub | None = None
+        self.owns_transport = transport is None
+        self.transport: Transport = transport or make_transport(redis_url=redis_url)
+        self.publisher = Publisher(self.transport, "FSM")
+        self.subscription: Subscription | None = None
         self.state: str = "primary"
         self.station_primary: float = station_primary
         self.station_secondary: float = station_secondary
         self.current_station: float = station_primary
+        self.per_station = per_station
+        # Latest label of every station, only filled in per_station mode
+        self.station_labels: Dict[float, str] = {}
+        self.channels: Dict[str, float] = {}
+        self.labels_per_decision = labels_per_decision or max(1, round(CHUNK_DURATION_S / CLASSIFY_STRIDE_S))
+        # Current run of equal labels from the current station
+        self.streak_label: Optional[str] = None
+        self.streak = 0
+        if per_station:
+            self.channels = {
+                stream_channel(classifier_channel, station_id(f)): f for f in (station_primary, station_secondary)
+            }
+
+    @property
+    def subscriptions(self) -> List[str]:
+        return list(self.channels) if self.per_station else [self.classifier_channel]
 
     async def connect(self) -> None:
-        self.redis = aioredis.from_url(self.redis_url)
-        self.pubsub = self.redis.pubsub()
-        await self.pubsub.subscribe(self.classifier_channel)
-        print(f"[FSM] Subscribed to classifier channel '{self.classifier_channel}'")
+        # No consumer group: the FSM acts on live labels only, stale ones are not replayed
+        self.subscription = await self.transport.subscribe(*self.subscriptions)
+        print(f"[FSM] Subscribed to classifier channels {self.subscriptions}")
 
     async def run(self) -> None:
         """Main event loop — read classifier labels and update FSM."""
         await self.connect()
-        assert self.pubsub is not None
+        assert self.subscription is not None
         try:
-            async for message in self.pubsub.listen():
-                if message["type"] != "message":
-                    continue
-                payload = json.loads(message["data"])
+            async for message in self.subscription:
+                payload = json.loads(message.data)
                 label = payload["label"]
-                await self.handle_label(label)
+                if self.per_station:
+                    station = self.channels.get(message.channel)
+                    if station is None:
+                        continue
+                    self.station_labels[station] = label
+                    if station != self.current_station:
+                        continue
+                elif payload.get("station") and abs(payload["station"] - self.current_station) > 1.0:
+                    # Still the old station's audio, classified before the retune reached the classifier
+                    continue
+                await self.handle_label(label, payload.get("capture_ns", 0))
         except asyncio.CancelledError:
             pass
         finally:
-            if self.pubsub: await self.pubsub.unsubscribe(self.classifier_channel)
-            if self.redis: await self.redis.close()
+            if self.subscription: await self.subscription.close()
+            if self.owns_transport: await self.transport.close()
 
-    async def handle_label(self, label: str) -> None:
-        """State transition logic."""
+    async def handle_label(self, label: str, capture_ns: int = 0) -> None:
+        """State transition logic, capture_ns is when the classified audio was captured."""
+        self.streak = self.streak + 1 if label == self.streak_label else 1
+        self.streak_label = label
+        if self.streak < self.labels_per_decision:
+            return
+        self.streak = 0
         prev_state = self.state
         prev_station = self.current_station
 
@@ -76,21 +123,29 @@ class StateMachine:
             (self.state, self.current_station)
         )
 
+        # No point switching to a station that is known to be in an ad break too
+        if new_station != self.current_station and self.station_labels.get(new_station) == self.AD_LABEL:
+            print(f"[FSM] Holding {self.state}, {new_station/1e6:.3f} MHz is also on an ad")
+            return
+
         self.state = new_state
+        if new_station != self.current_station:
+            # The new station's labels start their own run
+            self.streak_label = None
         self.current_station = new_station
 
         # Broadcast when either state or station changes
         if self.state != prev_state or self.current_station != prev_station:
             print(f"[FSM] Transition: {prev_state} → {self.state}")
-            await self.broadcast_state()
+            latency.record_since("decision", capture_ns)
+            await self.broadcast_state(capture_ns)
 
-    async def broadcast_state(self) -> None:
+    async def broadcast_state(self, capture_ns: int = 0) -> None:
         """Publish updated FSM state for the UI."""
-        if not self.redis:
-            return
         payload = json.dumps({
             "state": self.state,
-            "station": self.current_station
+            "station": self.current_station,
+            "capture_ns": capture_ns,
         })
-        await self.redis.publish(self.state_channel, payload)
+        await self.publisher.publish(self.state_channel, payload)
 
@@ -1,82 +1,224 @@
 from __future__ import annotations
+import time
+STARTED = time.perf_counter()
+
 import asyncio
 import argparse
-import redis.asyncio as aioredis
 import json
-from controller.state_machine import StateMachine
-from classifier.cnn_classifier import Classifier
-from receiver.fm_streamer import Streamer
-from utils.config import DEFAULT_FREQ, DEFAULT_FREQ2, DEFAULT_GAIN, REDIS_URL
-from utils.constants import CHANNEL_STATE
+import signal
+import socket
+import sys
+from typing import TYPE_CHECKING, Coroutine, Dict, List, Sequence
+from receiver.replay import add_replay_args, replay_from_args
+from utils.config import DEFAULT_FREQ, DEFAULT_FREQ2, DEFAULT_GAIN, TRANSPORT, CLASSIFIER_WORKERS, ROLE_CPUS
+from utils.latency import latency
+from utils.redis_pool import close_pools
+from utils.transport import Transport, make_transport
+from utils.constants import CHANNEL_STATE, station_id
+from utils.supervisor import RoleProcess, Supervisor, parse_role_cpus, role_argv
+
+# torch and GNU Radio take seconds to import, components are imported where they are built
+if TYPE_CHECKING:
+    from classifier.cnn_classifier import Classifier
+    from controller.state_machine import StateMachine
+    from receiver.fm_streamer import Streamer
 
-async def monitor_state(streamer: Streamer) -> None:
+ROLES = ("streamer", "classifier", "fsm", "controller")
+
+async def monitor_state(streamer: Streamer, transport: Transport) -> None:
     """Subscribe to state machine channel and retune SDR when station changes."""
-    redis = aioredis.from_url(REDIS_URL)
-    pubsub = redis.pubsub()
-    await pubsub.subscribe(CHANNEL_STATE)
+    subscription = await transport.subscribe(CHANNEL_STATE)
     print(f"[Main] Listening for FSM state updates on '{CHANNEL_STATE}'")
 
     try:
-        async for message in pubsub.listen():
-            if message["type"] != "message":
-                continue
-            data = json.loads(message["data"].decode("utf-8"))
+        async for message in subscription:
+            data = json.loads(message.data.decode("utf-8"))
             new_freq = data.get("station")
             state = data.get("state")
 
             #Avoid floating point precision errors
             if new_freq and abs(streamer.freq - new_freq) > 1.0:
                 await streamer.tune(new_freq)
+                latency.record_since("retune", data.get("capture_ns", 0))
                 print(f"[Main] FSM → state={state}, station={new_freq/1e6:.3f} MHz")
     except asyncio.CancelledError:
         pass
     finally:
-        await pubsub.unsubscribe(CHANNEL_STATE)
-        await redis.close()
+        await subscription.close()
         print("[Main] Stopped monitoring state machine.")
 
 
-async def main(args) -> None:
-    # Instantiate components with CLI args
-    streamer = Streamer(
+def build_streamer(args, transport: Transport) -> Streamer:
+    replay = replay_from_args(args)
+    if args.wideband:
+        # Both stations demodulated and classified from one capture
+        from receiver.wideband_streamer import WidebandStreamer
+        return WidebandStreamer(
+            [args.primary, args.secondary],
+            center=args.center,
+            gain=float(DEFAULT_GAIN),
+            play_audio=not args.no_audio,
+            replay=replay,
+            transport=transport,
+        )
+    from receiver.fm_streamer import Streamer
+    return Streamer(
         freq=args.primary,
         gain=float(DEFAULT_GAIN),
-        play_audio=not args.no_audio
+        play_audio=not args.no_audio,
+        replay=replay,
+        transport=transport,
     )
-    classifier = Classifier()
-    state_machine = StateMachine(
+
+
+def build_classifier(args, transport: Transport) -> Classifier:
+    """Classifier for this worker: in wideband mode worker i of n takes every n-th station."""
+    # Same consumer name after a restart, the streams transport then redelivers its unacknowledged audio
+    consumer = f"{socket.gethostname()}-classifier-{args.worker}"
+    if args.wideband:
+        from classifier.batch_classifier import BatchClassifier
+        stations = [args.primary, args.secondary][args.worker::args.workers]
+        return BatchClassifier([station_id(f) for f in stations], transport=transport, consumer=consumer)
+    from classifier.cnn_classifier import Classifier
+    return Classifier(transport=transport, consumer=consumer)
+
+
+def build_state_machine(args, transport: Transport) -> StateMachine:
+    from controller.state_machine import StateMachine
+    return StateMachine(
         station_primary=args.primary,
-        station_secondary=args.secondary
+        station_secondary=args.secondary,
+        per_station=args.wideband,
+        transport=transport,
     )
 
-    # Tasks
-    streamer_task = asyncio.create_task(streamer.start())
-    classifier_task = asyncio.create_task(classifier.run())
-    state_machine_task = asyncio.create_task(state_machine.run())
-    monitor_task = asyncio.create_task(monitor_state(streamer))
 
+async def run_components(coros: Sequence[Coroutine]) -> None:
+    """
+    Run component coroutines until SIGINT/SIGTERM or until one of them fails,
+    then cancel the rest and let their cleanup run. A failure is re-raised.
+    """
+    loop = asyncio.get_running_loop()
+    tasks = [asyncio.create_task(c) for c in coros]
+
+    def stop(sig: signal.Signals) -> None:
+        print(f"\n[Main] {sig.name}, shutting down...")
+        for t in tasks:
+            t.cancel()
+
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop, sig)
     try:
-        await asyncio.gather(
-            streamer_task,
-            classifier_task,
-            state_machine_task,
-            monitor_task
-        )
-    except KeyboardInterrupt:
-        print("\n[Main] KeyboardInterrupt, shutting down...")
-        await streamer.stop()
-        for t in (streamer_task, classifier_task, state_machine_task, monitor_task):
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        for t in pending:
             t.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        for t in done:
+            if not t.cancelled() and t.exception() is not None:
+                raise t.exception()
     finally:
-        await asyncio.sleep(0.1)
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.remove_signal_handler(sig)
+
+
+async def main(args) -> None:
+    """Run one role (args.role), or every component in this process when no role is given."""
+    # One transport (and Redis connection pool) shared by every component
+    transport = make_transport(args.transport)
+    coros: List[Coroutine] = []
+    if args.role in (None, "streamer"):
+        streamer = build_streamer(args, transport)
+        coros += [streamer.start(), monitor_state(streamer, transport)]
+    if args.role in (None, "classifier"):
+        coros.append(build_classifier(args, transport).run())
+    if args.role in (None, "fsm"):
+        coros.append(build_state_machine(args, transport).run())
+    print(f"[Main] {args.role or 'Components'} built {time.perf_counter() - STARTED:.2f} s after start")
+
+    # Stage latencies of this process go to the log and the controller's /metrics
+    latency.start_reporting(transport, args.role or "main")
+    try:
+        await run_components(coros)
+    finally:
+        latency.stop_reporting()
+        await transport.close()
+        await close_pools()
         print("[Main] Cleanup complete.")
 
 
+def strip_options(argv: Sequence[str], options: Dict[str, int]) -> List[str]:
+    """argv without the given options, mapped to how many values each takes."""
+    out: List[str] = []
+    skip = 0
+    for arg in argv:
+        if skip:
+            skip -= 1
+        elif arg.split("=", 1)[0] in options:
+            skip = options[arg.split("=", 1)[0]] if "=" not in arg else 0
+        else:
+            out.append(arg)
+    return out
+
+
+def supervise(args, argv: Sequence[str]) -> int:
+    """--role all: every role in its own supervised process."""
+    if args.transport == "memory":
+        print("[Main] The memory transport only works in one process, run without --role")
+        return 2
+    passthrough = strip_options(argv, {"--role": 1, "--workers": 1, "--worker": 1, "--pin": 0})
+    # Classifier workers split the stations, more workers than streams would duplicate work
+    workers = min(args.workers, 2 if args.wideband else 1)
+    if workers < args.workers:
+        print(f"[Main] {args.workers} classifier workers requested, {workers} stream(s) to classify, starting {workers}")
+    pins = parse_role_cpus(ROLE_CPUS) if args.pin else {}
+
+    roles = [RoleProcess("controller", role_argv("controller", passthrough), pins.get("controller", []))]
+    roles.append(RoleProcess("streamer", role_argv("streamer", passthrough), pins.get("streamer", [])))
+    classifier_cpus = pins.get("classifier", [])
+    for i in range(workers):
+        # Pinned workers split the classifier CPUs and size their torch pool to their share
+        cpus = classifier_cpus[i::workers]
+        env = {"CLASSIFIER_TORCH_THREADS": str(len(cpus))} if cpus else {}
+        extra = ["--worker", str(i), "--workers", str(workers)]
+        roles.append(RoleProcess(f"classifier-{i}", role_argv("classifier", passthrough, extra), cpus, env))
+    roles.append(RoleProcess("fsm", role_argv("fsm", passthrough), pins.get("fsm", [])))
+    return Supervisor(roles).run()
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="SDR Processor pipeline")
     parser.add_argument("--no-audio", action="store_true", help="Run without playing audio")
     parser.add_argument("--primary", type=float, default=DEFAULT_FREQ, help="Primary station frequency (Hz)")
     parser.add_argument("--secondary", type=float, default=DEFAULT_FREQ2, help="Secondary station frequency (Hz)")
+    parser.add_argument("--wideband", action="store_true",
+                        help="Demodulate and classify both stations from one wideband capture")
+    parser.add_argument("--center", type=float, default=None,
+                        help="Wideband capture center (Hz), planned from the stations by default")
+    parser.add_argument("--transport", choices=["pubsub", "streams", "memory"], default=TRANSPORT,
+                        help="Message transport between components")
+    parser.add_argument("--role", choices=ROLES + ("all",), default=None,
+                        help="Run one role, or 'all' of them as supervised processes "
+                             "(default: every component except the controller in this process)")
+    parser.add_argument("--workers", type=int, default=CLASSIFIER_WORKERS,
+                        help="Classifier processes with --role all (at most one per stream)")
+    parser.add_argument("--worker", type=int, default=0, help=argparse.SUPPRESS)
+    parser.add_argument("--pin", action="store_true", help="Pin role processes to the CPUs in ROLE_CPUS")
+    parser.add_argument("--port", type=int, default=8000, help="Controller port")
+    add_replay_args(parser)
     args = parser.parse_args()
 
-    asyncio.run(main(args))
+    if args.role == "all":
+        sys.exit(supervise(args, sys.argv[1:]))
+    if args.role == "controller":
+        import uvicorn
+        from controller.controller import app
+        # Same transport as the pipeline roles, --transport included
+        app.state.transport = args.transport
+        uvicorn.run(app, port=args.port)
+        sys.exit(0)
+    try:
+        asyncio.run(main(args))
+    except Exception as e:
+        # Non-zero exit lets the supervisor restart the role
+        print(f"[Main] {args.role or 'Pipeline'} failed: {e!r}")
+        sys.exit(1)
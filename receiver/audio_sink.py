@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+from typing import Callable
+import numpy as np
+from gnuradio import gr # type: ignore
+
+class AudioBlockSink(gr.sync_block):
+    """
+    GNU Radio sink that cuts the float32 audio stream into fixed-size numpy blocks.
+
+    work() copies the scheduler's input buffer straight into a preallocated
+    block (no per-sample Python objects) and calls on_block with every block
+    that fills up. on_block runs on the GNU Radio scheduler thread, so it must
+    only hand the block off, e.g. with loop.call_soon_threadsafe. Each block
+    is a fresh array owned by the receiver.
+
+    Args:
+        block_size: Samples per block (BATCH_MS of audio)
+        on_block: Called with each full float32 block
+    """
+    def __init__(self, block_size: int, on_block: Callable[[np.ndarray], None]) -> None:
+        gr.sync_block.__init__(self, name="audio_block_sink", in_sig=[np.float32], out_sig=None)
+        self.block_size = int(block_size)
+        self.on_block = on_block
+        self._block = np.empty(self.block_size, dtype=np.float32)
+        self._fill = 0
+
+    def work(self, input_items, output_items) -> int:
+        samples = input_items[0]
+        pos = 0
+        while pos < samples.size:
+            take = min(self.block_size - self._fill, samples.size - pos)
+            self._block[self._fill:self._fill + take] = samples[pos:pos + take]
+            self._fill += take
+            pos += take
+            if self._fill == self.block_size:
+                self.on_block(self._block)
+                self._block = np.empty(self.block_size, dtype=np.float32)
+                self._fill = 0
+        return samples.size
@@ -1,10 +1,12 @@
 from __future__ import annotations
 
 import time
-from typing import Any
+from math import gcd
+from typing import Any, Optional
 import numpy as np
 from gnuradio import analog, audio, blocks, filter, gr # type: ignore
-import osmosdr # type: ignore
+from utils.constants import RAW_SAMPLE_RATE
+from .replay import IQ_RATE, ReplaySource
 
 def measure_power(src: Any, dwell: float = 0.05) -> float:
     '''
@@ -37,33 +39,18 @@ def fine_scan(src: Any, base_freq: float, span: float = 10e3, step: float = 2e3,
     return best_offset
 
 
-class FMRx(gr.top_block):
-    """
-    GNU Radio FM receive chain -> 48 kHz audio (deemphasized).
+class RxFlowgraph(gr.top_block):
+    """Source and demodulation building blocks shared by FMRx and WidebandRx."""
+    src: Optional[Any] = None
 
-    Args:
-        freq: RF center frequency in Hz
-        gain: RF gain (ignored if AGC is enabled)
-        ppm: PPM correction from `rtl_test -p`
-        outfile: Optional WAV path to record audio
-        play_audio: If True, route audio to the system sink
-        auto_fine: If True, sweep around freq to maximize power
-    """
-    def __init__(
-                    self,
-                    freq: float,
-                    gain: float,
-                    ppm: float = 0.0,
-                    outfile: str | None = None,
-                    play_audio: bool = True,
-                    auto_fine: bool = False,
-                ) -> None:
-        super().__init__()
+    def _sdr_source(self, freq: float, gain: float, ppm: float, auto_fine: bool = False, rate: float = IQ_RATE) -> Any:
+        """Open the RTL-SDR at `rate` tuned to freq."""
+        import osmosdr # type: ignore
 
         freq_hw = freq / (1.0 - ppm / 1e6) # PPM correction
 
         self.src = osmosdr.source(args="numchan=1")
-        self.src.set_sample_rate(240e3)
+        self.src.set_sample_rate(rate)
         try:
             self.src.set_gain_mode(True)
         except Exception:
@@ -75,32 +62,126 @@ class FMRx(gr.top_block):
             freq_hw += fine_off
             print(f"[FMRx] Fine-tuned by {fine_off:+.0f} Hz -> {freq_hw/1e6:.6f} MHz")
 
-
         self.src.set_center_freq(freq_hw)
+        return self.src
+
+    def _iq_source(self, replay: ReplaySource, rate: float = IQ_RATE) -> Any:
+        """Complex IQ at `rate` from a cu8/cf32 recording."""
+        path = str(replay.path)
+        if replay.fmt == "cu8":
+            # rtl_sdr writes interleaved unsigned bytes centred on 127.5
+            self.file_src = blocks.file_source(gr.sizeof_char, path, replay.repeat)
+            to_float = blocks.uchar_to_float()
+            center = blocks.add_const_ff(-127.5)
+            scale = blocks.multiply_const_ff(1.0 / 127.5)
+            deinterleave = blocks.deinterleave(gr.sizeof_float)
+            iq = blocks.float_to_complex()
+            self.connect(self.file_src, to_float, center, scale, deinterleave)
+            self.connect((deinterleave, 0), (iq, 0))
+            self.connect((deinterleave, 1), (iq, 1))
+        else:
+            self.file_src = blocks.file_source(gr.sizeof_gr_complex, path, replay.repeat)
+            iq = self.file_src
+
+        if replay.realtime:
+            throttle = blocks.throttle(gr.sizeof_gr_complex, replay.iq_rate)
+            self.connect(iq, throttle)
+            iq = throttle
+
+        if int(replay.iq_rate) != int(rate):
+            g = gcd(int(rate), int(replay.iq_rate))
+            resample = filter.rational_resampler_ccc(interpolation=int(rate) // g, decimation=int(replay.iq_rate) // g)
+            self.connect(iq, resample)
+            iq = resample
+        print(f"[FMRx] Replaying {replay.fmt} IQ from {replay.path} @ {replay.iq_rate/1e3:.0f} kS/s")
+        return iq
+
+    def _wav_source(self, replay: ReplaySource) -> Any:
+        """48 kHz demodulated audio from a wav recording (first channel)."""
+        self.file_src = blocks.wavfile_source(str(replay.path), replay.repeat)
+        rate = int(self.file_src.sample_rate())
+        if rate != RAW_SAMPLE_RATE:
+            raise ValueError(f"Replay wav must be {RAW_SAMPLE_RATE} Hz, {replay.path} is {rate} Hz")
+        out = self.file_src
+        if replay.realtime:
+            out = blocks.throttle(gr.sizeof_float, RAW_SAMPLE_RATE)
+            self.connect((self.file_src, 0), out)
+        print(f"[FMRx] Replaying demodulated audio from {replay.path}")
+        return out
 
+    def _demodulate(self, iq: Any) -> Any:
+        """IQ_RATE complex baseband -> 48 kHz deemphasized audio, returns the last block."""
         #Fight clicking with high pass filter
         #TODO: Consider sampling off frequency and then resampling as an alternative, thats how RTL_FM does it.
-        self.dcblock = filter.dc_blocker_cc(1024, True)
+        dcblock = filter.dc_blocker_cc(1024, True)
         #Convert IQ to normalized floats
-        self.wbfm = analog.wfm_rcv(quad_rate=240e3, audio_decimation=5)
+        wbfm = analog.wfm_rcv(quad_rate=IQ_RATE, audio_decimation=5)
         #Fight hiss by pushing down high frequencies
-        self.deemph = analog.fm_deemph(fs=48000, tau=75e-6)
+        deemph = analog.fm_deemph(fs=RAW_SAMPLE_RATE, tau=75e-6)
+        self.connect(iq, dcblock, wbfm, deemph)
+        return deemph
+
+
+class FMRx(RxFlowgraph):
+    """
+    GNU Radio FM receive chain -> 48 kHz audio (deemphasized).
+
+    With `replay` the RTL-SDR is not opened: IQ recordings are fed through the
+    same demodulation chain and demodulated wavs straight to the audio
+    output, so everything downstream runs without hardware. Consumers attach
+    to `audio_out` in either mode.
+
+    Args:
+        freq: RF center frequency in Hz
+        gain: RF gain (ignored if AGC is enabled)
+        ppm: PPM correction from `rtl_test -p`
+        outfile: Optional WAV path to record audio
+        play_audio: If True, route audio to the system sink
+        auto_fine: If True, sweep around freq to maximize power
+        replay: Optional recording to play instead of the RTL-SDR
+    """
+    def __init__(
+                    self,
+                    freq: float,
+                    gain: float,
+                    ppm: float = 0.0,
+                    outfile: str | None = None,
+                    play_audio: bool = True,
+                    auto_fine: bool = False,
+                    replay: Optional[ReplaySource] = None,
+                ) -> None:
+        super().__init__()
+
+        self.replay = replay
+        self.src: Optional[Any] = None
+        if replay is not None and replay.fmt == "wav":
+            self.audio_out = self._wav_source(replay)
+        else:
+            iq = self._iq_source(replay) if replay is not None else self._sdr_source(freq, gain, ppm, auto_fine)
+            self.deemph = self._demodulate(iq)
+            self.audio_out = self.deemph
 
         #Save audio to .wav file
         if outfile:
             self.wav_sink = blocks.wavfile_sink(
-                outfile, 1, 48000,
+                outfile, 1, RAW_SAMPLE_RATE,
                 blocks.wavfile_format_t.FORMAT_WAV,
                 blocks.wavfile_subformat_t.FORMAT_PCM_16
             )
-            self.connect(self.deemph, self.wav_sink)
+            self.connect(self.audio_out, self.wav_sink)
 
         #Play audio through speakers
         if play_audio:
             try:
-                self.audio = audio.sink(48000, "", True)
-                self.connect(self.deemph, self.audio)
+                # Replays faster than real time must not block on the sound card
+                self.audio = audio.sink(RAW_SAMPLE_RATE, "", replay is None or replay.realtime)
+                self.connect(self.audio_out, self.audio)
             except Exception as e:
                 print(f"[FMRx] Warning: Audio sink unavailable: {e}")
 
-        self.connect(self.src, self.dcblock, self.wbfm, self.deemph)
+    def set_center_freq(self, freq: float) -> bool:
+        """Retune the SDR, returns False (no-op) when replaying a recording."""
+        if self.src is None:
+            return False
+        self.src.set_center_freq(freq)
+        return True
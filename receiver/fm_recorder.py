@@ -3,6 +3,7 @@ from __future__ import annotations
 import argparse
 
 from .fm_receiver import FMRx
+from .replay import add_replay_args, replay_from_args
 
 def main() -> None:
     """Create and run the Rx via CLI."""
@@ -13,6 +14,7 @@ def main() -> None:
     parser.add_argument("--outfile", type=str, default=None, help="Optional WAV output file")
     parser.add_argument("--play-audio", action="store_true", help="Enable live audio playback")
     parser.add_argument("--auto-fine", action="store_true", help="Sweep locally to maximize signal")
+    add_replay_args(parser)
 
     args = parser.parse_args()
 
@@ -23,11 +25,15 @@ def main() -> None:
         outfile=args.outfile,
         play_audio=args.play_audio,
         auto_fine=args.auto_fine,
+        replay=replay_from_args(args),
     )
 
-    hw_freq = float(rx.src.get_center_freq())
-    print(f"Requested {args.freq/1e6:.6f} MHz | Receiver tuned to {hw_freq/1e6:.6f} MHz")
-    print(f"PPM={args.ppm:+.0f}, Gain={args.gain} dB")
+    if rx.src is not None:
+        hw_freq = float(rx.src.get_center_freq())
+        print(f"Requested {args.freq/1e6:.6f} MHz | Receiver tuned to {hw_freq/1e6:.6f} MHz")
+        print(f"PPM={args.ppm:+.0f}, Gain={args.gain} dB")
+    else:
+        print(f"Replaying {args.replay}")
     if args.outfile:
         print(f"Recording -> {args.outfile}")
     if args.play_audio:
@@ -1,17 +1,37 @@
 from __future__ import annotations
 
 import asyncio
-from typing import Optional
+import queue
+import time
+from typing import Any, Dict, List, Optional, Tuple
 import numpy as np
-import redis.asyncio as aioredis # type: ignore
-from gnuradio import blocks # type: ignore
-from utils.constants import BATCH_MS, RAW_SAMPLE_RATE, CHANNEL_AUDIO
-from utils.config import REDIS_URL
-from .fm_receiver import FMRx
+from utils.constants import BATCH_MS, RAW_SAMPLE_RATE, SAMPLE_RATE, CHANNEL_AUDIO, station_id
+from utils.config import REDIS_URL, RESAMPLE_STAGE
+from utils.audio_frame import encode_audio
+from utils.latency import latency
+from utils.queues import DropOldestQueue
+from utils.resampler import PolyphaseResampler
+from utils.transport import Publisher, Transport, make_transport
+from .replay import ReplaySource
+
+# Blocks buffered between the GNU Radio thread and the publisher (5 s at 100 ms)
+QUEUE_BLOCKS = 50
 
 class Streamer:
     """
-    Streams 100ms batches of demodulated FM audio samples into an redis broadcast.
+    Streams 100ms batches of demodulated FM audio samples into an redis broadcast
+    (or whichever transport is configured).
+
+    An AudioBlockSink on the GNU Radio thread cuts the audio into batches and
+    hands them to the event loop through a queue, so the publisher awaits new
+    audio instead of polling for it. With `replay` a recording stands in for
+    the RTL-SDR and the stream ends with the file (unless it loops).
+
+    Live audio cannot wait, so a publisher that falls behind loses the oldest
+    batches. A replay that is not paced in real time (--replay-fast) is paced
+    by the publisher instead: the GNU Radio thread blocks on a bounded queue
+    and every batch is published with an awaited round trip, so nothing is
+    dropped and the run measures the whole pipeline.
     """
 
     def __init__(
@@ -21,67 +41,172 @@ class Streamer:
                 play_audio: bool = False,
                 redis_url: str = REDIS_URL,
                 channel: str = CHANNEL_AUDIO,
+                resample_stage: str = RESAMPLE_STAGE,
+                replay: Optional[ReplaySource] = None,
+                transport: Optional[Transport] = None,
     ) -> None:
         self.freq = freq
         self.gain = gain
         self.play_audio = play_audio
         self.redis_url = redis_url
         self.channel = channel
+        self.replay = replay
 
+        # Decimate to the model rate before publishing unless the classifier does it
+        # (one resampler per published channel, each carries its own filter state)
+        self.resamplers: Dict[str, PolyphaseResampler] = {}
+        # Next frame sequence number of every published channel
+        self.seqs: Dict[str, int] = {}
+        self.sample_rate = RAW_SAMPLE_RATE
+        if resample_stage == "streamer":
+            self.sample_rate = SAMPLE_RATE
+        elif resample_stage != "classifier":
+            raise ValueError(f"Unknown resample stage '{resample_stage}', expected 'streamer' or 'classifier'")
 
-        self.rx: Optional[FMRx] = None # type: ignore
+
+        self.rx: Optional[Any] = None # type: ignore
         self.running: bool = False # type: ignore
-        self.redis: Optional[aioredis.Redis] = None # type: ignore
+        self.owns_transport = transport is None
+        self.transport: Transport = transport or make_transport(redis_url=redis_url)
+        # Frames are submitted without waiting, a slow server gets them pipelined in batches
+        # (fast replays await each publish instead, see handoff)
+        self.publisher = Publisher(self.transport, "Streamer")
+        self.queue: DropOldestQueue = DropOldestQueue(QUEUE_BLOCKS)
+        # Blocking handoff with backpressure for replays run as fast as possible
+        self.handoff: Optional[queue.Queue] = None
+        if replay is not None and not replay.realtime:
+            self.handoff = queue.Queue(QUEUE_BLOCKS)
 
     async def start(self) -> None:
         """Start the FM receiver and publish audio batches."""
+        # GNU Radio is only imported once a flowgraph is actually built
+        from .audio_sink import AudioBlockSink
         self.running = True
-        self.redis = aioredis.from_url(self.redis_url, decode_responses=False)
-        self.rx = FMRx(freq=self.freq, gain=self.gain, outfile=None, play_audio=self.play_audio)
-
-
-        audio_source = blocks.vector_sink_f()
-        self.rx.connect(self.rx.deemph, audio_source)
-        self.rx.start()
-        print(f"[Streamer] Streaming audio @ {RAW_SAMPLE_RATE} Hz, {BATCH_MS} ms batches")
-
+        self.rx = self.build_rx()
 
+        loop = asyncio.get_running_loop()
         batch_size = int(RAW_SAMPLE_RATE * BATCH_MS / 1000)
-        buffer = np.zeros(0, dtype=np.float32)
-
+        for channel, audio_out in self.audio_outputs().items():
+            # Batches are stamped on the GNU Radio thread, as close to capture as we get
+            if self.handoff is not None:
+                on_block = lambda block, c=channel: self.put_blocking((c, block, time.time_ns()))
+            else:
+                on_block = lambda block, c=channel: loop.call_soon_threadsafe(self.enqueue, (c, block, time.time_ns()))
+            audio_sink = AudioBlockSink(batch_size, on_block)
+            self.rx.connect(audio_out, audio_sink)
+        self.rx.start()
+        if self.replay is not None and not self.replay.repeat:
+            # The flowgraph finishes at the end of the recording
+            if self.handoff is not None:
+                loop.run_in_executor(None, self.finish_blocking)
+            else:
+                done = loop.run_in_executor(None, self.rx.wait)
+                done.add_done_callback(lambda _: self.enqueue(None))
+        print(f"[Streamer] Streaming audio @ {self.sample_rate} Hz, {BATCH_MS} ms batches")
 
         try:
             while self.running:
-                samples = np.asarray(audio_source.data(), dtype=np.float32)
-                audio_source.reset()
-
-                if samples.size == 0:
-                    await asyncio.sleep(0.01)
-                    continue
-
-                buffer = np.concatenate((buffer, samples))
-
-                while buffer.size >= batch_size:
-                    batch, buffer = buffer[:batch_size], buffer[batch_size:]
-                    assert self.redis is not None
-                    await self.redis.publish(self.channel, batch.tobytes())
+                if self.handoff is not None:
+                    item = await loop.run_in_executor(None, self.handoff.get)
+                else:
+                    item = await self.queue.get()
+                if item is None:
+                    break
+                channel, batch, capture_ns = item
+                frames = self.frames(channel, self.resample(channel, batch), capture_ns)
+                if self.handoff is not None:
+                    await self.publisher.publish_many(frames)
+                else:
+                    for out_channel, frame in frames:
+                        self.publisher.submit(out_channel, frame)
+                latency.record_since("publish", capture_ns)
         except asyncio.CancelledError:
             pass
         finally:
+            # Lets a GNU Radio thread waiting on a full handoff return, so the flowgraph can stop
+            self.running = False
             if self.rx is not None:
                 self.rx.stop(); self.rx.wait()
-            if self.redis is not None:
-                await self.redis.close()
-            print("[Streamer] Streamer stopped")
+            # A cancelled get may still be waiting on the handoff in its executor thread
+            self.enqueue(None)
+            await self.publisher.close()
+            if self.owns_transport:
+                await self.transport.close()
+            print(f"[Streamer] Streamer stopped, {self.publisher.summary()}")
     
+    def build_rx(self) -> Any:
+        """The GNU Radio flowgraph to stream from."""
+        from .fm_receiver import FMRx
+        return FMRx(freq=self.freq, gain=self.gain, outfile=None, play_audio=self.play_audio, replay=self.replay)
+
+    def audio_outputs(self) -> Dict[str, Any]:
+        """Channel -> flowgraph block whose 48 kHz audio is published there."""
+        assert self.rx is not None
+        return {self.channel: self.rx.audio_out}
+
+    def resample(self, channel: str, batch: np.ndarray) -> np.ndarray:
+        if self.sample_rate == RAW_SAMPLE_RATE:
+            return batch
+        resampler = self.resamplers.get(channel)
+        if resampler is None:
+            resampler = self.resamplers[channel] = PolyphaseResampler(RAW_SAMPLE_RATE, self.sample_rate)
+        return resampler.process(batch)
+
+    def station(self, channel: str) -> float:
+        """Station frequency whose audio goes to channel."""
+        return self.freq
+
+    def frame(self, channel: str, samples: np.ndarray, capture_ns: int) -> bytes:
+        """Encode samples with the channel's next sequence number."""
+        seq = self.seqs.get(channel, 0)
+        self.seqs[channel] = seq + 1
+        station = self.station(channel)
+        return encode_audio(samples, self.sample_rate, seq, capture_ns, station, station_id(station))
+
+    def frames(self, channel: str, samples: np.ndarray, capture_ns: int) -> List[Tuple[str, bytes]]:
+        """(channel, frame) messages to publish for a batch of channel's audio."""
+        return [(channel, self.frame(channel, samples, capture_ns))]
+
+    def enqueue(self, item: Optional[Tuple[str, np.ndarray, int]]) -> None:
+        """Queue a (channel, batch, capture_ns) for publishing (on the event loop), None wakes the loop to stop."""
+        if self.handoff is not None:
+            if item is None:
+                # Wake a waiting get, a full handoff has nobody waiting
+                try:
+                    self.handoff.put_nowait(None)
+                except queue.Full:
+                    pass
+            return
+        if self.queue.put_drop_oldest(item):
+            print(f"[Streamer] Publisher behind, dropped oldest batch ({self.queue.dropped} total)")
+
+    def put_blocking(self, item: Optional[Tuple[str, np.ndarray, int]]) -> None:
+        """Hand a batch to the publisher, waiting for room (GNU Radio thread, fast replay only)."""
+        assert self.handoff is not None
+        while self.running:
+            try:
+                self.handoff.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def finish_blocking(self) -> None:
+        """Wait for the recording to end, then queue the end of stream behind its last batch."""
+        assert self.rx is not None
+        self.rx.wait()
+        self.put_blocking(None)
+
     async def tune(self, new_freq: float) -> None:
         """Retune the SDR to a new center frequency."""
         if self.rx:
-            print(f"[Streamer] tuning to {new_freq/1e6:.3f} MHz")
-            self.rx.src.set_center_freq(new_freq)
+            if self.rx.set_center_freq(new_freq):
+                print(f"[Streamer] tuning to {new_freq/1e6:.3f} MHz")
+            else:
+                print(f"[Streamer] Replaying, ignoring tune to {new_freq/1e6:.3f} MHz")
             self.freq = new_freq
 
     async def stop(self) -> None:
         """Signal the streaming loop to stop."""
         self.running = False
+        self.enqueue(None)
         await asyncio.sleep(0.05)
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import argparse
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+# Recordings are assumed to be at the receive chain's IQ rate unless told otherwise
+IQ_RATE = 240e3
+
+FORMATS = ("cu8", "cf32", "wav")
+_SUFFIXES = {
+    ".cu8": "cu8", ".bin": "cu8", ".raw": "cu8",
+    ".cf32": "cf32", ".fc32": "cf32", ".cfile": "cf32",
+    ".wav": "wav",
+}
+
+
+@dataclass
+class ReplaySource:
+    """
+    A recording FMRx plays back instead of opening the RTL-SDR.
+
+    Args:
+        path: Recording to play
+        fmt: "cu8" (rtl_sdr interleaved uint8 IQ), "cf32" (complex64 IQ, GNU Radio
+            file sink) or "wav" (already demodulated 48 kHz audio, skips the FM chain)
+        realtime: Pace playback at the recording's rate, else run as fast as possible
+        iq_rate: Sample rate of IQ recordings in Hz
+        repeat: Loop the file instead of ending the stream
+    """
+    path: Path
+    fmt: str
+    realtime: bool = True
+    iq_rate: float = IQ_RATE
+    repeat: bool = False
+
+    @classmethod
+    def from_path(
+        cls,
+        path: str | Path,
+        fmt: Optional[str] = None,
+        realtime: bool = True,
+        iq_rate: float = IQ_RATE,
+        repeat: bool = False,
+    ) -> "ReplaySource":
+        """Build a source, guessing the format from the file suffix when fmt is None."""
+        path = Path(path)
+        if not path.exists():
+            raise FileNotFoundError(f"Replay file {path} not found")
+        fmt = fmt or _SUFFIXES.get(path.suffix.lower())
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown replay format for '{path.name}', pass one of {FORMATS}")
+        return cls(path, fmt, realtime, iq_rate, repeat)
+
+
+def add_replay_args(parser: argparse.ArgumentParser) -> None:
+    """Replay options shared by every entry point that builds an FMRx."""
+    group = parser.add_argument_group("replay", "Play a recording instead of using the RTL-SDR")
+    group.add_argument("--replay", type=str, default=None, help="IQ (.cu8/.cf32) or demodulated .wav recording")
+    group.add_argument("--replay-format", choices=FORMATS, default=None, help="Override the suffix-based format")
+    group.add_argument("--replay-fast", action="store_true", help="Play as fast as possible instead of in real time")
+    group.add_argument("--iq-rate", type=float, default=IQ_RATE, help="Sample rate of IQ recordings (Hz)")
+    group.add_argument("--replay-loop", action="store_true", help="Loop the recording")
+
+
+def replay_from_args(args: argparse.Namespace) -> Optional[ReplaySource]:
+    """ReplaySource for the parsed add_replay_args options, None when not replaying."""
+    if args.replay is None:
+        return None
+    return ReplaySource.from_path(
+        args.replay,
+        fmt=args.replay_format,
+        realtime=not args.replay_fast,
+        iq_rate=args.iq_rate,
+        repeat=args.replay_loop,
+    )
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+from typing import Any, Dict, Optional, Sequence
+from gnuradio import audio, blocks, filter, gr # type: ignore
+from utils.constants import RAW_SAMPLE_RATE
+from utils.config import WIDEBAND_RATE
+from .fm_receiver import RxFlowgraph
+from .replay import IQ_RATE, ReplaySource
+
+# Half of an FM broadcast channel, plus margin so a station never sits on the band edge
+CHANNEL_HALF_BW = 100e3
+# Keep stations off the DC spike at the capture center
+DC_GUARD = 150e3
+
+
+def plan_center(stations: Sequence[float], rate: float = WIDEBAND_RATE) -> float:
+    """
+    Capture center frequency that fits every station inside `rate`.
+    Stations are kept at least DC_GUARD away from the center when the span allows it.
+    """
+    lo, hi = min(stations), max(stations)
+    usable = rate / 2 - CHANNEL_HALF_BW
+    if hi - lo > 2 * usable:
+        raise ValueError(
+            f"Stations span {(hi - lo)/1e6:.3f} MHz, more than fits in a {rate/1e6:.1f} MS/s capture"
+        )
+    center = (lo + hi) / 2
+    for shift in (0.0, DC_GUARD, -DC_GUARD, 2 * DC_GUARD, -2 * DC_GUARD):
+        c = center + shift
+        fits = hi - c <= usable and c - lo <= usable
+        if fits and all(abs(f - c) >= DC_GUARD for f in stations):
+            return c
+    return center
+
+
+class WidebandRx(RxFlowgraph):
+    """
+    Several FM stations demodulated from one wideband capture.
+
+    The RTL-SDR (or an IQ recording captured at the same center) runs at `rate`;
+    each station gets a frequency-translating FIR that shifts it to baseband
+    and decimates to the 240 kHz channel rate, followed by the same
+    demodulation chain as FMRx. Every station has its own 48 kHz audio output
+    in `audio_outs`, so switching stations never retunes the dongle.
+
+    Args:
+        stations: Station frequencies in Hz
+        gain: RF gain (ignored if AGC is enabled)
+        ppm: PPM correction from `rtl_test -p`
+        rate: Capture rate, an integer multiple of the 240 kHz channel rate
+        play_audio: If True, route the selected station to the system sink
+        replay: Optional IQ recording to play instead of the RTL-SDR
+        center: Capture center in Hz, default from plan_center (must match the recording when replaying)
+    """
+    def __init__(
+                    self,
+                    stations: Sequence[float],
+                    gain: float,
+                    ppm: float = 0.0,
+                    rate: float = WIDEBAND_RATE,
+                    play_audio: bool = False,
+                    replay: Optional[ReplaySource] = None,
+                    center: Optional[float] = None,
+                ) -> None:
+        super().__init__()
+        if replay is not None and replay.fmt == "wav":
+            raise ValueError("Wideband mode needs an IQ recording, not demodulated audio")
+        decimation = int(round(rate / IQ_RATE))
+        if decimation < 1 or decimation * IQ_RATE != rate:
+            raise ValueError(f"Wideband rate {rate:.0f} must be a multiple of {IQ_RATE:.0f}")
+
+        self.stations = list(stations)
+        self.rate = rate
+        self.center = center if center is not None else plan_center(self.stations, rate)
+        self.replay = replay
+        iq = self._iq_source(replay, rate) if replay is not None else self._sdr_source(self.center, gain, ppm, rate=rate)
+
+        # One set of taps for every station: pass the 200 kHz channel, stop before the 240 kHz alias
+        taps = filter.firdes.low_pass(1.0, rate, CHANNEL_HALF_BW - 10e3, 30e3)
+        self.audio_outs: Dict[float, Any] = {}
+        for freq in self.stations:
+            channel = filter.freq_xlating_fir_filter_ccf(decimation, taps, freq - self.center, rate)
+            self.connect(iq, channel)
+            self.audio_outs[freq] = self._demodulate(channel)
+        print(f"[WidebandRx] {len(self.stations)} stations from {rate/1e6:.1f} MS/s @ {self.center/1e6:.3f} MHz")
+
+        self.selector: Optional[Any] = None
+        if play_audio:
+            try:
+                self.selector = blocks.selector(gr.sizeof_float, 0, 0)
+                for i, freq in enumerate(self.stations):
+                    self.connect(self.audio_outs[freq], (self.selector, i))
+                self.audio = audio.sink(RAW_SAMPLE_RATE, "", replay is None or replay.realtime)
+                self.connect(self.selector, self.audio)
+            except Exception as e:
+                print(f"[WidebandRx] Warning: Audio sink unavailable: {e}")
+
+    def select(self, freq: float) -> bool:
+        """Route station freq to the speakers, returns False if it is not one of the stations."""
+        matches = [i for i, f in enumerate(self.stations) if abs(f - freq) <= 1.0]
+        if not matches:
+            return False
+        if self.selector is not None:
+            self.selector.set_input_index(matches[0])
+        return True
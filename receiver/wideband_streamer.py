@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from utils.constants import station_id, stream_channel
+from utils.config import WIDEBAND_RATE
+from .fm_streamer import Streamer
+
+class WidebandStreamer(Streamer):
+    """
+    Streams every station of a WidebandRx capture at once.
+
+    Station f is published to `<channel>:<station_id(f)>`, so a BatchClassifier
+    over the same station ids keeps all of them classified. The station
+    currently tuned (freq) is also mirrored on the plain channel for the UI,
+    and tune() only switches that mirror and the speakers.
+
+    Args:
+        stations: Station frequencies in Hz, the first one is tuned initially
+        rate: Capture rate of the wideband receiver
+        center: Capture center in Hz, default planned from the stations
+        **kwargs: Passed to Streamer (freq defaults to the first station)
+    """
+    def __init__(
+        self,
+        stations: Sequence[float],
+        rate: float = WIDEBAND_RATE,
+        center: Optional[float] = None,
+        **kwargs,
+    ) -> None:
+        kwargs.setdefault("freq", stations[0])
+        super().__init__(**kwargs)
+        self.stations = list(stations)
+        self.rate = rate
+        self.center = center
+        self.station_channels: Dict[float, str] = {
+            f: stream_channel(self.channel, station_id(f)) for f in self.stations
+        }
+        self.channel_stations: Dict[str, float] = {c: f for f, c in self.station_channels.items()}
+
+    def build_rx(self) -> Any:
+        from .wideband_receiver import WidebandRx
+        return WidebandRx(
+            self.stations, self.gain, rate=self.rate, play_audio=self.play_audio,
+            replay=self.replay, center=self.center,
+        )
+
+    def audio_outputs(self) -> Dict[str, Any]:
+        assert self.rx is not None
+        return {self.station_channels[f]: out for f, out in self.rx.audio_outs.items()}
+
+    def station(self, channel: str) -> float:
+        return self.channel_stations.get(channel, self.freq)
+
+    def frames(self, channel: str, samples: np.ndarray, capture_ns: int) -> List[Tuple[str, bytes]]:
+        messages = super().frames(channel, samples, capture_ns)
+        # The mirror keeps its own sequence, so a station switch is not a gap
+        if self.channel_stations.get(channel) == self.freq:
+            messages.append((self.channel, self.frame(self.channel, samples, capture_ns)))
+        return messages
+
+    async def tune(self, new_freq: float) -> None:
+        """Switch the mirrored/played station, the capture itself never retunes."""
+        if not (self.rx and self.rx.select(new_freq)):
+            print(f"[Streamer] {new_freq/1e6:.3f} MHz is not in the capture, ignoring tune")
+            return
+        print(f"[Streamer] Switching to {new_freq/1e6:.3f} MHz")
+        self.freq = new_freq
@@ -11,17 +11,10 @@ else
   echo "Redis already running."
 fi
 
-echo "Starting FastAPI controller..."
-uvicorn controller.controller:app --reload --port 8000 &
-FASTAPI_PID=$!
+# --- 2. Start every role (controller, streamer, classifier, FSM) under the supervisor ---
+echo "Starting SDR-Processor roles..."
 
-# --- 3. Start main pipeline ---
-echo "Starting streamer/classifier main..."
-
-# Forward any CLI args (e.g., --no-audio, --primary, --secondary)
-python -m main "$@"
-
-# --- 4. Clean up ---
-echo "Shutting down FastAPI controller..."
-kill $FASTAPI_PID
+# Forward any CLI args (e.g., --no-audio, --primary, --secondary, --workers, --pin)
+# Ctrl-C stops every role cleanly
+python -m main --role all "$@"
 echo "Done."
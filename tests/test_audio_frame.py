@@ -0,0 +1,18 @@
+import numpy as np
+import pytest
+from utils.audio_frame import HEADER_SIZE, decode_frame, encode_audio
+
+
+def test_round_trip():
+    samples = np.linspace(-1, 1, 160, dtype=np.float32)
+    frame = decode_frame(encode_audio(samples, 16000, seq=7, capture_ns=123, station=101.1e6, stream="101.1"))
+    assert frame.sample_rate == 16000 and frame.seq == 7 and frame.capture_ns == 123
+    assert frame.station == 101.1e6 and frame.stream == "101.1"
+    np.testing.assert_array_equal(frame.float32(), samples)
+
+
+@pytest.mark.parametrize("size", [12, 20, HEADER_SIZE - 1])
+def test_truncated_header_raises_value_error(size):
+    data = encode_audio(np.zeros(16, dtype=np.float32), 16000)
+    with pytest.raises(ValueError, match="Truncated"):
+        decode_frame(data[:size])
@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+import torch
+from utils.audio_utils import waveform_to_mel_spectrogram
+from utils.constants import HOP_SIZE, N_MELS, SAMPLE_RATE, WINDOW_SIZE
+from utils.streaming_mel import StreamingMelSpectrogram
+
+# A short window keeps the batch reference cheap, the edge logic is the same as for 10 s
+WINDOW = 2 * SAMPLE_RATE
+TOLERANCE_DB = 1e-3
+
+
+def make_signal(seconds: float, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    n = int(SAMPLE_RATE * seconds)
+    t = np.arange(n) / SAMPLE_RATE
+    return (0.3 * np.sin(2 * np.pi * 440 * t) + 0.1 * rng.standard_normal(n)).astype(np.float32)
+
+
+def make_stream() -> StreamingMelSpectrogram:
+    return StreamingMelSpectrogram(SAMPLE_RATE, N_MELS, WINDOW_SIZE, HOP_SIZE, WINDOW)
+
+
+def expected_mel(signal: np.ndarray, end: int) -> torch.Tensor:
+    window = torch.from_numpy(signal[end - WINDOW:end]).unsqueeze(0)
+    return waveform_to_mel_spectrogram(window, SAMPLE_RATE, N_MELS, WINDOW_SIZE, HOP_SIZE)
+
+
+def feed(stream: StreamingMelSpectrogram, signal: np.ndarray, sizes) -> int:
+    """Push signal in chunks of sizes, check every emitted window. Returns the number checked."""
+    pos = checked = 0
+    for size in sizes:
+        if pos >= signal.size:
+            break
+        if stream.push(signal[pos:pos + size]):
+            end = stream.window_end
+            assert end is not None and 0 <= pos + size - end < HOP_SIZE
+            got, expected = stream.spectrogram, expected_mel(signal, end)
+            assert got is not None and got.shape == expected.shape
+            assert float((got - expected).abs().max()) < TOLERANCE_DB
+            checked += 1
+        pos += size
+    return checked
+
+
+def test_random_chunks_match_batch():
+    signal = make_signal(6)
+    rng = np.random.default_rng(1)
+    assert feed(make_stream(), signal, rng.integers(1, 4000, size=signal.size)) > 0
+
+
+@pytest.mark.parametrize("size", [HOP_SIZE // 2 + 1, HOP_SIZE + 1, 3 * HOP_SIZE - 7, 1600])
+def test_batch_not_a_multiple_of_the_hop(size):
+    signal = make_signal(4, seed=size)
+    assert feed(make_stream(), signal, [size] * (signal.size // size + 1)) > 0
+
+
+def test_first_partial_window():
+    signal = make_signal(3)
+    stream = make_stream()
+    # One sample short of a full window: nothing emitted yet
+    assert not stream.push(signal[:WINDOW - 1])
+    assert not stream.ready and stream.spectrogram is None and stream.window_end is None
+    # The first full window is the very start of the stream
+    assert stream.push(signal[WINDOW - 1:WINDOW + HOP_SIZE // 2])
+    assert stream.ready and stream.window_end == WINDOW + stream.half % HOP_SIZE
+    expected = expected_mel(signal, stream.window_end)
+    assert float((stream.spectrogram - expected).abs().max()) < TOLERANCE_DB
+
+
+def test_empty_push_is_a_no_op():
+    stream = make_stream()
+    assert not stream.push(np.zeros(0, dtype=np.float32))
+    assert stream.total_samples == 0
+
+
+def test_reset_behaves_like_a_fresh_instance():
+    stream = make_stream()
+    feed(stream, make_signal(3, seed=1), [1000] * 100)
+    assert stream.ready
+
+    stream.reset()
+    assert not stream.ready and stream.window_end is None and stream.total_samples == 0
+    # After a retune the new station's audio is compared from its own start
+    signal = make_signal(4, seed=2)
+    sizes = [777] * (signal.size // 777 + 1)
+    fresh = make_stream()
+    assert feed(stream, signal, sizes) == feed(fresh, signal, sizes) > 0
+    assert torch.equal(stream.spectrogram, fresh.spectrogram)
@@ -0,0 +1,161 @@
+from __future__ import annotations
+import struct
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+import numpy as np
+from utils.constants import RAW_SAMPLE_RATE
+
+'''
+Audio messages on CHANNEL_AUDIO: a small fixed header followed by PCM.
+
+    magic    4s   b"SDRA"
+    version  B    FRAME_VERSION
+    dtype    B    payload sample type, see DTYPES
+    (pad)    2x
+    rate     I    sample rate of the payload in Hz
+    seq      Q    per-channel frame counter, starts at 0
+    capture  q    unix time (ns) the batch left the receiver
+    station  d    station frequency in Hz, 0 if unknown
+    stream   16s  stream id (utf-8, zero padded), e.g. the station id
+
+The header is 52 bytes, so the payload stays 4-byte aligned and is read in place.
+Version 1 frames (magic, version, 3 pad bytes, rate, float32 PCM) are still decoded.
+Messages without the magic are treated as legacy headerless float32 PCM at RAW_SAMPLE_RATE.
+'''
+FRAME_MAGIC = b"SDRA"
+FRAME_VERSION = 2
+_HEADER = struct.Struct("<4sBB2xIQqd16s")
+_HEADER_V1 = struct.Struct("<4sB3xI")
+HEADER_SIZE = _HEADER.size
+
+# Payload dtype codes; int16 PCM is scaled by 1/32768 when read as float
+DTYPES: Dict[int, np.dtype] = {1: np.dtype(np.float32), 2: np.dtype(np.int16)}
+_DTYPE_CODES = {dt: code for code, dt in DTYPES.items()}
+
+
+@dataclass
+class AudioFrame:
+    """A decoded audio message. samples is a read-only view into the message."""
+    samples: np.ndarray
+    sample_rate: int
+    seq: int = 0
+    capture_ns: int = 0
+    station: float = 0.0
+    stream: str = ""
+    version: int = FRAME_VERSION
+
+    def float32(self) -> np.ndarray:
+        """Samples as float32 in [-1, 1], no copy for float32 payloads."""
+        if self.samples.dtype == np.int16:
+            return self.samples.astype(np.float32) / 32768.0
+        return self.samples
+
+    def age_s(self, now_ns: Optional[int] = None) -> float:
+        """Seconds since capture, 0 when the sender did not stamp the frame."""
+        if not self.capture_ns:
+            return 0.0
+        return ((now_ns or time.time_ns()) - self.capture_ns) / 1e9
+
+
+def encode_audio(
+    samples: np.ndarray,
+    sample_rate: int,
+    seq: int = 0,
+    capture_ns: Optional[int] = None,
+    station: float = 0.0,
+    stream: str = "",
+    dtype: str = "float32",
+) -> bytes:
+    """
+    Pack samples and their metadata into one message.
+    Args:
+        samples: 1D audio (float32 in [-1, 1])
+        sample_rate: Rate of samples in Hz
+        seq: Frame counter of the channel the frame is published on
+        capture_ns: Capture time (unix ns), defaults to now
+        station: Station frequency in Hz
+        stream: Stream id, at most 16 utf-8 bytes
+        dtype: Payload type, "float32" or "int16"
+    Returns:
+        header + PCM bytes
+    """
+    dt = np.dtype(dtype)
+    if dt not in _DTYPE_CODES:
+        raise ValueError(f"Unsupported audio frame dtype {dtype}")
+    if dt == np.int16:
+        payload = np.clip(np.asarray(samples) * 32768.0, -32768, 32767).astype(np.int16).tobytes()
+    else:
+        payload = np.asarray(samples, dtype=np.float32).tobytes()
+    header = _HEADER.pack(
+        FRAME_MAGIC, FRAME_VERSION, _DTYPE_CODES[dt], int(sample_rate), int(seq),
+        time.time_ns() if capture_ns is None else int(capture_ns), float(station), stream.encode()[:16],
+    )
+    return header + payload
+
+
+def decode_frame(data: bytes) -> AudioFrame:
+    """Unpack a message from encode_audio without copying the PCM."""
+    if len(data) >= _HEADER_V1.size and data[:4] == FRAME_MAGIC:
+        version = data[4]
+        if version == FRAME_VERSION:
+            if len(data) < HEADER_SIZE:
+                raise ValueError(f"Truncated audio frame: {len(data)} bytes, the version {version} header is {HEADER_SIZE}")
+            _, _, code, rate, seq, capture_ns, station, stream = _HEADER.unpack_from(data)
+            if code not in DTYPES:
+                raise ValueError(f"Unknown audio frame dtype code {code}")
+            samples = np.frombuffer(data, dtype=DTYPES[code], offset=HEADER_SIZE)
+            return AudioFrame(samples, rate, seq, capture_ns, station, stream.rstrip(b"\0").decode(), version)
+        if version == 1:
+            _, _, rate = _HEADER_V1.unpack_from(data)
+            return AudioFrame(np.frombuffer(data, dtype=np.float32, offset=_HEADER_V1.size), rate, version=1)
+        raise ValueError(f"Unsupported audio frame version {version}")
+    return AudioFrame(np.frombuffer(data, dtype=np.float32), RAW_SAMPLE_RATE, version=0)
+
+
+def decode_audio(data: bytes) -> Tuple[np.ndarray, int]:
+    """
+    Unpack just the audio of a message.
+    Returns:
+        (float32 samples, sample rate), read-only and uncopied for float32 payloads
+    """
+    frame = decode_frame(data)
+    return frame.float32(), frame.sample_rate
+
+
+class SequenceTracker:
+    """
+    Detects lost and reordered frames from their sequence numbers, per channel.
+
+    Frames are expected to arrive with seq one past the previous frame on the
+    same channel. A jump forward counts the skipped frames as lost; an older
+    seq counts as reordered (or duplicated). A seq of 0 after a higher one is
+    a sender restart, not a loss.
+    """
+    def __init__(self) -> None:
+        self.expected: Dict[str, int] = {}
+        self.received: int = 0
+        self.lost: int = 0
+        self.reordered: int = 0
+
+    def update(self, channel: str, frame: AudioFrame) -> int:
+        """Record a frame, returns how many frames were lost right before it."""
+        self.received += 1
+        if frame.version < 2:
+            return 0
+        expected = self.expected.get(channel)
+        self.expected[channel] = frame.seq + 1
+        if expected is None or frame.seq == expected or frame.seq == 0:
+            return 0
+        if frame.seq < expected:
+            self.reordered += 1
+            self.expected[channel] = expected
+            return 0
+        gap = frame.seq - expected
+        self.lost += gap
+        return gap
+
+    @property
+    def loss_rate(self) -> float:
+        total = self.received + self.lost
+        return self.lost / total if total else 0.0
@@ -1,5 +1,6 @@
 from __future__ import annotations
-from typing import Union
+from functools import lru_cache
+from typing import Optional, Union
 import numpy as np
 import torch
 import torchaudio
@@ -80,6 +81,74 @@ def normalize_duration(waveform: torch.Tensor, sr: int, target_duration: float)
     return waveform
 
 
+class MelExtractor:
+    """
+    Reusable waveform -> log-mel front end.
+    The mel filterbank and FFT window are built once and kept on `device`,
+    so repeated calls only pay for the STFT itself.
+    Use get_mel_extractor() rather than constructing this directly so the
+    same instance is shared by training, dataset loading and live classification.
+    Args:
+        sr: Sample rate
+        n_mels: Number of mel frequency bands
+        window_size: number of frequency bins from fft
+        hop_size: step size through the audio sample
+        device: Device the transforms live on
+    """
+    def __init__(self, sr: int, n_mels: int, window_size: int, hop_size: int, device: Optional[torch.device] = None) -> None:
+        self.sr = sr
+        self.n_mels = n_mels
+        self.window_size = window_size
+        self.hop_size = hop_size
+        self.device = torch.device(device) if device is not None else torch.device("cpu")
+        # Take fft into WINDOW_SIZE frequency bins
+        # Push those into N_MELS bands
+        # Do this for ever HOP_SIZE for the entire chunk to build the spectrogram
+        # So the finished spectrogram is N_MELS high and (samples/HOP_SIZE) wide.
+        self.mel = torchaudio.transforms.MelSpectrogram(
+            sample_rate=sr,
+            n_fft=window_size,
+            hop_length=hop_size,
+            n_mels=n_mels
+        ).to(self.device)
+        # Power data becomes sparse when normalized.
+        # squash to decibels for more meaningful differences.
+        self.to_db = torchaudio.transforms.AmplitudeToDB().to(self.device)
+
+    @torch.no_grad()
+    def __call__(self, waveform: torch.Tensor) -> torch.Tensor:
+        """
+        Args:
+            waveform: [samples], [channels, samples] or [batch, samples]
+        Returns:
+            [..., n_mels, time_frames] on self.device, one spectrogram per leading row.
+        """
+        return self.to_db(self.mel(waveform.to(self.device)))
+
+    def batch(self, waveforms: torch.Tensor) -> torch.Tensor:
+        """
+        Convert a batch of mono waveforms in one call.
+        Args:
+            waveforms: [batch, samples]
+        Returns:
+            [batch, 1, n_mels, time_frames], ready for AudioCNN.
+        """
+        return self(waveforms).unsqueeze(1)
+
+
+@lru_cache(maxsize=None)
+def _cached_mel_extractor(sr: int, window_size: int, hop_size: int, n_mels: int, device: str) -> MelExtractor:
+    return MelExtractor(sr, n_mels, window_size, hop_size, torch.device(device))
+
+
+def get_mel_extractor(sr: int, n_mels: int, window_size: int, hop_size: int, device: Optional[torch.device] = None) -> MelExtractor:
+    """
+    Shared MelExtractor keyed by (sr, n_fft, hop, n_mels) and memoized per device.
+    """
+    device_key = str(torch.device(device)) if device is not None else "cpu"
+    return _cached_mel_extractor(sr, window_size, hop_size, n_mels, device_key)
+
+
 def waveform_to_mel_spectrogram(waveform: torch.Tensor, sr: int, n_mels: int, window_size: int, hop_size: int) -> torch.Tensor:
     """
     Convert waveform -> log-mel spectrogram tensor.
@@ -90,23 +159,24 @@ def waveform_to_mel_spectrogram(waveform: torch.Tensor, sr: int, n_mels: int, wi
         window_size: number of frequency bins from fft
         hop_size: step size through the audio sample
     Returns:
-        [1, n_mels, time_frames].
-    """
-    # Take fft into WINDOW_SIZE frequency bins
-    # Push those into N_MELS bands
-    # Do this for ever HOP_SIZE for the entire chunk to build the spectrogram
-    # So the finished spectrogram is N_MELS high and (samples/HOP_SIZE) wide.
-    mel_spectrogram = torchaudio.transforms.MelSpectrogram(
-        sample_rate=sr,
-        n_fft=window_size,
-        hop_length=hop_size,
-        n_mels=n_mels
-    )(waveform)
-
-    # Power data becomes sparse when normalized.
-    # squash to decibels for more meaningful differences. 
-    mel_spectrogram = torchaudio.transforms.AmplitudeToDB()(mel_spectrogram)
-    return mel_spectrogram
+        [1, n_mels, time_frames] on the waveform's device.
+    """
+    return get_mel_extractor(sr, n_mels, window_size, hop_size, waveform.device)(waveform)
+
+def load_wav(path: str, target_sr: int, target_duration: float) -> torch.Tensor:
+    """
+    Load a wav as mono, resampled and padded/trimmed to target_duration.
+    Args:
+        path: location of .wav file
+        target_sr: target sample rate
+        target_duration: Desired length in seconds
+    Returns:
+        torch.Tensor [1, samples]
+    """
+    waveform, sr = torchaudio.load(path)
+    waveform = mono(waveform)
+    waveform = resample(waveform, sr, target_sr)
+    return normalize_duration(waveform, target_sr, target_duration)
 
 def load_and_process_wav(path: str, target_sr: int, n_mels: int, window_size: int, hop_size: int, target_duration: float) -> torch.Tensor:
     """
@@ -126,9 +196,6 @@ def load_and_process_wav(path: str, target_sr: int, n_mels: int, window_size: in
     Returns:
         torch.Tensor [1, n_mels, time_frames]
     """
-    waveform, sr = torchaudio.load(path)
-    waveform = mono(waveform)
-    waveform = resample(waveform, sr, target_sr)
-    waveform = normalize_duration(waveform, target_sr, target_duration)
+    waveform = load_wav(path, target_sr, target_duration)
     mel_spec = waveform_to_mel_spectrogram(waveform, target_sr, n_mels, window_size, hop_size)
     return mel_spec
@@ -3,9 +3,80 @@ import os
 
 # Network / services
 REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379")
+# Shared connection pool per process (utils/redis_pool.py), each subscription holds one connection
+REDIS_POOL_SIZE: int = int(os.getenv("REDIS_POOL_SIZE", 32))
+REDIS_HEALTH_CHECK_S: int = int(os.getenv("REDIS_HEALTH_CHECK_S", 30))
+# Publishers coalesce up to PUBLISH_MAX_BATCH queued messages into one pipelined round trip
+PUBLISH_QUEUE_SIZE: int = int(os.getenv("PUBLISH_QUEUE_SIZE", 256))
+PUBLISH_MAX_BATCH: int = int(os.getenv("PUBLISH_MAX_BATCH", 64))
+# Longest a stopping component waits for its queued messages to be sent
+PUBLISH_CLOSE_TIMEOUT_S: float = float(os.getenv("PUBLISH_CLOSE_TIMEOUT_S", 2))
+# Seconds between per-component publish stats log lines
+STATS_INTERVAL_S: float = float(os.getenv("STATS_INTERVAL_S", 60))
+# Seconds between latency histogram snapshots sent to the controller's /metrics
+METRICS_INTERVAL_S: float = float(os.getenv("METRICS_INTERVAL_S", 5))
+# Message transport between components: "pubsub", "streams" or "memory" (see utils/transport.py)
+TRANSPORT: str = os.getenv("TRANSPORT", "pubsub")
+# Memory transport: messages buffered per subscriber, and whether to mirror them to Redis pub/sub
+MEMORY_QUEUE_SIZE: int = int(os.getenv("MEMORY_QUEUE_SIZE", 256))
+TRANSPORT_MIRROR: bool = os.getenv("TRANSPORT_MIRROR", "1") == "1"
+# Redis Streams: entries kept per stream (~5 min of 100 ms audio), batch size and read timeout
+STREAM_MAXLEN: int = int(os.getenv("STREAM_MAXLEN", 3000))
+STREAM_READ_COUNT: int = int(os.getenv("STREAM_READ_COUNT", 32))
+STREAM_BLOCK_MS: int = int(os.getenv("STREAM_BLOCK_MS", 1000))
+# Entries another consumer of the group has left unacknowledged this long are claimed (needs Redis >= 6.2)
+STREAM_CLAIM_IDLE_MS: int = int(os.getenv("STREAM_CLAIM_IDLE_MS", 30000))
+# Consumer group of the classifiers; instances in one group must read different streams
+CLASSIFIER_GROUP: str = os.getenv("CLASSIFIER_GROUP", "classifier")
+
+# Controller websocket fan-out: audio frames buffered per client (50 = 5 s of 100 ms frames),
+# longest a single send may block and how long a client may keep losing frames before eviction
+WS_AUDIO_QUEUE: int = int(os.getenv("WS_AUDIO_QUEUE", 50))
+WS_SEND_TIMEOUT_S: float = float(os.getenv("WS_SEND_TIMEOUT_S", 5))
+WS_EVICT_AFTER_S: float = float(os.getenv("WS_EVICT_AFTER_S", 10))
 
 # SDR defaults
 DEFAULT_FREQ: float = float(os.getenv("SDR_FREQ", 100.304e6))
 DEFAULT_FREQ2: float = float(os.getenv("SDR_FREQ2", 98.700e6))
 DEFAULT_GAIN: int = int(os.getenv("SDR_GAIN", 25))
 DEFAULT_PPM: float = float(os.getenv("SDR_PPM", 0.0))
+# Capture rate of the wideband (multi-station) receiver, a multiple of the 240 kHz channel rate
+WIDEBAND_RATE: float = float(os.getenv("SDR_WIDEBAND_RATE", 2.4e6))
+
+# Where 48 kHz demodulated audio is decimated to the model's 16 kHz:
+# "streamer" publishes 16 kHz (a third of the pub/sub bandwidth),
+# "classifier" publishes 48 kHz and resamples on the consumer side.
+RESAMPLE_STAGE: str = os.getenv("RESAMPLE_STAGE", "streamer")
+
+# Classifier
+# Seconds of new audio between classifications of the sliding 10 s window
+CLASSIFY_STRIDE_S: float = float(os.getenv("CLASSIFY_STRIDE_S", 1.0))
+# Consecutive equal labels the FSM needs before it acts on one. Windows a stride apart mostly
+# overlap, so 0 derives it from the stride: one decision per 10 s of new audio, as before striding
+FSM_LABELS_PER_DECISION: int = int(os.getenv("FSM_LABELS_PER_DECISION", 0))
+# Update the mel spectrogram incrementally instead of recomputing the whole window
+CLASSIFIER_STREAMING_MEL: bool = os.getenv("CLASSIFIER_STREAMING_MEL", "1") == "1"
+
+# Role processes (main.py --role all): classifier workers, and CPUs per role with --pin,
+# e.g. "streamer:0;fsm:0;controller:0;classifier:1-3" (classifier workers split their CPUs)
+CLASSIFIER_WORKERS: int = int(os.getenv("CLASSIFIER_WORKERS", 1))
+ROLE_CPUS: str = os.getenv("ROLE_CPUS", "")
+
+# Training data pipeline
+TRAIN_NUM_WORKERS: int = int(os.getenv("TRAIN_NUM_WORKERS", min(4, os.cpu_count() or 1)))
+TRAIN_PREFETCH_FACTOR: int = int(os.getenv("TRAIN_PREFETCH_FACTOR", 2))
+TRAIN_PERSISTENT_WORKERS: bool = os.getenv("TRAIN_PERSISTENT_WORKERS", "1") == "1"
+# "auto" pins host memory only when training on CUDA
+TRAIN_PIN_MEMORY: str = os.getenv("TRAIN_PIN_MEMORY", "auto")
+
+# Multi-stream classifier micro-batching
+CLASSIFIER_MAX_BATCH: int = int(os.getenv("CLASSIFIER_MAX_BATCH", 16))
+CLASSIFIER_MAX_WAIT_MS: float = float(os.getenv("CLASSIFIER_MAX_WAIT_MS", 50))
+
+# Classifier inference runs in a worker thread fed by a drop-oldest queue
+CLASSIFIER_QUEUE_SIZE: int = int(os.getenv("CLASSIFIER_QUEUE_SIZE", 2))
+# torch intra-op threads for inference (0 keeps torch's default)
+CLASSIFIER_TORCH_THREADS: int = int(os.getenv("CLASSIFIER_TORCH_THREADS", 0))
+# Model the classifier runs: "fp32" (eager state dict), or a variant from classifier/export.py:
+# "torchscript", "int8" (quantized TorchScript, CPU) or "onnx" (onnxruntime, CPU)
+CLASSIFIER_MODEL: str = os.getenv("CLASSIFIER_MODEL", "fp32")
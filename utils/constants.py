@@ -3,8 +3,15 @@ from pathlib import Path
 # Project paths
 BASE_DIR: Path = Path(__file__).resolve().parent.parent
 DATA_DIR: Path = BASE_DIR / "data" / "chunks"
+SPEC_CACHE_DIR: Path = BASE_DIR / "data" / "spec_cache"
+RECORDINGS_DIR: Path = BASE_DIR / "data" / "wav"
+RECORDING_LABELS_DIR: Path = BASE_DIR / "data" / "wav_labels"
 SAVE_DIR: Path = BASE_DIR / "models"
 MODEL_PATH: Path = SAVE_DIR / "cnn_current_model.pt"
+# Inference variants written by classifier/export.py from MODEL_PATH
+MODEL_TS_PATH: Path = SAVE_DIR / "cnn_current_model.ts"
+MODEL_INT8_PATH: Path = SAVE_DIR / "cnn_current_model.int8.ts"
+MODEL_ONNX_PATH: Path = SAVE_DIR / "cnn_current_model.onnx"
 
 
 '''
@@ -22,6 +29,8 @@ N_MELS: int = 64
 WINDOW_SIZE: int = 1024
 HOP_SIZE: int = 512
 CHUNK_DURATION_S: float = 10.0
+# Spectrogram frames of one window (centered STFT), the model input is [B, 1, N_MELS, N_FRAMES]
+N_FRAMES: int = int(SAMPLE_RATE * CHUNK_DURATION_S) // HOP_SIZE + 1
 
 #Model hyperparameters
 N_CLASSES: int = 2
@@ -39,4 +48,16 @@ INVERSE_LABELS: dict[int, str] = {v: k for k, v in LABELS.items()}
 # Redis channel names (static strings used across the app)
 CHANNEL_AUDIO: str = "audio_stream"
 CHANNEL_CLASSIFIER: str = "classifier_stream"
-CHANNEL_STATE: str = "state_stream"
\ No newline at end of file
+CHANNEL_STATE: str = "state_stream"
+# Latency histogram snapshots of every process, merged by the controller (utils/latency.py)
+CHANNEL_METRICS: str = "metrics_stream"
+
+
+def stream_channel(base: str, stream_id: str) -> str:
+    """Per-stream variant of a channel, e.g. audio_stream:98.700"""
+    return f"{base}:{stream_id}"
+
+
+def station_id(freq: float) -> str:
+    """Stream id of a station: its frequency in MHz, e.g. 98.7e6 -> 98.700"""
+    return f"{freq / 1e6:.3f}"
@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+import asyncio
+import bisect
+import json
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Sequence
+from utils.config import STATS_INTERVAL_S, METRICS_INTERVAL_S
+from utils.constants import CHANNEL_METRICS
+
+'''
+Latency from capture to each stage of the capture -> decision -> retune path.
+
+Every audio frame carries the time its batch left the GNU Radio sink
+(capture_ns). Classifier results and FSM state updates pass on the capture
+time of the audio they were decided on, so each process can record, for the
+stages it runs, how long after capture the stage was reached:
+
+    publish    streamer handed the frame to its publisher
+    receive    classifier got the frame from the transport
+    mel        spectrogram of the window ending with that frame is ready
+    inference  model output for that window is ready
+    decision   FSM made a transition on it
+    retune     streamer applied the retune
+
+Stages are recorded into the process-wide `latency` registry, logged as
+p50/p95/p99 every STATS_INTERVAL_S and published as histogram snapshots on
+CHANNEL_METRICS every METRICS_INTERVAL_S; the controller merges the
+snapshots of all processes and serves them on /metrics.
+'''
+STAGES = ("publish", "receive", "mel", "inference", "decision", "retune")
+# Upper bucket bounds in seconds, the last bucket is +Inf
+BUCKETS = (0.005, 0.01, 0.02, 0.05, 0.075, 0.1, 0.15, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """Prometheus-style latency histogram (per-bucket counts, sum and count)."""
+    def __init__(self, counts: Optional[Sequence[int]] = None, total: float = 0.0) -> None:
+        self.counts: List[int] = list(counts) if counts is not None else [0] * (len(BUCKETS) + 1)
+        self.total = total
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.total += seconds
+
+    def merge(self, other: "Histogram") -> None:
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.total += other.total
+
+    def quantile(self, q: float) -> float:
+        """Estimated q-quantile, interpolated inside its bucket (like histogram_quantile)."""
+        n = self.count
+        if n == 0:
+            return 0.0
+        rank = q * n
+        seen = 0
+        for i, c in enumerate(self.counts):
+            if c and seen + c >= rank:
+                lo = BUCKETS[i - 1] if i > 0 else 0.0
+                if i == len(BUCKETS):
+                    return lo
+                return lo + (BUCKETS[i] - lo) * (rank - seen) / c
+            seen += c
+        return BUCKETS[-1]
+
+
+class LatencyRegistry:
+    """Histograms of one process, keyed by stage. record() is thread-safe."""
+    def __init__(self) -> None:
+        self.histograms: Dict[str, Histogram] = {}
+        self.lock = threading.Lock()
+        self.task: Optional[asyncio.Task] = None
+
+    def record(self, stage: str, seconds: float) -> None:
+        with self.lock:
+            self.histograms.setdefault(stage, Histogram()).observe(max(0.0, seconds))
+
+    def record_since(self, stage: str, capture_ns: int) -> None:
+        """Record stage as reached now for audio captured at capture_ns (ignored when 0)."""
+        if capture_ns:
+            self.record(stage, (time.time_ns() - capture_ns) / 1e9)
+
+    def snapshot(self) -> Dict[str, dict]:
+        with self.lock:
+            return {s: {"counts": list(h.counts), "sum": h.total} for s, h in self.histograms.items()}
+
+    def summary(self) -> str:
+        with self.lock:
+            return summarize(self.histograms)
+
+    def start_reporting(self, transport, source: str) -> None:
+        """Log and publish snapshots in the background (call from the event loop)."""
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._report_loop(transport, f"{source}-{os.getpid()}"))
+
+    async def _report_loop(self, transport, source: str) -> None:
+        last_log = time.monotonic()
+        while True:
+            await asyncio.sleep(METRICS_INTERVAL_S)
+            if not self.histograms:
+                continue
+            try:
+                await transport.publish(CHANNEL_METRICS, json.dumps({"source": source, "stages": self.snapshot()}))
+            except Exception as e:
+                print(f"[Latency] Could not publish metrics: {e}")
+            if time.monotonic() - last_log >= STATS_INTERVAL_S:
+                last_log = time.monotonic()
+                print(f"[Latency] {self.summary()}")
+
+    def stop_reporting(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+
+
+def _stage_order(stage: str) -> int:
+    return STAGES.index(stage) if stage in STAGES else len(STAGES)
+
+
+def summarize(histograms: Dict[str, Histogram]) -> str:
+    """One log line with p50/p95/p99 per stage, in pipeline order."""
+    return ", ".join(
+        f"{stage} p50 {1000 * h.quantile(0.5):.0f} / p95 {1000 * h.quantile(0.95):.0f} / "
+        f"p99 {1000 * h.quantile(0.99):.0f} ms (n={h.count})"
+        for stage, h in sorted(histograms.items(), key=lambda kv: _stage_order(kv[0]))
+    )
+
+
+def prometheus_text(snapshots: Dict[str, Dict[str, dict]]) -> str:
+    """
+    Prometheus text exposition of snapshots from several processes.
+    Args:
+        snapshots: source -> stage -> {"counts", "sum"}, as published by start_reporting
+    """
+    lines = [
+        "# HELP sdr_stage_latency_seconds Time from audio capture until a pipeline stage was reached",
+        "# TYPE sdr_stage_latency_seconds histogram",
+    ]
+    for source, stages in sorted(snapshots.items()):
+        for stage in sorted(stages, key=_stage_order):
+            h = Histogram(stages[stage]["counts"], stages[stage]["sum"])
+            labels = f'stage="{stage}",source="{source}"'
+            cumulative = 0
+            for bound, c in zip(list(BUCKETS) + ["+Inf"], h.counts):
+                cumulative += c
+                lines.append(f'sdr_stage_latency_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"sdr_stage_latency_seconds_sum{{{labels}}} {h.total}")
+            lines.append(f"sdr_stage_latency_seconds_count{{{labels}}} {h.count}")
+    return "\n".join(lines) + "\n"
+
+
+def merged(snapshots: Iterable[Dict[str, dict]]) -> Dict[str, Histogram]:
+    """Per-stage histograms summed over processes."""
+    out: Dict[str, Histogram] = {}
+    for stages in snapshots:
+        for stage, data in stages.items():
+            out.setdefault(stage, Histogram()).merge(Histogram(data["counts"], data["sum"]))
+    return out
+
+
+# Process-wide registry
+latency = LatencyRegistry()
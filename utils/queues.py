@@ -0,0 +1,23 @@
+from __future__ import annotations
+import asyncio
+from typing import Any
+
+class DropOldestQueue(asyncio.Queue):
+    """
+    Bounded asyncio queue whose producer never waits.
+    When full, the oldest item is discarded to make room, so a slow consumer
+    only ever sees the freshest `maxsize` items.
+    """
+    def __init__(self, maxsize: int) -> None:
+        super().__init__(maxsize=max(1, maxsize))
+        self.dropped: int = 0
+
+    def put_drop_oldest(self, item: Any) -> bool:
+        """Enqueue item, returns True if an older item had to be dropped."""
+        dropped = False
+        if self.full():
+            self.get_nowait()
+            self.dropped += 1
+            dropped = True
+        self.put_nowait(item)
+        return dropped
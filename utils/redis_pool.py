@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+from typing import Dict
+import redis.asyncio as aioredis
+from utils.config import REDIS_URL, REDIS_POOL_SIZE, REDIS_HEALTH_CHECK_S
+
+'''
+One connection pool per Redis URL, shared by every client in the process.
+
+Commands borrow a connection only for their round trip; each pub/sub
+subscription holds one for as long as it is open, so REDIS_POOL_SIZE must
+cover the subscriptions plus a few for publishing.
+'''
+_pools: Dict[str, aioredis.ConnectionPool] = {}
+
+
+def get_pool(redis_url: str = REDIS_URL) -> aioredis.ConnectionPool:
+    pool = _pools.get(redis_url)
+    if pool is None:
+        pool = aioredis.ConnectionPool.from_url(
+            redis_url,
+            max_connections=REDIS_POOL_SIZE,
+            # Idle connections are PINGed before reuse, so a restarted server is noticed
+            health_check_interval=REDIS_HEALTH_CHECK_S,
+            socket_keepalive=True,
+        )
+        _pools[redis_url] = pool
+    return pool
+
+
+def get_redis(redis_url: str = REDIS_URL) -> aioredis.Redis:
+    """Client on the shared pool, closing it leaves the pool open."""
+    return aioredis.Redis(connection_pool=get_pool(redis_url))
+
+
+def pool_stats(redis_url: str = REDIS_URL) -> Dict[str, int]:
+    """Connections of the shared pool: created, idle, in use and the limit."""
+    pool = _pools.get(redis_url)
+    if pool is None:
+        return {"created": 0, "idle": 0, "in_use": 0, "max": REDIS_POOL_SIZE}
+    # redis-py keeps these lists private, a version without them just reports 0
+    idle = len(getattr(pool, "_available_connections", ()))
+    in_use = len(getattr(pool, "_in_use_connections", ()))
+    return {"created": idle + in_use, "idle": idle, "in_use": in_use, "max": pool.max_connections}
+
+
+async def close_pools() -> None:
+    """Disconnect every shared pool (on shutdown)."""
+    for pool in list(_pools.values()):
+        await pool.disconnect()
+    _pools.clear()
@@ -0,0 +1,90 @@
+from __future__ import annotations
+from math import gcd
+import numpy as np
+
+def design_lowpass(num_taps: int, cutoff: float, beta: float = 5.0) -> np.ndarray:
+    """
+    Kaiser-windowed sinc low-pass with unity DC gain (same design as scipy's firwin).
+    Args:
+        num_taps: Filter length (odd keeps the delay an integer)
+        cutoff: Cutoff as a fraction of Nyquist (0, 1]
+        beta: Kaiser window shape
+    Returns:
+        float64 taps
+    """
+    n = np.arange(num_taps) - (num_taps - 1) / 2.0
+    taps = cutoff * np.sinc(cutoff * n) * np.kaiser(num_taps, beta)
+    return taps / taps.sum()
+
+
+class PolyphaseResampler:
+    """
+    Streaming rational resampler (orig_sr -> target_sr) built on a polyphase filter bank.
+
+    Taps are designed once and split into `up` phases, and only the output
+    samples that are kept get computed (for 48 kHz -> 16 kHz every third one).
+    The last few input samples are carried between calls, so feeding a stream
+    chunk by chunk gives the same output as filtering it in one piece.
+
+    Args:
+        orig_sr: Input sample rate
+        target_sr: Output sample rate
+        half_len: Filter half length in units of max(up, down) (10 matches scipy.signal.resample_poly)
+        beta: Kaiser window shape
+    """
+    def __init__(self, orig_sr: int, target_sr: int, half_len: int = 10, beta: float = 5.0) -> None:
+        g = gcd(int(orig_sr), int(target_sr))
+        self.orig_sr = int(orig_sr)
+        self.target_sr = int(target_sr)
+        self.up = self.target_sr // g
+        self.down = self.orig_sr // g
+
+        max_rate = max(self.up, self.down)
+        taps = design_lowpass(2 * half_len * max_rate + 1, 1.0 / max_rate, beta) * self.up
+        # Phase p holds taps p, p+up, p+2up, ... stored reversed so each output is a dot product
+        self.taps_per_phase = -(-taps.size // self.up)
+        padded = np.zeros(self.taps_per_phase * self.up)
+        padded[:taps.size] = taps
+        self.taps = taps.astype(np.float32)
+        self.bank = np.ascontiguousarray(padded.reshape(self.taps_per_phase, self.up).T[:, ::-1], dtype=np.float32)
+
+        self.reset()
+
+    def reset(self) -> None:
+        """Clear carried filter state (e.g. after a retune)."""
+        self._history = np.zeros(self.taps_per_phase - 1, dtype=np.float32)
+        self._in_count: int = 0
+        self._out_count: int = 0
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        """
+        Resample the next chunk of a stream.
+        Args:
+            samples: 1D float32 audio at orig_sr
+        Returns:
+            1D float32 audio at target_sr
+        """
+        samples = np.asarray(samples, dtype=np.float32).reshape(-1)
+        if self.up == self.down:
+            return samples
+
+        k = self.taps_per_phase
+        buf = np.concatenate((self._history, samples))
+        buf_start = self._in_count - (k - 1)
+        self._in_count += samples.size
+
+        # Output m needs input index (m * down) // up, so m < in_count * up / down
+        out_end = -(-self._in_count * self.up // self.down)
+        m = np.arange(self._out_count, out_end)
+        self._out_count = out_end
+        self._history = buf[-(k - 1):] if k > 1 else buf[:0]
+
+        if m.size == 0:
+            return np.zeros(0, dtype=np.float32)
+        windows = np.lib.stride_tricks.sliding_window_view(buf, k)
+        rows = (m * self.down) // self.up - buf_start - (k - 1)
+        if self.up == 1:
+            # Pure decimation: rows are evenly spaced, so a strided view avoids the gather
+            return windows[rows[0]::self.down][:m.size] @ self.bank[0]
+        phases = (m * self.down) % self.up
+        return np.einsum("ij,ij->i", windows[rows], self.bank[phases])
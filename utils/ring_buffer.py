@@ -0,0 +1,70 @@
+from __future__ import annotations
+import numpy as np
+
+class RingBuffer:
+    """
+    Fixed-size sample buffer that is written in place.
+
+    Storage is allocated once, so pushing a batch never allocates or shifts
+    the whole buffer. Reads copy the buffered samples oldest-first into a
+    caller-owned array.
+
+    Args:
+        capacity: Number of samples held before the oldest are overwritten
+        dtype: Sample dtype (float32 for audio)
+    """
+    def __init__(self, capacity: int, dtype: np.dtype = np.float32) -> None:
+        if capacity <= 0:
+            raise ValueError(f"capacity must be positive, got {capacity}")
+        self.capacity = int(capacity)
+        self.data = np.zeros(self.capacity, dtype=dtype)
+        self.write_pos: int = 0
+        self.size: int = 0
+        self.total_written: int = 0
+
+    @property
+    def full(self) -> bool:
+        return self.size == self.capacity
+
+    def write(self, samples: np.ndarray) -> None:
+        """Append samples, overwriting the oldest ones once the buffer is full."""
+        n = int(samples.size)
+        if n == 0:
+            return
+        self.total_written += n
+
+        # Only the newest `capacity` samples can survive the write
+        if n >= self.capacity:
+            self.data[:] = samples[-self.capacity:]
+            self.write_pos = 0
+            self.size = self.capacity
+            return
+
+        first = min(n, self.capacity - self.write_pos)
+        self.data[self.write_pos:self.write_pos + first] = samples[:first]
+        if first < n:
+            self.data[:n - first] = samples[first:]
+        self.write_pos = (self.write_pos + n) % self.capacity
+        self.size = min(self.capacity, self.size + n)
+
+    def read_into(self, out: np.ndarray, n: int | None = None) -> np.ndarray:
+        """
+        Copy the newest n samples (default: everything buffered) oldest-first into out.
+        Args:
+            out: Destination array with at least n elements
+            n: Number of samples to read
+        Returns:
+            View of out holding the n samples.
+        """
+        n = self.size if n is None else min(int(n), self.size)
+        start = (self.write_pos - n) % self.capacity
+        first = min(n, self.capacity - start)
+        out[:first] = self.data[start:start + first]
+        if first < n:
+            out[first:n] = self.data[:n - first]
+        return out[:n]
+
+    def clear(self) -> None:
+        """Drop all buffered samples without releasing storage."""
+        self.write_pos = 0
+        self.size = 0
@@ -0,0 +1,183 @@
+from __future__ import annotations
+from collections import deque
+from typing import Deque, Optional, Tuple
+import numpy as np
+import torch
+import torchaudio
+from utils.audio_utils import get_mel_extractor
+
+'''
+Incremental log-mel front end for sliding windows.
+
+waveform_to_mel_spectrogram (center=True, reflect padding) splits a window
+into frames whose centers sit every hop samples from the window start.
+Every frame that does not touch the reflect padding is a pure function of
+the stream, so it is computed once, when its samples arrive, and reused by
+every later window that contains it. Only the few frames at each window
+edge depend on where the window starts/ends:
+- left edge frames are computed once per candidate window start, as soon
+  as the first samples of that start arrive, and queued until used.
+- right edge frames are computed from the retained tail when a window is emitted.
+Each new hop of audio therefore costs about two FFTs instead of the ~313
+needed to redo the whole 10s window.
+'''
+
+class StreamingMelSpectrogram:
+    """
+    Maintains the log-mel spectrogram of the most recent n_samples of a stream.
+
+    The emitted spectrogram is identical to waveform_to_mel_spectrogram on
+    the window stream[window_end - n_samples : window_end]. Windows are
+    hop-aligned with the stream, so window_end trails the newest sample by
+    less than hop_size samples.
+
+    Args:
+        sr: Sample rate
+        n_mels: Number of mel frequency bands
+        window_size: number of frequency bins from fft
+        hop_size: step size through the audio sample
+        n_samples: Length of the sliding window in samples
+        device: Device the spectrogram is computed on
+    """
+    def __init__(
+        self,
+        sr: int,
+        n_mels: int,
+        window_size: int,
+        hop_size: int,
+        n_samples: int,
+        device: Optional[torch.device] = None,
+    ) -> None:
+        if window_size % 2:
+            raise ValueError("window_size must be even")
+        if n_samples < window_size:
+            raise ValueError("n_samples must be at least window_size")
+        extractor = get_mel_extractor(sr, n_mels, window_size, hop_size, device)
+        self.device = extractor.device
+        self.sr = sr
+        self.n_mels = n_mels
+        self.n_fft = window_size
+        self.hop = hop_size
+        self.half = window_size // 2
+        self.n_samples = n_samples
+        self.n_frames = 1 + n_samples // hop_size
+        # Same STFT as the batch path, minus the centering/padding
+        self._stft = torchaudio.transforms.Spectrogram(
+            n_fft=window_size, hop_length=hop_size, power=2.0, center=False
+        ).to(self.device)
+        self._mel_scale = extractor.mel.mel_scale
+        self._to_db = extractor.to_db
+
+        # Window frames [0, left_edge) overlap the left padding,
+        # frames [right_edge, n_frames) overlap the right padding.
+        self.left_edge = -(-self.half // hop_size)
+        self.right_edge = (n_samples - self.half) // hop_size + 1
+        # Samples needed (from the window start / up to the window end) for the edge frames
+        self._left_span = max((self.left_edge - 1) * hop_size + self.half, self.half) + 1
+        self._right_span = max(n_samples - self.right_edge * hop_size + self.half, self.half + 1)
+        # Frame continuity only needs window_size - hop_size samples,
+        # the edges need a little more.
+        self._keep = max(window_size, self._right_span + hop_size, self._left_span + hop_size)
+        self._max_frames = self.n_frames + 1
+        self.reset()
+
+    @property
+    def ready(self) -> bool:
+        return self._spectrogram is not None
+
+    @property
+    def spectrogram(self) -> Optional[torch.Tensor]:
+        """[1, n_mels, n_frames] log-mel of the latest window, None until the first full window."""
+        return self._spectrogram
+
+    def reset(self) -> None:
+        """Forget all stream state (e.g. after a retune), the transforms are kept."""
+        self.total_samples: int = 0
+        self.window_end: Optional[int] = None
+        self._tail = np.zeros(0, dtype=np.float32)
+        self._tail_start: int = 0
+        self._next_frame: int = 0
+        self._frames = torch.zeros(self.n_mels, 0, device=self.device)
+        self._next_left: int = self.half % self.hop
+        self._left_frames: Deque[Tuple[int, torch.Tensor]] = deque()
+        self._spectrogram: Optional[torch.Tensor] = None
+
+    def _log_mel(self, frames: torch.Tensor) -> torch.Tensor:
+        with torch.no_grad():
+            return self._to_db(self._mel_scale(self._stft(frames)))
+
+    def push(self, samples: np.ndarray) -> bool:
+        """
+        Feed new samples and update the rolling spectrogram.
+        Args:
+            samples: 1D float32 audio
+        Returns:
+            True if a newer window was emitted.
+        """
+        samples = np.asarray(samples, dtype=np.float32).reshape(-1)
+        if samples.size == 0:
+            return False
+        buf = np.concatenate((self._tail, samples))
+        buf_start = self._tail_start
+        self.total_samples += samples.size
+        total = self.total_samples
+
+        # Latest hop-aligned window that fits in what we have.
+        # Aligned windows start on a stream frame center: start % hop == half % hop
+        start: Optional[int] = None
+        if total >= self.n_samples:
+            start = total - self.n_samples
+            start -= (start - self.half) % self.hop
+            if start < 0:
+                start = None
+
+        # 1. New frames of the stream (never touch padding, shared by all windows)
+        frame_end = (total - self.n_fft) // self.hop + 1 if total >= self.n_fft else 0
+        if frame_end > self._next_frame:
+            first = max(self._next_frame, frame_end - self._max_frames)
+            a = first * self.hop - buf_start
+            b = (frame_end - 1) * self.hop + self.n_fft - buf_start
+            cols = self._log_mel(torch.from_numpy(buf[a:b]).to(self.device))
+            self._frames = torch.cat((self._frames, cols), dim=1)[:, -self._max_frames:]
+            self._next_frame = frame_end
+
+        # 2. Left edge frames for every window start whose head has now arrived
+        last_start = total - self._left_span
+        if start is not None:
+            self._next_left = max(self._next_left, start)
+        if last_start >= self._next_left:
+            starts = np.arange(self._next_left, last_start + 1, self.hop)
+            idx = starts[:, None] - buf_start + np.arange(self._left_span)
+            heads = torch.from_numpy(buf[idx]).to(self.device).unsqueeze(1)
+            padded = torch.nn.functional.pad(heads, (self.half, 0), mode="reflect").squeeze(1)
+            edges = self._log_mel(padded)[..., :self.left_edge]
+            for s, cols in zip(starts.tolist(), edges):
+                self._left_frames.append((s, cols))
+            self._next_left = int(starts[-1]) + self.hop
+        if start is not None:
+            while self._left_frames and self._left_frames[0][0] < start:
+                self._left_frames.popleft()
+
+        # Keep only what the next push needs
+        self._tail = buf[-self._keep:].copy()
+        self._tail_start = total - self._tail.size
+
+        if start is None or start + self.n_samples == self.window_end:
+            return False
+
+        # 3. Assemble: left edge + shared interior frames + right edge
+        end = start + self.n_samples
+        left = self._left_frames[0][1]
+        first_frame = (start - self.half) // self.hop
+        lo = first_frame + self.left_edge - self._next_frame + self._frames.shape[1]
+        hi = first_frame + self.right_edge - self._next_frame + self._frames.shape[1]
+        interior = self._frames[:, lo:hi]
+
+        tail = torch.from_numpy(buf[end - self._right_span - buf_start:end - buf_start]).to(self.device)
+        tail = torch.nn.functional.pad(tail.view(1, 1, -1), (0, self.half), mode="reflect").view(-1)
+        offset = self._right_span - (self.n_samples - self.right_edge * self.hop + self.half)
+        right = self._log_mel(tail[offset:])
+
+        self._spectrogram = torch.cat((left, interior, right), dim=1).unsqueeze(0)
+        self.window_end = end
+        return True
@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import os
+import signal
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
+
+'''
+Runs the pipeline roles as separate processes (python -m main --role ...)
+and keeps them running:
+
+    supervisor = Supervisor([RoleProcess("streamer", argv), ...])
+    supervisor.run()   # until SIGINT/SIGTERM
+
+A role that fails (non-zero exit) is restarted after a backoff that doubles
+up to MAX_BACKOFF_S and resets once it has stayed up for STABLE_S; one that
+exits cleanly (e.g. the streamer at the end of a replay) is left stopped. On
+shutdown every role gets SIGTERM (they stop their components and exit) and
+is killed if it is still running after STOP_TIMEOUT_S.
+'''
+MAX_BACKOFF_S = 30.0
+STABLE_S = 60.0
+STOP_TIMEOUT_S = 10.0
+POLL_S = 0.5
+
+
+def parse_cpus(spec: str) -> List[int]:
+    """CPU list like "0,2-3" -> [0, 2, 3]."""
+    cpus: List[int] = []
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        lo, _, hi = part.partition("-")
+        cpus.extend(range(int(lo), int(hi or lo) + 1))
+    return cpus
+
+
+def parse_role_cpus(spec: str) -> Dict[str, List[int]]:
+    """ROLE_CPUS like "streamer:0;classifier:1-3" -> {"streamer": [0], "classifier": [1, 2, 3]}."""
+    pins: Dict[str, List[int]] = {}
+    for item in filter(None, (i.strip() for i in spec.split(";"))):
+        role, _, cpus = item.partition(":")
+        pins[role.strip()] = parse_cpus(cpus)
+    return pins
+
+
+@dataclass
+class RoleProcess:
+    """
+    One supervised process.
+    Args:
+        name: Name for logs, e.g. "classifier-1"
+        argv: Command line
+        cpus: CPUs the process is pinned to, all when empty
+        env: Extra environment variables
+    """
+    name: str
+    argv: List[str]
+    cpus: List[int] = field(default_factory=list)
+    env: Dict[str, str] = field(default_factory=dict)
+    proc: Optional[subprocess.Popen] = None
+    started: float = 0.0
+    restarts: int = 0
+    backoff_s: float = 1.0
+    restart_at: float = 0.0
+    finished: bool = False
+
+    def spawn(self) -> None:
+        # Own session: a terminal Ctrl-C reaches only the supervisor, which then stops every role
+        self.proc = subprocess.Popen(self.argv, env={**os.environ, **self.env}, start_new_session=True)
+        self.started = time.monotonic()
+        if self.cpus and hasattr(os, "sched_setaffinity"):
+            try:
+                os.sched_setaffinity(self.proc.pid, self.cpus)
+            except OSError as e:
+                print(f"[Supervisor] Could not pin {self.name} to CPUs {self.cpus}: {e}")
+        pinned = f" on CPUs {self.cpus}" if self.cpus else ""
+        print(f"[Supervisor] Started {self.name} (pid {self.proc.pid}){pinned}")
+
+
+class Supervisor:
+    """Spawns, watches and restarts RoleProcesses, see the module docstring."""
+    def __init__(self, roles: Sequence[RoleProcess]) -> None:
+        self.roles = list(roles)
+        self.stopping = False
+
+    def run(self) -> int:
+        previous = {sig: signal.signal(sig, self._request_stop) for sig in (signal.SIGINT, signal.SIGTERM)}
+        try:
+            for role in self.roles:
+                role.spawn()
+            while not self.stopping:
+                self._check()
+                time.sleep(POLL_S)
+        finally:
+            for sig, handler in previous.items():
+                signal.signal(sig, handler)
+            self.stop()
+        return 0
+
+    def _request_stop(self, signum: int, _frame) -> None:
+        if not self.stopping:
+            print(f"\n[Supervisor] {signal.Signals(signum).name}, stopping roles...")
+        self.stopping = True
+
+    def _check(self) -> None:
+        now = time.monotonic()
+        for role in self.roles:
+            if role.finished:
+                continue
+            if role.proc is None:
+                if now >= role.restart_at:
+                    role.restarts += 1
+                    role.spawn()
+                continue
+            code = role.proc.poll()
+            if code is None:
+                if now - role.started > STABLE_S:
+                    role.backoff_s = 1.0
+                continue
+            if code == 0:
+                print(f"[Supervisor] {role.name} finished")
+                role.finished = True
+                continue
+            print(f"[Supervisor] {role.name} exited with code {code}, restarting in {role.backoff_s:.0f} s")
+            role.proc = None
+            role.restart_at = now + role.backoff_s
+            role.backoff_s = min(2 * role.backoff_s, MAX_BACKOFF_S)
+
+    def stop(self) -> None:
+        running = [r for r in self.roles if r.proc is not None and r.proc.poll() is None]
+        for role in running:
+            role.proc.send_signal(signal.SIGTERM)
+        deadline = time.monotonic() + STOP_TIMEOUT_S
+        for role in running:
+            try:
+                role.proc.wait(max(0.0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                print(f"[Supervisor] {role.name} did not stop, killing it")
+                role.proc.kill()
+                role.proc.wait()
+        print("[Supervisor] All roles stopped.")
+
+
+def role_argv(role: str, args: Sequence[str], extra: Sequence[str] = ()) -> List[str]:
+    """Command line running one role of main.py with the given arguments."""
+    return [sys.executable, "-m", "main", "--role", role, *args, *extra]
@@ -0,0 +1,618 @@
+from __future__ import annotations
+
+import asyncio
+import fnmatch
+import socket
+import time
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple, Union
+import redis.asyncio as aioredis
+from redis.exceptions import ResponseError
+from utils.redis_pool import get_redis, pool_stats
+from utils.config import (
+    REDIS_URL,
+    TRANSPORT,
+    STREAM_MAXLEN,
+    STREAM_READ_COUNT,
+    STREAM_BLOCK_MS,
+    STREAM_CLAIM_IDLE_MS,
+    MEMORY_QUEUE_SIZE,
+    TRANSPORT_MIRROR,
+    PUBLISH_QUEUE_SIZE,
+    PUBLISH_MAX_BATCH,
+    PUBLISH_CLOSE_TIMEOUT_S,
+    STATS_INTERVAL_S,
+)
+from utils.queues import DropOldestQueue
+
+'''
+Message transport between components.
+
+Every component publishes bytes (audio frames) or JSON text on named
+channels and reads them back through a Subscription:
+
+    transport = make_transport()
+    sub = await transport.subscribe(CHANNEL_AUDIO, group="classifier")
+    async for message in sub:
+        ...message.channel, message.data
+    await sub.close()
+
+Channels containing "*" are glob patterns. Backends:
+
+    pubsub   Redis pub/sub (default): fire and forget, slow subscribers lose messages
+    streams  Redis Streams: XADD with MAXLEN trimming, XREAD(GROUP) in COUNT batches.
+             Subscribers in a consumer group share its entries and resume from the
+             group's position after a restart; without a group every subscriber sees
+             everything published after it subscribed. Group entries are acknowledged
+             once handled: a consumer restarted under the same name first rereads
+             what it had not acknowledged, and entries another consumer left
+             unacknowledged for STREAM_CLAIM_IDLE_MS are claimed and read again.
+    memory   asyncio queues inside one process (main.py runs streamer, classifier
+             and FSM together): no Redis hop, payloads are handed over by reference.
+             Optionally mirrored to Redis pub/sub so the controller can still attach.
+
+Components publish through a Publisher, which keeps per-component stats and
+can coalesce a backlog into one pipelined round trip (submit).
+'''
+
+Payload = Union[bytes, str]
+
+
+class Message(NamedTuple):
+    channel: str
+    data: bytes
+
+
+def _is_pattern(channel: str) -> bool:
+    return "*" in channel or "?" in channel
+
+
+def _text(value: Union[bytes, str]) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class Subscription(ABC):
+    """Channels a consumer reads, iterate with `async for message in sub`."""
+
+    @abstractmethod
+    async def subscribe(self, *channels: str) -> None:
+        ...
+
+    @abstractmethod
+    async def unsubscribe(self, *channels: str) -> None:
+        ...
+
+    @abstractmethod
+    def __aiter__(self) -> AsyncIterator[Message]:
+        ...
+
+    @abstractmethod
+    async def close(self) -> None:
+        ...
+
+    async def __aenter__(self) -> "Subscription":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+
+class Transport(ABC):
+    """Publish side of a backend and factory for its subscriptions."""
+    name: str = ""
+
+    @abstractmethod
+    async def publish(self, channel: str, data: Payload) -> None:
+        ...
+
+    async def publish_many(self, messages: Iterable[Tuple[str, Payload]]) -> None:
+        """Publish several messages, in one round trip where the backend allows it."""
+        for channel, data in messages:
+            await self.publish(channel, data)
+
+    @abstractmethod
+    async def subscribe(
+        self, *channels: str, group: Optional[str] = None, consumer: Optional[str] = None,
+    ) -> Subscription:
+        """
+        Open a subscription to channels.
+        Args:
+            channels: Channel names or glob patterns
+            group: Consumer group, subscribers sharing a group split the messages
+                (streams backend only, ignored by pubsub)
+            consumer: Name within the group, keep it stable across restarts so
+                unacknowledged entries are picked up again (defaults to the hostname)
+        """
+
+    @abstractmethod
+    async def close(self) -> None:
+        ...
+
+    def connection_stats(self) -> Dict[str, int]:
+        """Connection usage of the backend, empty when it has none."""
+        return {}
+
+
+class PubSubSubscription(Subscription):
+    def __init__(self, redis: aioredis.Redis) -> None:
+        self.pubsub = redis.pubsub()
+
+    async def subscribe(self, *channels: str) -> None:
+        plain = [c for c in channels if not _is_pattern(c)]
+        patterns = [c for c in channels if _is_pattern(c)]
+        if plain:
+            await self.pubsub.subscribe(*plain)
+        if patterns:
+            await self.pubsub.psubscribe(*patterns)
+
+    async def unsubscribe(self, *channels: str) -> None:
+        plain = [c for c in channels if not _is_pattern(c)]
+        patterns = [c for c in channels if _is_pattern(c)]
+        if plain:
+            await self.pubsub.unsubscribe(*plain)
+        if patterns:
+            await self.pubsub.punsubscribe(*patterns)
+
+    async def __aiter__(self) -> AsyncIterator[Message]:
+        async for message in self.pubsub.listen():
+            if message["type"] not in ("message", "pmessage"):
+                continue
+            yield Message(_text(message["channel"]), message["data"])
+
+    async def close(self) -> None:
+        await self.pubsub.unsubscribe()
+        await self.pubsub.punsubscribe()
+        await self.pubsub.aclose()
+
+
+class PubSubTransport(Transport):
+    """Redis pub/sub, see the module docstring."""
+    name = "pubsub"
+
+    def __init__(self, redis_url: str = REDIS_URL) -> None:
+        self.redis_url = redis_url
+        self.redis = get_redis(redis_url)
+
+    async def publish(self, channel: str, data: Payload) -> None:
+        await self.redis.publish(channel, data)
+
+    def connection_stats(self) -> Dict[str, int]:
+        return pool_stats(self.redis_url)
+
+    async def publish_many(self, messages: Iterable[Tuple[str, Payload]]) -> None:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for channel, data in messages:
+                pipe.publish(channel, data)
+            await pipe.execute()
+
+    async def subscribe(
+        self, *channels: str, group: Optional[str] = None, consumer: Optional[str] = None,
+    ) -> Subscription:
+        sub = PubSubSubscription(self.redis)
+        await sub.subscribe(*channels)
+        return sub
+
+    async def close(self) -> None:
+        await self.redis.aclose()
+
+
+# Field holding the payload in every stream entry
+_FIELD = b"d"
+# How often glob patterns are matched against existing streams again
+_RESCAN_S = 2.0
+# How often group streams are checked for entries other consumers left pending
+_CLAIM_S = 5.0
+# Read id of a consumer's own pending entries, ">" reads new ones
+_PENDING = b"0"
+_NEW = b">"
+
+
+class StreamsSubscription(Subscription):
+    """
+    XREAD / XREADGROUP over a set of streams.
+
+    Entries of a batch are acknowledged when the consumer asks for the next
+    batch. A group subscription first reads the consumer's own pending entries
+    (id 0, left by a previous run under the same name) and then new ones (>).
+    Every _CLAIM_S it XAUTOCLAIMs entries other consumers of its streams left
+    pending for claim_idle_ms (a worker that died mid-batch and never came
+    back under its name) and reads them as its own pending entries.
+    """
+    def __init__(self, transport: "StreamsTransport", group: Optional[str], consumer: Optional[str]) -> None:
+        self.transport = transport
+        self.redis = transport.redis
+        self.group = group
+        self.consumer = consumer or socket.gethostname()
+        self.channels: Set[str] = set()
+        self.patterns: Set[str] = set()
+        # Next id to read per stream (plain XREAD); groups track their own position
+        self.last_ids: Dict[str, bytes] = {}
+        self.last_scan = 0.0
+        self.last_claim = time.monotonic()
+        self.closed = False
+
+    async def _add_stream(self, key: str, from_start: bool = False) -> None:
+        if key in self.last_ids:
+            return
+        # from_start: stream created after we subscribed (found by a pattern), all of it is new
+        if from_start and self.group is None:
+            self.last_ids[key] = b"0-0"
+        elif self.group is not None:
+            try:
+                await self.redis.xgroup_create(key, self.group, id="0" if from_start else "$", mkstream=True)
+            except ResponseError as e:
+                if "BUSYGROUP" not in str(e):
+                    raise
+            self.last_ids[key] = _PENDING
+        else:
+            # Start after the newest entry, later reads continue from the last id seen
+            last = await self.redis.xrevrange(key, count=1)
+            self.last_ids[key] = last[0][0] if last else b"0-0"
+
+    async def _rescan(self, from_start: bool = True) -> None:
+        self.last_scan = time.monotonic()
+        for pattern in self.patterns:
+            async for key in self.redis.scan_iter(match=pattern, _type="stream"):
+                await self._add_stream(_text(key), from_start)
+
+    async def subscribe(self, *channels: str) -> None:
+        for channel in channels:
+            if _is_pattern(channel):
+                self.patterns.add(channel)
+            else:
+                self.channels.add(channel)
+                await self._add_stream(channel)
+        if self.patterns:
+            await self._rescan(from_start=False)
+
+    async def unsubscribe(self, *channels: str) -> None:
+        for channel in channels:
+            self.channels.discard(channel)
+            self.patterns.discard(channel)
+        for key in list(self.last_ids):
+            if key not in self.channels and not any(fnmatch.fnmatchcase(key, p) for p in self.patterns):
+                del self.last_ids[key]
+
+    async def _claim(self) -> None:
+        """Take over entries other consumers left pending, they are then read as our own."""
+        self.last_claim = time.monotonic()
+        for key in list(self.last_ids):
+            claimed = await self.redis.xautoclaim(
+                key, self.group, self.consumer, self.transport.claim_idle_ms,
+                count=self.transport.read_count, justid=True,
+            )
+            if claimed and key in self.last_ids:
+                print(f"[Transport] Claimed {len(claimed)} pending entries of '{key}' for {self.consumer}")
+                self.last_ids[key] = _PENDING
+
+    async def _read(self) -> List:
+        streams = dict(self.last_ids)
+        if not streams:
+            await asyncio.sleep(self.transport.block_ms / 1000)
+            return []
+        if self.group is not None:
+            # Pending reads return at once, block only when every stream is caught up
+            block = self.transport.block_ms if all(i == _NEW for i in streams.values()) else None
+            batches = await self.redis.xreadgroup(
+                self.group, self.consumer, streams, count=self.transport.read_count, block=block,
+            )
+            # Done with the pending entries of a stream once a read returns less than a full batch
+            full = {_text(key) for key, entries in batches or [] if len(entries) >= self.transport.read_count}
+            for key, last in streams.items():
+                if last == _PENDING and key not in full and key in self.last_ids:
+                    self.last_ids[key] = _NEW
+            return batches
+        return await self.redis.xread(streams, count=self.transport.read_count, block=self.transport.block_ms)
+
+    async def __aiter__(self) -> AsyncIterator[Message]:
+        while not self.closed:
+            if self.patterns and time.monotonic() - self.last_scan > _RESCAN_S:
+                await self._rescan()
+            if self.group is not None and time.monotonic() - self.last_claim > _CLAIM_S:
+                await self._claim()
+            batches = await self._read()
+            if not batches:
+                # Never spin without yielding if the server returns before block_ms
+                await asyncio.sleep(0)
+                continue
+            for key, entries in batches:
+                key = _text(key)
+                for entry_id, fields in entries:
+                    if key not in self.last_ids:
+                        break
+                    if self.group is None:
+                        self.last_ids[key] = entry_id
+                    # Pending entries trimmed by MAXLEN come back without fields, they are only acked
+                    if fields and _FIELD in fields:
+                        yield Message(key, fields[_FIELD])
+                if self.group is not None and entries:
+                    await self.redis.xack(key, self.group, *[entry_id for entry_id, _ in entries])
+
+    async def close(self) -> None:
+        self.closed = True
+        self.last_ids.clear()
+
+
+class StreamsTransport(Transport):
+    """
+    Redis Streams, see the module docstring.
+
+    Args:
+        redis_url: Redis server
+        maxlen: Approximate entries kept per stream (bounds memory and replay)
+        read_count: Entries read per XREAD(GROUP) call
+        block_ms: How long a read waits for new entries
+        claim_idle_ms: How long another consumer's entry stays pending before it is claimed
+    """
+    name = "streams"
+
+    def __init__(
+        self,
+        redis_url: str = REDIS_URL,
+        maxlen: int = STREAM_MAXLEN,
+        read_count: int = STREAM_READ_COUNT,
+        block_ms: int = STREAM_BLOCK_MS,
+        claim_idle_ms: int = STREAM_CLAIM_IDLE_MS,
+    ) -> None:
+        self.redis_url = redis_url
+        self.redis = get_redis(redis_url)
+        self.maxlen = maxlen
+        self.read_count = read_count
+        self.block_ms = block_ms
+        self.claim_idle_ms = claim_idle_ms
+
+    async def publish(self, channel: str, data: Payload) -> None:
+        await self.redis.xadd(channel, {_FIELD: data}, maxlen=self.maxlen, approximate=True)
+
+    async def publish_many(self, messages: Iterable[Tuple[str, Payload]]) -> None:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for channel, data in messages:
+                pipe.xadd(channel, {_FIELD: data}, maxlen=self.maxlen, approximate=True)
+            await pipe.execute()
+
+    def connection_stats(self) -> Dict[str, int]:
+        return pool_stats(self.redis_url)
+
+    async def subscribe(
+        self, *channels: str, group: Optional[str] = None, consumer: Optional[str] = None,
+    ) -> Subscription:
+        sub = StreamsSubscription(self, group, consumer)
+        await sub.subscribe(*channels)
+        return sub
+
+    async def close(self) -> None:
+        await self.redis.aclose()
+
+
+class MemorySubscription(Subscription):
+    """Per-subscriber drop-oldest queue, fed directly by MemoryTransport.publish."""
+    def __init__(self, transport: "MemoryTransport", group: Optional[str]) -> None:
+        self.transport = transport
+        self.group = group
+        self.channels: Set[str] = set()
+        self.patterns: Set[str] = set()
+        self.queue: DropOldestQueue = DropOldestQueue(transport.queue_size)
+
+    def matches(self, channel: str) -> bool:
+        return channel in self.channels or any(fnmatch.fnmatchcase(channel, p) for p in self.patterns)
+
+    async def subscribe(self, *channels: str) -> None:
+        for channel in channels:
+            (self.patterns if _is_pattern(channel) else self.channels).add(channel)
+
+    async def unsubscribe(self, *channels: str) -> None:
+        for channel in channels:
+            self.channels.discard(channel)
+            self.patterns.discard(channel)
+
+    async def __aiter__(self) -> AsyncIterator[Message]:
+        while True:
+            message = await self.queue.get()
+            if message is None:
+                return
+            yield message
+
+    async def close(self) -> None:
+        self.transport.subscriptions.discard(self)
+        self.queue.put_drop_oldest(None)
+
+
+class MemoryTransport(Transport):
+    """
+    In-process transport, see the module docstring.
+
+    Like pub/sub, a subscriber that falls more than queue_size messages behind
+    loses the oldest ones. Subscribers sharing a group take turns.
+
+    Args:
+        queue_size: Messages buffered per subscriber
+        mirror: Transport every message is also published to (in the background, batched)
+    """
+    name = "memory"
+
+    def __init__(self, queue_size: int = MEMORY_QUEUE_SIZE, mirror: Optional[Transport] = None) -> None:
+        self.queue_size = queue_size
+        self.subscriptions: Set[MemorySubscription] = set()
+        self.turns: Dict[str, int] = {}
+        self.mirror = mirror
+        self.mirror_publisher = Publisher(mirror, "Mirror", queue_size) if mirror is not None else None
+
+    async def publish(self, channel: str, data: Payload) -> None:
+        groups: Dict[str, List[MemorySubscription]] = {}
+        for sub in self.subscriptions:
+            if not sub.matches(channel):
+                continue
+            if sub.group is None:
+                sub.queue.put_drop_oldest(Message(channel, data))
+            else:
+                groups.setdefault(sub.group, []).append(sub)
+        for group, members in groups.items():
+            turn = self.turns.get(group, 0)
+            self.turns[group] = turn + 1
+            members[turn % len(members)].queue.put_drop_oldest(Message(channel, data))
+
+        if self.mirror_publisher is not None:
+            self.mirror_publisher.submit(channel, data)
+
+    async def subscribe(
+        self, *channels: str, group: Optional[str] = None, consumer: Optional[str] = None,
+    ) -> Subscription:
+        sub = MemorySubscription(self, group)
+        await sub.subscribe(*channels)
+        self.subscriptions.add(sub)
+        return sub
+
+    async def close(self) -> None:
+        for sub in list(self.subscriptions):
+            await sub.close()
+        if self.mirror_publisher is not None:
+            await self.mirror_publisher.close()
+        if self.mirror is not None:
+            await self.mirror.close()
+
+    def connection_stats(self) -> Dict[str, int]:
+        return self.mirror.connection_stats() if self.mirror is not None else {}
+
+
+class PublishStats:
+    """Messages and round-trip latency of one Publisher."""
+    def __init__(self) -> None:
+        self.messages = 0
+        self.batches = 0
+        self.dropped = 0
+        self.errors = 0
+        self.total_s = 0.0
+        self.max_s = 0.0
+
+    def record(self, n: int, seconds: float) -> None:
+        self.messages += n
+        self.batches += 1
+        self.total_s += seconds
+        self.max_s = max(self.max_s, seconds)
+
+    def snapshot(self) -> Dict[str, float]:
+        return {
+            "messages": self.messages,
+            "batches": self.batches,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "avg_ms": 1000 * self.total_s / self.batches if self.batches else 0.0,
+            "max_ms": 1000 * self.max_s,
+        }
+
+
+class Publisher:
+    """
+    A component's publishing side of a (possibly shared) transport.
+
+    publish()/publish_many() await the round trip. submit() queues the message
+    and returns at once; a background task sends everything queued in one
+    publish_many, so a producer that outpaces the server coalesces its backlog
+    into pipelined batches instead of stalling (the oldest messages are dropped
+    past queue_size). close() flushes what is still queued before stopping.
+    Stats are logged every STATS_INTERVAL_S.
+
+    Args:
+        transport: Where messages go
+        name: Component name for logs and stats
+        queue_size: Messages submit() buffers
+        max_batch: Largest coalesced batch
+    """
+    def __init__(
+        self,
+        transport: Transport,
+        name: str,
+        queue_size: int = PUBLISH_QUEUE_SIZE,
+        max_batch: int = PUBLISH_MAX_BATCH,
+    ) -> None:
+        self.transport = transport
+        self.name = name
+        self.max_batch = max(1, max_batch)
+        self.stats = PublishStats()
+        self.queue: DropOldestQueue = DropOldestQueue(queue_size)
+        self.task: Optional[asyncio.Task] = None
+        self.last_log = time.monotonic()
+
+    async def publish(self, channel: str, data: Payload) -> None:
+        start = time.perf_counter()
+        await self.transport.publish(channel, data)
+        self._record(1, time.perf_counter() - start)
+
+    async def publish_many(self, messages: List[Tuple[str, Payload]]) -> None:
+        start = time.perf_counter()
+        await self.transport.publish_many(messages)
+        self._record(len(messages), time.perf_counter() - start)
+
+    def submit(self, channel: str, data: Payload) -> None:
+        """Queue a message for the background sender (call from the event loop)."""
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._send_loop())
+        if self.queue.put_drop_oldest((channel, data)):
+            self.stats.dropped += 1
+
+    async def _send_loop(self) -> None:
+        # Runs until close() queues None behind the last message
+        failing = False
+        closing = False
+        while not closing:
+            item = await self.queue.get()
+            if item is None:
+                return
+            batch = [item]
+            while not self.queue.empty() and len(batch) < self.max_batch:
+                item = self.queue.get_nowait()
+                if item is None:
+                    closing = True
+                    break
+                batch.append(item)
+            try:
+                await self.publish_many(batch)
+                failing = False
+            except Exception as e:
+                self.stats.errors += 1
+                if not failing:
+                    print(f"[{self.name}] Publishing to {self.transport.name} failing, dropping messages: {e}")
+                failing = True
+
+    def _record(self, n: int, seconds: float) -> None:
+        self.stats.record(n, seconds)
+        now = time.monotonic()
+        if now - self.last_log >= STATS_INTERVAL_S:
+            self.last_log = now
+            print(f"[{self.name}] {self.summary()}")
+
+    def summary(self) -> str:
+        s = self.stats.snapshot()
+        line = (f"published {s['messages']} msgs in {s['batches']} batches, "
+                f"avg {s['avg_ms']:.2f} ms, max {s['max_ms']:.2f} ms, dropped {s['dropped']}")
+        conn = self.transport.connection_stats()
+        if conn:
+            line += f", redis connections {conn['in_use']} in use / {conn['created']} open / {conn['max']} max"
+        return line
+
+    async def close(self, timeout_s: float = PUBLISH_CLOSE_TIMEOUT_S) -> None:
+        """Send what submit() still has queued, for at most timeout_s, then stop the sender."""
+        task = self.task
+        if task is None or task.done():
+            return
+        try:
+            await asyncio.wait_for(self._drain(task), timeout_s)
+        except asyncio.TimeoutError:
+            print(f"[{self.name}] Not flushed within {timeout_s} s, {self.queue.qsize()} queued messages dropped")
+        finally:
+            task.cancel()
+
+    async def _drain(self, task: asyncio.Task) -> None:
+        await self.queue.put(None)
+        await task
+
+
+def make_transport(kind: str = TRANSPORT, redis_url: str = REDIS_URL) -> Transport:
+    """Transport backend by name ("pubsub", "streams" or "memory")."""
+    if kind == "pubsub":
+        return PubSubTransport(redis_url)
+    if kind == "streams":
+        return StreamsTransport(redis_url)
+    if kind == "memory":
+        return MemoryTransport(mirror=PubSubTransport(redis_url) if TRANSPORT_MIRROR else None)
+    raise ValueError(f"Unknown transport '{kind}', expected 'pubsub', 'streams' or 'memory'")